@@ -0,0 +1,494 @@
+"""
+In-memory columnar analytics.
+
+With ANALYTICS_ENGINE=1 the app keeps a snapshot of every task as NumPy
+arrays (id, owner_id, status code, due date as days since 1970-01-01) and
+answers the analytics pages from it with vectorized operations instead of
+GROUP BY queries over the whole tasks table. NumPy is only needed when the
+engine is enabled (pip install numpy).
+
+Keeping the snapshot current:
+
+- Task writes committed through SessionLocal in this process are applied
+  before the next analytics read (only the changed rows are re-read).
+- Every ANALYTICS_REFRESH_INTERVAL seconds new rows written by other
+  processes are appended, and every ANALYTICS_FULL_REFRESH_INTERVAL seconds
+  the snapshot is rebuilt to pick up their updates and deletes.
+
+Until the first build finishes the routes fall back to SQL.
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+import os
+import threading
+import time
+from sqlalchemy import String, event, select, type_coerce
+from sqlalchemy.sql import operators, visitors
+import models
+from read_models import MonthlyStatRow, ProductivityRow, WeeklyTrendRow
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "0").lower() in ("1", "true", "yes")
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "30"))  # seconds
+ANALYTICS_FULL_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_FULL_REFRESH_INTERVAL", "600"))  # seconds
+ANALYTICS_LOAD_CHUNK = int(os.getenv("ANALYTICS_LOAD_CHUNK", "100000"))
+
+COMPLETED, IN_PROGRESS, PENDING = "Completed", "In Progress", "Pending"
+DELETED = 255  # status code of a deleted row until the next rebuild
+NO_STATUS = 254  # code looked up for a status no task has
+NO_DUE = -(2 ** 31)  # due date of a task without one
+# Rows appended since the last sort are scanned linearly; re-sort past this share
+RESORT_TAIL_RATIO = 0.05
+IN_CHUNK = 10000  # ids per IN (...) when re-reading changed tasks
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("ANALYTICS_ENGINE=1 requires numpy (pip install numpy)")
+    return numpy
+
+class _Columns:
+    """Column buffers (with spare capacity) and the owner index over them"""
+
+    def __init__(self, np, capacity: int):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.owners = np.zeros(capacity, dtype=np.int64)
+        self.statuses = np.zeros(capacity, dtype=np.uint8)
+        self.dues = np.zeros(capacity, dtype=np.int32)
+        self.n = 0
+        # (order, sorted_owners, sorted_n): rows [0, sorted_n) grouped by owner.
+        # Replaced as a whole so readers never see a half-built index
+        self.owner_index = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0)
+
+    def grown(self, np, capacity: int) -> "_Columns":
+        columns = _Columns(np, capacity)
+        for name in ("ids", "owners", "statuses", "dues"):
+            getattr(columns, name)[:self.n] = getattr(self, name)[:self.n]
+        columns.n = self.n
+        columns.owner_index = self.owner_index
+        return columns
+
+    def sort_by_owner(self, np):
+        n = self.n
+        order = np.argsort(self.owners[:n], kind="stable")
+        self.owner_index = (order, self.owners[:n][order], n)
+
+def _day_of_year(np, days):
+    """0-based day of the year of days since the epoch"""
+    jan1 = days.astype("datetime64[D]").astype("datetime64[Y]").astype("datetime64[D]").astype(np.int64)
+    return days - jan1
+
+class TaskSnapshot:
+    """Columnar copy of the tasks table with vectorized analytics"""
+
+    def __init__(self, engine, chunk_size: int = ANALYTICS_LOAD_CHUNK):
+        self.np = _numpy()
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._columns = _Columns(self.np, 0)
+        self._status_codes: Dict[str, int] = {}
+        self._status_names: List[str] = []
+        self._user_names: Dict[int, str] = {}
+        self._pending: Set[int] = set()
+        self._pending_lock = threading.Lock()
+        self._stale = False
+        # One refresh at a time; readers never take it
+        self._lock = threading.Lock()
+
+    # Loading and refreshing
+
+    def _status_code(self, status: str) -> int:
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self._status_names)
+            self._status_names.append(status)
+        return code
+
+    def _fetch(self, conn, *filters, limit: Optional[int] = None):
+        """(ids, owners, statuses, dues) arrays for the matching tasks, by id"""
+        task = models.Task
+        statement = select(
+            task.id, task.owner_id, task.status,
+            # Skip per-row date objects on SQLite; NumPy parses ISO strings itself
+            type_coerce(task.due_date, String)
+        ).where(*filters).order_by(task.id)
+        if limit:
+            statement = statement.limit(limit)
+        return self._to_arrays(conn.execute(statement).all())
+
+    def _fetch_ids(self, conn, task_ids: List[int]):
+        """Arrays for the given tasks that still exist"""
+        rows = []
+        for start in range(0, len(task_ids), IN_CHUNK):
+            chunk = self._fetch(conn, models.Task.id.in_(task_ids[start:start + IN_CHUNK]))
+            if chunk is not None:
+                rows.append(chunk)
+        if not rows:
+            return None
+        return tuple(self.np.concatenate(arrays) for arrays in zip(*rows))
+
+    def _to_arrays(self, rows):
+        np = self.np
+        if not rows:
+            return None
+        ids, owners, statuses, dues = zip(*rows)
+        dues = np.array(dues, dtype="datetime64[D]")
+        days = dues.astype(np.int64)
+        days[np.isnat(dues)] = NO_DUE
+        return (
+            np.array(ids, dtype=np.int64),
+            np.array([owner or 0 for owner in owners], dtype=np.int64),
+            np.array([self._status_code(status) for status in statuses], dtype=np.uint8),
+            days.astype(np.int32),
+        )
+
+    def _append(self, columns: _Columns, chunk) -> _Columns:
+        np = self.np
+        ids, owners, statuses, dues = chunk
+        needed = columns.n + len(ids)
+        if needed > len(columns.ids):
+            columns = columns.grown(np, max(needed, len(columns.ids) * 3 // 2, 1024))
+        end = columns.n + len(ids)
+        columns.ids[columns.n:end] = ids
+        columns.owners[columns.n:end] = owners
+        columns.statuses[columns.n:end] = statuses
+        columns.dues[columns.n:end] = dues
+        columns.n = end
+        return columns
+
+    def _load_user_names(self, conn, user_ids: Iterable[int]):
+        query = select(models.User.id, models.User.name).where(models.User.id.in_(list(user_ids)))
+        self._user_names.update(conn.execute(query).all())
+
+    def load(self):
+        """Rebuild the snapshot from the database"""
+        started = time.perf_counter()
+        with self._lock:
+            columns = _Columns(self.np, 0)
+            last_id = 0
+            with self.engine.connect() as conn:
+                while True:
+                    chunk = self._fetch(conn, models.Task.id > last_id, limit=self.chunk_size)
+                    if chunk is None:
+                        break
+                    columns = self._append(columns, chunk)
+                    last_id = int(chunk[0][-1])
+                user_names = dict(conn.execute(select(models.User.id, models.User.name)).all())
+            columns.sort_by_owner(self.np)
+            # Changes committed during the load stay pending (re-reading is harmless)
+            self._columns = columns
+            self._user_names = user_names
+            self._stale = False
+            self.loaded = True
+            self.loaded_at = time.time()
+        logger.info("Analytics snapshot: %d tasks loaded in %.1f s", columns.n, time.perf_counter() - started)
+
+    def mark_changed(self, task_ids: Iterable[int]):
+        """Record tasks to re-read before the next query"""
+        with self._pending_lock:
+            self._pending.update(task_ids)
+
+    def mark_stale(self):
+        """Record a write whose rows are unknown; the next full refresh rebuilds"""
+        self._stale = True
+
+    def apply_pending(self, blocking: bool = True):
+        """Re-read the tasks changed in this process since the last refresh"""
+        if not self._pending or not self._lock.acquire(blocking=blocking):
+            return
+        try:
+            with self._pending_lock:
+                changed, self._pending = sorted(self._pending), set()
+            with self.engine.connect() as conn:
+                fetched = self._fetch_ids(conn, changed)
+                if fetched is not None:
+                    unknown = set(fetched[1].tolist()) - self._user_names.keys() - {0}
+                    if unknown:
+                        self._load_user_names(conn, unknown)
+            self._apply(self.np.array(changed, dtype=self.np.int64), fetched)
+        finally:
+            self._lock.release()
+
+    def _apply(self, changed, fetched):
+        np = self.np
+        columns = self._columns
+        ids = columns.ids[:columns.n]
+        found_ids = fetched[0] if fetched is not None else np.zeros(0, dtype=np.int64)
+
+        # Deleted rows become tombstones until the next rebuild
+        gone = np.setdiff1d(changed, found_ids)
+        positions = np.searchsorted(ids, gone)
+        hit = positions < columns.n
+        positions, gone = positions[hit], gone[hit]
+        columns.statuses[positions[ids[positions] == gone]] = DELETED
+        if fetched is None:
+            return
+
+        positions = np.searchsorted(ids, found_ids)
+        existing = np.zeros(len(found_ids), dtype=bool)
+        hit = positions < columns.n
+        existing[hit] = ids[positions[hit]] == found_ids[hit]
+        at = positions[existing]
+        owners, statuses, dues = (array[existing] for array in fetched[1:])
+        sorted_n = columns.owner_index[2]
+        resort = bool(np.any(columns.owners[at[at < sorted_n]] != owners[at < sorted_n]))
+        columns.owners[at] = owners
+        columns.statuses[at] = statuses
+        columns.dues[at] = dues
+
+        new = ~existing
+        if np.any(new):
+            chunk = tuple(array[new] for array in fetched)
+            if columns.n and chunk[0][0] < ids[-1]:
+                # Committed out of id order: rebuild the buffers sorted by id
+                merged = [np.concatenate([getattr(columns, name)[:columns.n], array])
+                          for name, array in zip(("ids", "owners", "statuses", "dues"), chunk)]
+                order = np.argsort(merged[0], kind="stable")
+                columns = self._append(_Columns(np, 0), tuple(array[order] for array in merged))
+                resort = True
+            else:
+                columns = self._append(columns, chunk)
+        if resort or columns.n - columns.owner_index[2] > max(columns.n * RESORT_TAIL_RATIO, 1024):
+            columns.sort_by_owner(np)
+        self._columns = columns
+
+    def refresh(self, full: bool = False):
+        """Apply local changes and append rows other processes added (or rebuild)"""
+        if full or self._stale or not self.loaded:
+            self.load()
+            return
+        self.apply_pending()
+        columns = self._columns
+        last_id = int(columns.ids[columns.n - 1]) if columns.n else 0
+        with self.engine.connect() as conn:
+            new_ids = conn.execute(select(models.Task.id).where(models.Task.id > last_id)).scalars().all()
+        if new_ids:
+            self.mark_changed(new_ids)
+            self.apply_pending()
+
+    # Queries
+
+    def _rows(self, user_id: Optional[int]):
+        """(statuses, dues) of the live rows, optionally of one owner"""
+        np = self.np
+        columns = self._columns
+        n = columns.n
+        if user_id is None:
+            statuses, dues = columns.statuses[:n], columns.dues[:n]
+        else:
+            order, sorted_owners, sorted_n = columns.owner_index
+            lo = np.searchsorted(sorted_owners, user_id, side="left")
+            hi = np.searchsorted(sorted_owners, user_id, side="right")
+            tail = np.flatnonzero(columns.owners[sorted_n:n] == user_id) + sorted_n
+            positions = np.concatenate([order[lo:hi], tail])
+            statuses, dues = columns.statuses[positions], columns.dues[positions]
+        live = statuses != DELETED
+        return statuses[live], dues[live]
+
+    def _code(self, status: str) -> int:
+        return self._status_codes.get(status, NO_STATUS)
+
+    def overview(self, user_id: Optional[int] = None, today: Optional[date] = None) -> dict:
+        """Same result as crud.get_analytics_overview"""
+        np = self.np
+        today = self._days(today or date.today())
+        statuses, dues = self._rows(user_id)
+        counts = np.bincount(statuses, minlength=len(self._status_names) or 1)
+
+        def count(status):
+            code = self._code(status)
+            return int(counts[code]) if code < len(counts) else 0
+
+        total = len(statuses)
+        completed = count(COMPLETED)
+        open_ = statuses != self._code(COMPLETED)
+        overdue = np.count_nonzero(open_ & (dues != NO_DUE) & (dues < today))
+        upcoming = np.count_nonzero(open_ & (dues >= today) & (dues <= today + 7))
+        return {
+            "total": total,
+            "completed": completed,
+            "pending": count(PENDING),
+            "in_progress": count(IN_PROGRESS),
+            "overdue": int(overdue),
+            "upcoming": int(upcoming),
+            "completion_rate": round(completed / total * 100 if total > 0 else 0, 1),
+        }
+
+    def _week_numbers(self, days):
+        """Week numbers of days since the epoch, as EXTRACT(WEEK) gives them on this database"""
+        np = self.np
+        weekday = (days + 3) % 7  # Monday = 0; 1970-01-01 was a Thursday
+        if self.engine.dialect.name == "sqlite":
+            # strftime('%W'): weeks start on Monday and the days before the
+            # year's first Monday are week 0
+            return (_day_of_year(np, days) + 7 - weekday) // 7
+        # ISO week (PostgreSQL): a week belongs to the year of its Thursday, so
+        # early January can be week 52 or 53 and late December week 1
+        return _day_of_year(np, days - weekday + 3) // 7 + 1
+
+    def weekly_trends(self, user_id: Optional[int] = None, today: Optional[date] = None) -> List[WeeklyTrendRow]:
+        """Tasks due since eight weeks ago per week and status, like crud.get_weekly_trends"""
+        np = self.np
+        since = self._days((today or date.today()) - timedelta(weeks=8))
+        statuses, dues = self._rows(user_id)
+        recent = dues >= since
+        days, statuses = dues[recent].astype(np.int64), statuses[recent]
+        # Calendar year, like EXTRACT(YEAR) on every database
+        years = days.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64)
+        weeks = self._week_numbers(days)
+        keys, counts = np.unique(((years + 1970) * 100 + weeks) * 256 + statuses, return_counts=True)
+        return [
+            WeeklyTrendRow(int(key // 256 % 100), int(key // 25600), self._status_names[key % 256], int(count))
+            for key, count in zip(keys.tolist(), counts.tolist())
+        ]
+
+    def monthly_stats(self, user_id: Optional[int] = None, today: Optional[date] = None) -> List[MonthlyStatRow]:
+        """Tasks due in the last 180 days per month and status"""
+        np = self.np
+        since = self._days((today or date.today()) - timedelta(days=180))
+        statuses, dues = self._rows(user_id)
+        recent = dues >= since
+        months = dues[recent].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        keys, counts = np.unique(months * 256 + statuses[recent], return_counts=True)
+        return [
+            MonthlyStatRow(int(key // 256 % 12 + 1), int(key // 256 // 12 + 1970), self._status_names[key % 256], int(count))
+            for key, count in zip(keys.tolist(), counts.tolist())
+        ]
+
+    def user_productivity(self, user_id: Optional[int] = None) -> List[ProductivityRow]:
+        """Task counts per owner's name, like crud.get_user_productivity"""
+        np = self.np
+        if user_id is not None:
+            statuses, _ = self._rows(user_id)
+            if not len(statuses) or user_id not in self._user_names:
+                return []
+            owners = np.full(len(statuses), user_id, dtype=np.int64)
+        else:
+            columns = self._columns
+            live = columns.statuses[:columns.n] != DELETED
+            owners, statuses = columns.owners[:columns.n][live], columns.statuses[:columns.n][live]
+            owned = owners != 0
+            owners, statuses = owners[owned], statuses[owned]
+        if not len(owners):
+            return []
+        unique_owners, owner_index = np.unique(owners, return_inverse=True)
+        per_status = {
+            status: np.bincount(owner_index, weights=statuses == self._code(status), minlength=len(unique_owners))
+            for status in (COMPLETED, IN_PROGRESS, PENDING)
+        }
+        totals = np.bincount(owner_index, minlength=len(unique_owners))
+        # Grouped by name, as the SQL version does
+        by_name: Dict[str, List[int]] = {}
+        for i, owner in enumerate(unique_owners.tolist()):
+            name = self._user_names.get(owner)
+            if name is None:
+                continue
+            row = by_name.setdefault(name, [0, 0, 0, 0])
+            row[0] += int(totals[i])
+            row[1] += int(per_status[COMPLETED][i])
+            row[2] += int(per_status[IN_PROGRESS][i])
+            row[3] += int(per_status[PENDING][i])
+        return [ProductivityRow(name, *counts) for name, counts in sorted(by_name.items())]
+
+    def _days(self, day: date) -> int:
+        return (day - date(1970, 1, 1)).days
+
+    def stats(self) -> dict:
+        columns = self._columns
+        return {
+            "tasks": int(columns.n),
+            "bytes": int(sum(getattr(columns, name).nbytes for name in ("ids", "owners", "statuses", "dues"))),
+            "loaded_at": self.loaded_at,
+            "pending": len(self._pending),
+        }
+
+def _task_ids_in(whereclause) -> Optional[Set[int]]:
+    """Task ids an UPDATE/DELETE's WHERE clause pins with tasks.id = value, if any"""
+    if whereclause is None:
+        return None
+    for node in visitors.iterate(whereclause):
+        if getattr(node, "operator", None) is operators.eq and getattr(node, "left", None) is not None:
+            column = getattr(node.left, "key", None)
+            table = getattr(node.left, "table", None)
+            value = getattr(node.right, "value", None)
+            if column == "id" and table is models.Task.__table__ and isinstance(value, int):
+                return {value}
+    return None
+
+def track_task_writes(session_factory, snapshot: TaskSnapshot):
+    """Tell snapshot about tasks committed through session_factory"""
+
+    @event.listens_for(session_factory, "after_flush")
+    def collect(session, flush_context):
+        changed = session.info.setdefault("analytics_task_ids", set())
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(instance, models.Task) and instance.id is not None:
+                changed.add(instance.id)
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def collect_statement(orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None or mapper.class_ is not models.Task:
+            return
+        task_ids = _task_ids_in(orm_execute_state.statement.whereclause)
+        if task_ids is None:
+            snapshot.mark_stale()
+        else:
+            orm_execute_state.session.info.setdefault("analytics_task_ids", set()).update(task_ids)
+
+    @event.listens_for(session_factory, "after_commit")
+    def publish(session):
+        changed = session.info.pop("analytics_task_ids", None)
+        if changed:
+            snapshot.mark_changed(changed)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def discard(session):
+        session.info.pop("analytics_task_ids", None)
+
+snapshot: Optional[TaskSnapshot] = None
+
+def setup(engine, session_factory) -> Optional[TaskSnapshot]:
+    """Create the shared snapshot and start tracking writes (when enabled)"""
+    global snapshot
+    if ANALYTICS_ENGINE and snapshot is None:
+        snapshot = TaskSnapshot(engine)
+        track_task_writes(session_factory, snapshot)
+    return snapshot
+
+def get_snapshot() -> Optional[TaskSnapshot]:
+    """The up-to-date snapshot, or None when disabled or still loading"""
+    if snapshot is None or not snapshot.loaded:
+        return None
+    # Serve slightly stale results rather than wait behind a rebuild
+    snapshot.apply_pending(blocking=False)
+    return snapshot
+
+async def run_periodic_refresh(interval: float = ANALYTICS_REFRESH_INTERVAL,
+                               full_interval: float = ANALYTICS_FULL_REFRESH_INTERVAL):
+    """Background loop: build the snapshot, then keep it in sync"""
+    import pool_control
+
+    def refresh(full: bool):
+        # Low priority: when the pool is busy this round is skipped
+        with pool_control.gate.slot("low"):
+            snapshot.refresh(full)
+
+    last_full = 0.0
+    while True:
+        full = time.monotonic() - last_full >= full_interval
+        try:
+            await asyncio.to_thread(refresh, full)
+            if full:
+                last_full = time.monotonic()
+        except Exception:
+            logger.exception("Analytics snapshot refresh failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,89 @@
+"""
+Content-hashed static asset URLs.
+
+Templates link assets through asset_url("js/offline.js"), which returns
+/static/js/offline.<hash>.js where <hash> is taken from the file's contents.
+HashedStaticFiles serves those URLs with a one-year immutable Cache-Control,
+so browsers and the service worker never revalidate them; a changed file gets
+a new URL. Unhashed URLs, and hashed ones from an older deploy (answered with
+the current file), are served with no-cache, i.e. revalidated every time.
+"""
+from typing import Dict, Optional, Tuple
+import hashlib
+import os
+import re
+import stat
+import anyio
+from starlette.staticfiles import StaticFiles
+
+STATIC_DIR = "static"
+STATIC_URL = "/static"
+HASH_LENGTH = 12
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$" % HASH_LENGTH)
+# file path -> (mtime, size, hash); recomputed when the file changes
+_hashes: Dict[str, Tuple[float, int, str]] = {}
+
+def file_hash(full_path: str, stat_result: Optional[os.stat_result] = None) -> str:
+    """Short hash of a file's contents, read in chunks"""
+    if stat_result is None:
+        stat_result = os.stat(full_path)
+    cached = _hashes.get(full_path)
+    if cached and cached[:2] == (stat_result.st_mtime, stat_result.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(full_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    short = digest.hexdigest()[:HASH_LENGTH]
+    _hashes[full_path] = (stat_result.st_mtime, stat_result.st_size, short)
+    return short
+
+def content_hash(path: str, directory: str = STATIC_DIR) -> str:
+    """Short hash of a static file's contents"""
+    return file_hash(os.path.join(directory, path))
+
+def hashed_path(path: str, directory: str = STATIC_DIR) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{content_hash(path, directory)}{ext}"
+
+def asset_url(path: str) -> str:
+    """URL of a static file that changes whenever its contents do"""
+    return f"{STATIC_URL}/{hashed_path(path)}"
+
+def manifest(directory: str = STATIC_DIR) -> Dict[str, str]:
+    """Every static file (except the service worker) and its hashed URL"""
+    urls = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+            if path != "sw.js":
+                urls[path] = f"{STATIC_URL}/{hashed_path(path, directory)}"
+    return dict(sorted(urls.items()))
+
+def version(directory: str = STATIC_DIR) -> str:
+    """Hash over all asset hashes; changes whenever any asset does"""
+    return hashlib.sha256("\n".join(manifest(directory).values()).encode()).hexdigest()[:HASH_LENGTH]
+
+class HashedStaticFiles(StaticFiles):
+    """StaticFiles that also serves name.<hash>.ext as immutable"""
+
+    async def get_response(self, path: str, scope):
+        match = _HASHED_NAME.match(path)
+        if match and scope["method"] in ("GET", "HEAD"):
+            # lookup_path keeps the file inside the static directory
+            try:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, match["stem"] + match["ext"])
+            except (OSError, ValueError):
+                stat_result = None
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                current = await anyio.to_thread.run_sync(file_hash, full_path, stat_result)
+                response = self.file_response(full_path, stat_result, scope)
+                response.headers["Cache-Control"] = IMMUTABLE if current == match["hash"] else REVALIDATE
+                return response
+        response = await super().get_response(path, scope)
+        response.headers.setdefault("Cache-Control", REVALIDATE)
+        return response
@@ -1,12 +1,11 @@
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from sqlalchemy.orm import Session
+from sqlalchemy import select, bindparam
 import models
-from database import SessionLocal
+from dependencies import get_db
 import os
 
 # Configuration
@@ -14,31 +13,36 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-# Password hashing with explicit bcrypt configuration
-try:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
-except Exception as e:
-    # Fallback configuration if bcrypt version detection fails
-    pwd_context = CryptContext(
-        schemes=["bcrypt"], 
-        deprecated="auto",
-        bcrypt__rounds=12,
-        bcrypt__ident="2b"
-    )
+# passlib and jose are imported on first use: they add ~60 ms to every
+# import of the app, including workers, tests and CLI tools
+_pwd_context = None
+
+def get_pwd_context():
+    """Password hashing with explicit bcrypt configuration (created on first use)"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        try:
+            _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=12)
+        except Exception as e:
+            # Fallback configuration if bcrypt version detection fails
+            _pwd_context = CryptContext(
+                schemes=["bcrypt"],
+                deprecated="auto",
+                bcrypt__rounds=12,
+                bcrypt__ident="2b"
+            )
+    return _pwd_context
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-def get_db():
-    """Get database session"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Looked up on every request, so built once and only bound per call
+_USER_BY_EMAIL = select(models.User).where(models.User.email == bindparam("email"))
 
 def hash_password(password: str) -> str:
     """Hash a password with error handling"""
     try:
-        return pwd_context.hash(password)
+        return get_pwd_context().hash(password)
     except Exception as e:
         # Fallback to direct bcrypt if passlib fails
         import bcrypt
@@ -48,7 +52,7 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash with error handling"""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
     except Exception as e:
         # Fallback to direct bcrypt if passlib fails
         import bcrypt
@@ -59,6 +63,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -71,6 +77,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def decode_access_token(token: str):
     """Decode JWT access token"""
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
@@ -90,8 +98,7 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
     if email is None:
         return None
     
-    user = db.query(models.User).filter(models.User.email == email).first()
-    return user
+    return db.execute(_USER_BY_EMAIL, {"email": email}).scalars().first()
 
 def require_auth(request: Request, db: Session = Depends(get_db)):
     """Require authentication - redirect to login if not authenticated"""
@@ -0,0 +1 @@
+"""Performance benchmarks for the Task Management System (run with python -m benchmarks.<name>)"""
@@ -0,0 +1,93 @@
+"""
+SQL analytics vs the in-memory columnar snapshot (analytics_engine).
+
+For each --tasks size a SQLite file (or --database-url) is seeded with
+benchmarks.datagen. The benchmark times the organization-wide and per-user
+analytics both ways, plus what the snapshot costs: the full build, its
+memory, and an incremental refresh of --changed rows. Needs numpy.
+
+    python -m benchmarks.analytics --tasks 1000000 10000000
+"""
+from typing import Callable, List, Optional
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+def best_ms(func: Callable, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+def run(engine, user_id: int, repeat: int, changed: int):
+    from sqlalchemy import update
+    from sqlalchemy.orm import Session
+    import analytics_engine
+    import crud
+    import models
+
+    snapshot = analytics_engine.TaskSnapshot(engine)
+    started = time.perf_counter()
+    snapshot.load()
+    stats = snapshot.stats()
+    print(f"  snapshot build {time.perf_counter() - started:.1f} s, "
+          f"{stats['bytes'] / 2 ** 20:.0f} MB for {stats['tasks']} tasks")
+
+    session = Session(bind=engine)
+    try:
+        cases = {
+            "overview": (crud.get_analytics_overview, snapshot.overview),
+            "weekly trends": (crud.get_weekly_trends, snapshot.weekly_trends),
+            "monthly stats": (crud.get_monthly_stats, snapshot.monthly_stats),
+            "user productivity": (crud.get_user_productivity, snapshot.user_productivity),
+        }
+        print(f"  {'':22} {'SQL all':>10} {'numpy all':>10} {'SQL user':>10} {'numpy user':>10}")
+        for name, (sql, vectorized) in cases.items():
+            timings = [
+                best_ms(lambda: sql(session), repeat),
+                best_ms(lambda: vectorized(), repeat),
+                best_ms(lambda: sql(session, user_id), repeat),
+                best_ms(lambda: vectorized(user_id), repeat),
+            ]
+            print(f"  {name:22} " + " ".join(f"{ms:>8.2f}ms" for ms in timings))
+
+        # Incremental refresh after a burst of writes
+        ids = [row[0] for row in session.query(models.Task.id).limit(changed)]
+        session.execute(update(models.Task).where(models.Task.id.in_(ids)).values(status="Completed"))
+        session.commit()
+        snapshot.mark_changed(ids)
+        started = time.perf_counter()
+        snapshot.apply_pending()
+        print(f"  incremental refresh of {len(ids)} changed tasks: {(time.perf_counter() - started) * 1000:.1f} ms")
+    finally:
+        session.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to use (default: a temporary SQLite file per size)")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1000000], help="Dataset sizes (1M to 10M)")
+    parser.add_argument("--users", type=int, default=1000, help="Users the tasks are spread across")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing rounds (best is reported)")
+    parser.add_argument("--changed", type=int, default=1000, help="Tasks changed for the incremental refresh")
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+    from benchmarks import datagen
+
+    for tasks in args.tasks:
+        url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='analytics-bench-'), 'bench.db')}"
+        engine = create_engine(url)
+        print(f"{tasks} tasks, {args.users} users ({url})")
+        started = time.perf_counter()
+        seeded = datagen.generate(engine, users=args.users, tasks=tasks, notifications=0, share_rate=0.0)
+        print(f"  seeded in {time.perf_counter() - started:.1f} s")
+        run(engine, seeded["first_user_id"], args.repeat, args.changed)
+        engine.dispose()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
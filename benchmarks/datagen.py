@@ -0,0 +1,329 @@
+"""
+Synthetic dataset generator for scale testing.
+
+Bulk-loads users, tasks, task shares and notifications with realistic
+distributions straight into the database, bypassing the ORM and the web
+routes:
+
+- task ownership is skewed (a few users own most tasks), controlled by --owner-skew
+- statuses are weighted (45% Completed, 35% Pending, 20% In Progress)
+- due dates depend on status: completed tasks are mostly in the past, open
+  ones cluster around today, and 10% have no due date
+- --share-rate of the tasks are shared with 1..--max-shares other users
+- notifications are skewed like ownership, 70% of them read, with created_at
+  increasing with id like real traffic
+
+The output is fully determined by --seed (and the rows already present).
+Rows are streamed in chunks: SQLite gets executemany() on one connection with
+journaling off, PostgreSQL gets COPY (psycopg2 or psycopg 3). When the tables
+start empty, secondary indexes are dropped during the load and rebuilt
+afterwards, which is much faster than maintaining them row by row.
+
+    python -m benchmarks.datagen --database-url sqlite:///big.db \\
+        --users 100000 --tasks 10000000 --notifications 5000000
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import io
+import random
+import sys
+import time
+
+DEFAULT_PASSWORD = "password123"
+CHUNK_SIZE = 100000
+
+# 100-slot lookup tables are much cheaper than random.choices() per row
+STATUS_TABLE = ["Completed"] * 45 + ["Pending"] * 35 + ["In Progress"] * 20
+# Mean and spread (days from today) of the due date for each status
+DUE_DATE_SHAPE = {"Completed": (-30, 40), "Pending": (10, 30), "In Progress": (3, 14)}
+NO_DUE_DATE_RATE = 0.10
+READ_NOTIFICATION_RATE = 0.70
+NOTIFICATION_SPAN = timedelta(days=180)
+
+VERBS = ("Write", "Review", "Deploy", "Fix", "Plan", "Test", "Refactor", "Document", "Prepare", "Update")
+NOUNS = ("report", "invoice", "release", "meeting notes", "budget", "login page",
+         "API docs", "roadmap", "onboarding", "dashboard", "backup", "newsletter")
+NOTIFICATION_TEMPLATES = (
+    "Task '{title}' has been shared with you",
+    "Task '{title}' status changed from 'Pending' to 'In Progress'",
+    "Task '{title}' status changed from 'In Progress' to 'Completed'",
+)
+
+def _skewed_index(rng: random.Random, n: int, skew: float) -> int:
+    """Index in [0, n) where low indexes are picked more often (skew 1 is uniform)"""
+    return int(n * rng.random() ** skew)
+
+def _next_id(conn, table) -> int:
+    from sqlalchemy import func, select
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+def user_rows(first_id: int, count: int, password_hash: str) -> Iterator[tuple]:
+    for user_id in range(first_id, first_id + count):
+        yield (user_id, f"User {user_id}", f"user{user_id}@example.test", password_hash)
+
+def task_and_share_rows(
+    rng: random.Random,
+    first_id: int,
+    count: int,
+    user_ids: Sequence[int],
+    owner_skew: float,
+    share_rate: float,
+    max_shares: int
+) -> Iterator[Tuple[tuple, List[tuple]]]:
+    """Yield (task row, share rows) pairs"""
+    today = date.today()
+    due_dates = {offset: (today + timedelta(days=offset)).isoformat() for offset in range(-400, 401)}
+    n_users = len(user_ids)
+    for task_id in range(first_id, first_id + count):
+        status = STATUS_TABLE[int(rng.random() * 100)]
+        if rng.random() < NO_DUE_DATE_RATE:
+            due_date = None
+        else:
+            mean, spread = DUE_DATE_SHAPE[status]
+            due_date = due_dates[max(-400, min(400, int(rng.gauss(mean, spread))))]
+        owner_id = user_ids[_skewed_index(rng, n_users, owner_skew)]
+        title = f"{VERBS[int(rng.random() * len(VERBS))]} {NOUNS[int(rng.random() * len(NOUNS))]} #{task_id}"
+        task = (task_id, title, f"Generated task {task_id}", status, due_date, owner_id)
+
+        shares = []
+        if n_users > 1 and rng.random() < share_rate:
+            shared_with = set()
+            for _ in range(rng.randint(1, max_shares)):
+                user_id = user_ids[int(rng.random() * n_users)]
+                if user_id != owner_id:
+                    shared_with.add(user_id)
+            shares = [(task_id, user_id) for user_id in sorted(shared_with)]
+        yield task, shares
+
+def notification_rows(
+    rng: random.Random,
+    first_id: int,
+    count: int,
+    user_ids: Sequence[int],
+    owner_skew: float
+) -> Iterator[tuple]:
+    n_users = len(user_ids)
+    start = datetime.now() - NOTIFICATION_SPAN
+    step = NOTIFICATION_SPAN / max(count, 1)
+    for i in range(count):
+        user_id = user_ids[_skewed_index(rng, n_users, owner_skew)]
+        message = NOTIFICATION_TEMPLATES[int(rng.random() * len(NOTIFICATION_TEMPLATES))].format(
+            title=f"{NOUNS[int(rng.random() * len(NOUNS))]} #{int(rng.random() * 1000000)}"
+        )
+        created_at = (start + step * i).isoformat(" ")
+        yield (first_id + i, user_id, message, created_at, rng.random() < READ_NOTIFICATION_RATE)
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class BulkWriter:
+    """Writes row tuples to tables through the fastest path the driver offers"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.driver = engine.dialect.driver
+        self.raw = engine.raw_connection()
+        if self.dialect == "sqlite":
+            cursor = self.raw.cursor()
+            # Safe for a throwaway load: a crash just means regenerating
+            cursor.execute("PRAGMA journal_mode = OFF")
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA cache_size = -262144")  # 256 MB
+            cursor.close()
+
+    def write(self, table: str, columns: Sequence[str], rows: List[tuple]):
+        cursor = self.raw.cursor()
+        try:
+            if self.dialect == "postgresql" and self.driver in ("psycopg2", "psycopg"):
+                self._copy(cursor, table, columns, rows)
+            else:
+                marker = "%s" if self.engine.dialect.paramstyle in ("format", "pyformat") else "?"
+                placeholders = ", ".join([marker] * len(columns))
+                cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+            self.raw.commit()
+        finally:
+            cursor.close()
+
+    def _copy(self, cursor, table: str, columns: Sequence[str], rows: List[tuple]):
+        statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+        if self.driver == "psycopg":
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return
+
+        def field(value):
+            if value is None:
+                return "\\N"
+            if isinstance(value, bool):
+                return "t" if value else "f"
+            return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(field(value) for value in row))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+
+    def close(self):
+        self.raw.close()
+
+def _secondary_indexes(tables) -> list:
+    return [index for table in tables for index in table.indexes]
+
+def generate(
+    engine,
+    users: int = 1000,
+    tasks: int = 100000,
+    notifications: int = 50000,
+    share_rate: float = 0.1,
+    max_shares: int = 3,
+    owner_skew: float = 2.0,
+    seed: int = 42,
+    chunk_size: int = CHUNK_SIZE,
+    defer_indexes: Optional[bool] = None,
+    password: str = DEFAULT_PASSWORD,
+    progress: bool = False
+) -> Dict[str, object]:
+    """Generate the dataset and return row counts and the id of the first (busiest) user"""
+    from sqlalchemy import text
+    from database import Base
+    import auth
+    import models
+
+    rng = random.Random(seed)
+    Base.metadata.create_all(bind=engine)
+    tables = [models.User.__table__, models.Task.__table__, models.task_shares, models.Notification.__table__]
+
+    with engine.connect() as conn:
+        first_user_id = _next_id(conn, models.User.__table__)
+        first_task_id = _next_id(conn, models.Task.__table__)
+        first_notification_id = _next_id(conn, models.Notification.__table__)
+    empty = first_user_id == first_task_id == first_notification_id == 1
+    if defer_indexes is None:
+        defer_indexes = empty
+
+    started = time.perf_counter()
+    counts = {"users": 0, "tasks": 0, "task_shares": 0, "notifications": 0}
+
+    def report(kind: str):
+        if progress:
+            elapsed = time.perf_counter() - started
+            total = sum(counts.values())
+            print(f"  {kind:14} {counts[kind]:>12,} rows  ({total / elapsed:,.0f} rows/s overall)", file=sys.stderr)
+
+    if defer_indexes:
+        for index in _secondary_indexes(tables):
+            index.drop(bind=engine, checkfirst=True)
+
+    writer = BulkWriter(engine)
+    try:
+        # One hash for everyone: bcrypt per row would dominate the run
+        password_hash = auth.hash_password(password)
+        for chunk in _chunks(user_rows(first_user_id, users, password_hash), chunk_size):
+            writer.write("users", ("id", "name", "email", "password"), chunk)
+            counts["users"] += len(chunk)
+            report("users")
+
+        user_ids = list(range(first_user_id, first_user_id + users))
+        if user_ids:
+            rows = task_and_share_rows(rng, first_task_id, tasks, user_ids, owner_skew, share_rate, max_shares)
+            for chunk in _chunks(rows, chunk_size):
+                writer.write("tasks", ("id", "title", "description", "status", "due_date", "owner_id"),
+                             [task for task, _ in chunk])
+                shares = [share for _, task_shares in chunk for share in task_shares]
+                if shares:
+                    writer.write("task_shares", ("task_id", "user_id"), shares)
+                counts["tasks"] += len(chunk)
+                counts["task_shares"] += len(shares)
+                report("tasks")
+
+            rows = notification_rows(rng, first_notification_id, notifications, user_ids, owner_skew)
+            for chunk in _chunks(rows, chunk_size):
+                writer.write("notifications", ("id", "user_id", "message", "created_at", "read"), chunk)
+                counts["notifications"] += len(chunk)
+                report("notifications")
+    finally:
+        writer.close()
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # Explicit ids were inserted, so move the sequences past them
+            for table in ("users", "tasks", "notifications"):
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 1) FROM {table}))"
+                ))
+        # Unread counters are derived data: rebuild them in one pass
+        conn.execute(models.NotificationCounter.__table__.delete())
+        conn.execute(text(
+            "INSERT INTO notification_counters (user_id, unread_count) "
+            "SELECT user_id, count(*) FROM notifications WHERE read = :unread GROUP BY user_id"
+        ), {"unread": False})
+
+    if defer_indexes:
+        index_started = time.perf_counter()
+        for index in _secondary_indexes(tables):
+            index.create(bind=engine, checkfirst=True)
+        if progress:
+            print(f"  indexes rebuilt in {time.perf_counter() - index_started:.1f} s", file=sys.stderr)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+    counts["seconds"] = round(time.perf_counter() - started, 1)
+    counts["first_user_id"] = first_user_id
+    return counts
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="Target database (created if missing)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--notifications", type=int, default=50000)
+    parser.add_argument("--share-rate", type=float, default=0.1, help="Fraction of tasks that are shared")
+    parser.add_argument("--max-shares", type=int, default=3, help="Most users a task is shared with")
+    parser.add_argument("--owner-skew", type=float, default=2.0, help="1 = uniform, higher = a few heavy users")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per transaction")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="Password of every generated user")
+    indexes = parser.add_mutually_exclusive_group()
+    indexes.add_argument("--defer-indexes", dest="defer_indexes", action="store_true", default=None,
+                         help="Drop secondary indexes during the load (default when the tables are empty)")
+    indexes.add_argument("--keep-indexes", dest="defer_indexes", action="store_false")
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+
+    engine = create_engine(args.database_url)
+    print(f"Generating into {args.database_url} (seed {args.seed}) ...", file=sys.stderr)
+    counts = generate(
+        engine,
+        users=args.users,
+        tasks=args.tasks,
+        notifications=args.notifications,
+        share_rate=args.share_rate,
+        max_shares=args.max_shares,
+        owner_skew=args.owner_skew,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        defer_indexes=args.defer_indexes,
+        password=args.password,
+        progress=True
+    )
+    engine.dispose()
+    for key, value in counts.items():
+        print(f"{key}: {value}")
+    return counts
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+HTTP load-testing benchmark suite.
+
+Seeds a throwaway SQLite database, then drives realistic scenarios with
+concurrent httpx clients and reports p50/p95/p99 latency and requests per
+second. Results are saved as JSON so runs can be compared across commits.
+
+    # In-process (httpx ASGI transport, no network; WebSocket scenario skipped)
+    python -m benchmarks.load
+
+    # Against a uvicorn server launched on a temporary database
+    python -m benchmarks.load --launch --workers 1
+
+    # Against an already running server seeded with the same data
+    python -m benchmarks.load --url http://localhost:8000 --no-seed
+
+    # Compare with an earlier run
+    python -m benchmarks.load --compare benchmarks/results/load-<commit>.json
+
+Scenarios: login_storm, index_10k, search, analytics, bulk_api_writes,
+ws_fanout (needs --launch or --url).
+"""
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BENCH_PASSWORD = "benchmark-password"
+HEAVY_USER_EMAIL = "heavy@bench.local"
+STATUSES = ("Pending", "In Progress", "Completed")
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """Latency percentiles (ms) and throughput for one scenario"""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+def seed_database(database_url: str, tasks: int, users: int, seed: int = 42) -> Dict[str, int]:
+    """Bulk-insert benchmark users and tasks, returning ids needed by scenarios"""
+    from sqlalchemy import create_engine
+    from database import Base
+    import auth
+    import models
+
+    rng = random.Random(seed)
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    password = auth.hash_password(BENCH_PASSWORD)  # hashing once keeps seeding fast
+    today = date.today()
+
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"name": "Heavy User", "email": HEAVY_USER_EMAIL, "password": password}
+        ] + [
+            {"name": f"Bench User {i}", "email": f"user{i}@bench.local", "password": password}
+            for i in range(users)
+        ])
+        heavy_id = conn.execute(
+            models.User.__table__.select().where(models.User.email == HEAVY_USER_EMAIL)
+        ).first().id
+        conn.execute(models.Task.__table__.insert(), [
+            {
+                "title": f"Task {i} {rng.choice(['report', 'review', 'deploy', 'meeting', 'invoice'])}",
+                "description": f"Benchmark task number {i}",
+                "status": rng.choice(STATUSES),
+                "due_date": today + timedelta(days=rng.randint(-60, 60)),
+                "owner_id": heavy_id,
+            }
+            for i in range(tasks)
+        ])
+        fanout_task_id = conn.execute(models.Task.__table__.insert().values(
+            title="Fan-out task", status="Pending", owner_id=heavy_id
+        )).inserted_primary_key[0]
+        user_ids = [row.id for row in conn.execute(
+            models.User.__table__.select().where(models.User.id != heavy_id)
+        )]
+        conn.execute(models.task_shares.insert(), [
+            {"task_id": fanout_task_id, "user_id": user_id} for user_id in user_ids
+        ])
+    engine.dispose()
+    return {"heavy_user_id": heavy_id, "fanout_task_id": fanout_task_id, "user_ids": user_ids}
+
+async def run_load(make_request: Callable, total: int, concurrency: int) -> dict:
+    """Issue total requests with at most concurrency in flight"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                ok = await make_request(i)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+async def scenario_login_storm(client, ctx, args) -> dict:
+    async def login(i):
+        email = f"user{i % max(args.users, 1)}@bench.local"
+        response = await client.post("/login", data={"email": email, "password": BENCH_PASSWORD}, follow_redirects=False)
+        return response.status_code == 303
+    return await run_load(login, args.login_requests, args.concurrency)
+
+async def scenario_index_10k(client, ctx, args) -> dict:
+    async def index(i):
+        response = await client.get("/", cookies=ctx["cookies"])
+        return response.status_code == 200
+    return await run_load(index, args.requests, args.concurrency)
+
+async def scenario_search(client, ctx, args) -> dict:
+    terms = ["report", "review", "deploy", "Task 12", "nothing-matches"]
+    async def search(i):
+        response = await client.get("/", params={"q": terms[i % len(terms)], "status": STATUSES[i % 3]}, cookies=ctx["cookies"])
+        return response.status_code == 200
+    return await run_load(search, args.requests, args.concurrency)
+
+async def scenario_analytics(client, ctx, args) -> dict:
+    async def analytics(i):
+        response = await client.get("/analytics", cookies=ctx["cookies"])
+        return response.status_code == 200
+    return await run_load(analytics, args.requests, args.concurrency)
+
+async def scenario_bulk_api_writes(client, ctx, args) -> dict:
+    async def write(i):
+        response = await client.post("/api/tasks", json={"title": f"Bulk task {i}", "status": STATUSES[i % 3]})
+        return response.status_code == 200
+    return await run_load(write, args.requests, args.concurrency)
+
+async def scenario_ws_fanout(client, ctx, args) -> Optional[dict]:
+    """Connect many WebSocket clients, change a shared task once, time delivery to each"""
+    if not ctx.get("base_url") or not ctx.get("fanout_task_id"):
+        return None
+    import websockets
+
+    ws_base = ctx["base_url"].replace("http", "ws", 1)
+    user_ids = ctx["user_ids"][:args.ws_clients]
+    connections = []
+    for user_id in user_ids:
+        ws = await websockets.connect(f"{ws_base}/ws/{user_id}", open_timeout=30)
+        await ws.recv()  # welcome
+        connections.append(ws)
+
+    delivered: List[float] = []
+
+    async def wait_for_notification(ws):
+        while True:
+            message = json.loads(await ws.recv())
+            if message.get("type") == "notification":
+                delivered.append(time.perf_counter())
+                return
+
+    waiters = [asyncio.create_task(wait_for_notification(ws)) for ws in connections]
+    started = time.perf_counter()
+    await client.post(
+        f"/tasks/{ctx['fanout_task_id']}/edit",
+        data={"title": "Fan-out task", "status": random.choice(["In Progress", "Completed"])},
+        cookies=ctx["cookies"], follow_redirects=False
+    )
+    done, pending = await asyncio.wait(waiters, timeout=args.ws_timeout)
+    for task in pending:
+        task.cancel()
+    for ws in connections:
+        await ws.close()
+    return summarize([t - started for t in delivered], len(pending), time.perf_counter() - started)
+
+SCENARIOS = {
+    "login_storm": scenario_login_storm,
+    "index_10k": scenario_index_10k,
+    "search": scenario_search,
+    "analytics": scenario_analytics,
+    "bulk_api_writes": scenario_bulk_api_writes,
+    "ws_fanout": scenario_ws_fanout,
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def launch_server(database_url: str, workers: int) -> Tuple[subprocess.Popen, str]:
+    """Start uvicorn on a free port and wait until it answers"""
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=root, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api").status_code == 200:
+                return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+async def run_scenarios(client, ctx, args) -> Dict[str, dict]:
+    results = {}
+    for name in args.scenarios:
+        result = await SCENARIOS[name](client, ctx, args)
+        if result is None:
+            print(f"{name:16} skipped (needs --launch or --url, and seeded data)")
+            continue
+        results[name] = result
+        print(f"{name:16} {result['rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  "
+              f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}")
+    return results
+
+def compare(results: Dict[str, dict], baseline_path: str):
+    """Print the change against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nCompared with {baseline_path}:")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        def delta(key):
+            return f"{(result[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+        print(f"{name:16} rps {delta('rps'):>8}  p95 {delta('p95_ms'):>8}  p99 {delta('p99_ms'):>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--url", help="Benchmark an already running server")
+    parser.add_argument("--launch", action="store_true", help="Launch uvicorn on a temporary database")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --launch")
+    parser.add_argument("--database-url", help="Database to seed (default: temporary SQLite file)")
+    parser.add_argument("--no-seed", action="store_true", help="Use the existing data as is")
+    parser.add_argument("--tasks", type=int, default=10000, help="Tasks owned by the heavy user")
+    parser.add_argument("--users", type=int, default=1000, help="Other users (WebSocket clients, logins)")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=100, help="Requests in the login storm")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="Where to save JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if not args.url:
+        # The app reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = database_url
+
+    ctx = {"user_ids": [], "fanout_task_id": None}
+    if not args.no_seed:
+        print(f"Seeding {args.tasks} tasks and {args.users} users into {database_url} ...")
+        ctx.update(seed_database(database_url, args.tasks, args.users))
+
+    import httpx
+    import auth
+    ctx["cookies"] = {"access_token": auth.create_access_token({"sub": HEAVY_USER_EMAIL})}
+
+    process = None
+    if args.launch:
+        process, ctx["base_url"] = launch_server(database_url, args.workers)
+    elif args.url:
+        ctx["base_url"] = args.url.rstrip("/")
+
+    async def run():
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        if ctx.get("base_url"):
+            client = httpx.AsyncClient(base_url=ctx["base_url"], limits=limits, timeout=120)
+        else:
+            from main import app
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+        async with client:
+            return await run_scenarios(client, ctx, args)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": "url" if args.url else "launch" if args.launch else "in-process",
+        "params": {key: getattr(args, key) for key in ("tasks", "users", "requests", "login_requests", "concurrency", "ws_clients", "workers")},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{report['commit']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
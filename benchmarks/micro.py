@@ -0,0 +1,228 @@
+"""
+Micro-benchmarks for the hot crud and auth functions.
+
+Each function is timed in isolation against a seeded database, and the SQL
+it issues is captured together with its query plan (EXPLAIN QUERY PLAN on
+SQLite, EXPLAIN on PostgreSQL). Results can be saved as a baseline, and later
+runs fail (exit status 1) when a function got slower than the baseline by
+more than --threshold, so the harness can gate CI.
+
+    # Seed 100k tasks into a temporary SQLite file and record a baseline
+    python -m benchmarks.micro --tasks 100000 --save-baseline
+
+    # Later: compare against it, failing on a >25% slowdown
+    python -m benchmarks.micro --tasks 100000 --threshold 0.25
+
+    # PostgreSQL (rows are generated by benchmarks.datagen; pass --no-seed to reuse them)
+    python -m benchmarks.micro --database-url postgresql://localhost/bench --tasks 1000000
+
+Baselines live in benchmarks/baselines/micro-<dialect>-<tasks>.json by default.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+BENCH_PASSWORD = "benchmark-password"
+
+# SQLite picks an arbitrary covering index for full scans such as count(*)
+_FULL_COVERING_SCAN = re.compile(r"^(SCAN \w+ USING COVERING INDEX) \w+$")
+
+def seed_database(engine, tasks: int, users: int, seed: int = 42) -> int:
+    """Generate users and tasks, returning the id of the busiest user"""
+    from benchmarks import datagen
+
+    counts = datagen.generate(engine, users=users, tasks=tasks, notifications=0, share_rate=0.0,
+                              seed=seed, password=BENCH_PASSWORD)
+    return counts["first_user_id"]
+
+def capture_statements(engine, func: Callable) -> List[Tuple[str, object]]:
+    """Run func once and return the SQL statements (with parameters) it issued"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+def explain(engine, statement: str, parameters) -> List[str]:
+    """Query plan of one statement as a list of lines"""
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in rows]
+        rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        return [row[0] for row in rows]
+
+def time_call(func: Callable, repeat: int) -> Dict[str, float]:
+    """Per-call timings in milliseconds (median and best of repeat rounds)"""
+    func()  # warm caches and compiled statement caches
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    rounds = [total / number * 1000 for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "median_ms": round(statistics.median(rounds), 4),
+        "best_ms": round(min(rounds), 4),
+        "calls_per_round": number,
+    }
+
+def build_cases(session, user_id: int) -> Dict[str, Callable]:
+    """The functions under test, bound to their arguments"""
+    import auth
+    import crud
+
+    password_hash = auth.hash_password(BENCH_PASSWORD)
+    token = auth.create_access_token({"sub": "user0@bench.local"})
+    return {
+        "crud.get_analytics_overview[user]": lambda: crud.get_analytics_overview(session, user_id),
+        "crud.get_analytics_overview[all]": lambda: crud.get_analytics_overview(session),
+        "crud.get_weekly_trends[user]": lambda: crud.get_weekly_trends(session, user_id),
+        "crud.get_monthly_stats[user]": lambda: crud.get_monthly_stats(session, user_id),
+        "crud.get_user_productivity[user]": lambda: crud.get_user_productivity(session, user_id),
+        "crud.get_user_productivity[all]": lambda: crud.get_user_productivity(session),
+        "auth.verify_password": lambda: auth.verify_password(BENCH_PASSWORD, password_hash),
+        "auth.decode_access_token": lambda: auth.decode_access_token(token),
+    }
+
+def run_benchmarks(engine, user_id: int, repeat: int, only: Optional[List[str]] = None) -> Dict[str, dict]:
+    from sqlalchemy.orm import Session
+
+    session = Session(bind=engine)
+    results = {}
+    try:
+        for name, func in build_cases(session, user_id).items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            statements = capture_statements(engine, func)
+            result = time_call(func, repeat)
+            result["queries"] = len(statements)
+            result["plans"] = [
+                {"sql": " ".join(statement.split()), "plan": explain(engine, statement, parameters)}
+                for statement, parameters in statements
+            ]
+            results[name] = result
+            print(f"{name:38} median {result['median_ms']:>10.4f} ms  best {result['best_ms']:>10.4f} ms  "
+                  f"queries {result['queries']}")
+    finally:
+        session.close()
+    return results
+
+def find_regressions(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float,
+                     min_delta_ms: float = 0.05) -> List[str]:
+    """Describe every function whose median slowed down by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        old_ms, new_ms = old["median_ms"], result["median_ms"]
+        # Ignore sub-noise differences on very fast functions
+        if new_ms > old_ms * (1 + threshold) and new_ms - old_ms > min_delta_ms:
+            regressions.append(f"{name}: {old_ms} ms -> {new_ms} ms ({(new_ms - old_ms) / old_ms * 100:+.1f}%)")
+    return regressions
+
+def _plan_shape(plans: List[dict]) -> List[List[str]]:
+    """Plans with incidental details (which covering index a full scan uses) removed"""
+    return [[_FULL_COVERING_SCAN.sub(r"\1", line) for line in p["plan"]] for p in plans]
+
+def find_plan_changes(results: Dict[str, dict], baseline: Dict[str, dict]) -> List[str]:
+    """Functions whose query plans differ from the baseline"""
+    changes = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old and _plan_shape(old.get("plans", [])) != _plan_shape(result["plans"]):
+            changes.append(name)
+    return changes
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to benchmark (default: temporary SQLite file)")
+    parser.add_argument("--no-seed", action="store_true", help="Use the existing data as is")
+    parser.add_argument("--tasks", type=int, default=10000, help="Tasks to seed (1k to 10M)")
+    parser.add_argument("--users", type=int, default=100, help="Users the tasks are spread across")
+    parser.add_argument("--user-id", type=int, help="User for the per-user cases (default: first seeded user)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing rounds per function")
+    parser.add_argument("--only", nargs="+", help="Only run functions whose name contains one of these")
+    parser.add_argument("--baseline", help="Baseline file (default: benchmarks/baselines/micro-<dialect>-<tasks>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--fail-on-plan-change", action="store_true", help="Also fail when a query plan changed")
+    parser.add_argument("--output", help="Also save the full results to this JSON file")
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+
+    workdir = tempfile.mkdtemp(prefix="micro-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    engine = create_engine(database_url)
+
+    user_id = args.user_id
+    if not args.no_seed:
+        print(f"Seeding {args.tasks} tasks for {args.users} users into {database_url} ...")
+        started = time.perf_counter()
+        seeded_user_id = seed_database(engine, args.tasks, args.users)
+        user_id = user_id or seeded_user_id
+        print(f"Seeded in {time.perf_counter() - started:.1f} s")
+    user_id = user_id or 1
+
+    results = run_benchmarks(engine, user_id, args.repeat, args.only)
+    engine.dispose()
+
+    report = {
+        "dialect": engine.dialect.name,
+        "params": {"tasks": args.tasks, "users": args.users, "repeat": args.repeat},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"micro-{engine.dialect.name}-{args.tasks}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path) or ".", exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"\nNo baseline at {baseline_path} (run with --save-baseline to create one)")
+        return 0
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    failed = False
+    plan_changes = find_plan_changes(results, baseline)
+    for name in plan_changes:
+        print(f"Query plan changed: {name}")
+    if plan_changes and args.fail_on_plan_change:
+        failed = True
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions over {args.threshold * 100:.0f}% compared with {baseline_path}:")
+        for line in regressions:
+            print(f"  {line}")
+        failed = True
+    else:
+        print(f"\nNo regressions over {args.threshold * 100:.0f}% compared with {baseline_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
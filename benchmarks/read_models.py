@@ -0,0 +1,98 @@
+"""
+ORM objects vs read_models records for the task list.
+
+Seeds one user with --tasks tasks, then loads that user's list both as full
+ORM Task objects (what read_root used to do) and as read_models.TaskRow
+records (crud.get_user_tasks), and reports for each:
+
+- load time
+- memory retained per row (tracemalloc, including the session's identity map)
+- time to render templates/index.html with the list
+
+    python -m benchmarks.read_models --tasks 10000 20000 50000
+"""
+from typing import Callable, List, Optional
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+def measure(load: Callable, render: Callable, repeat: int) -> dict:
+    """Best load and render times (ms) and retained bytes per row"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = load()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    load_times, render_times = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = load()
+        load_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        render(rows)
+        render_times.append(time.perf_counter() - started)
+    return {
+        "rows": len(rows),
+        "load_ms": min(load_times) * 1000,
+        "render_ms": min(render_times) * 1000,
+        "bytes_per_row": retained / max(len(rows), 1),
+    }
+
+def run(engine, user_id: int, repeat: int) -> dict:
+    from jinja2 import Environment, FileSystemLoader
+    from sqlalchemy.orm import Session
+    import crud
+    import models
+
+    template = Environment(loader=FileSystemLoader(TEMPLATE_DIR)).get_template("index.html")
+    session = Session(bind=engine)
+    current_user = session.get(models.User, user_id)
+
+    def render(tasks):
+        return template.render(tasks=tasks, q=None, status=None, current_user=current_user)
+
+    def load_orm():
+        # A fresh identity map each time, as in a request
+        session.expunge_all()
+        session.add(current_user)
+        return session.query(models.Task).filter(models.Task.owner_id == user_id).all()
+
+    try:
+        results = {
+            "orm": measure(load_orm, render, repeat),
+            "rows": measure(lambda: crud.get_user_tasks(session, user_id), render, repeat),
+        }
+    finally:
+        session.close()
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10000, 50000], help="List sizes to measure")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing rounds (best is reported)")
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+    from benchmarks import datagen
+
+    print(f"{'tasks':>8} {'model':>5} {'load':>10} {'render':>10} {'bytes/row':>10}")
+    for tasks in args.tasks:
+        path = os.path.join(tempfile.mkdtemp(prefix="read-models-bench-"), "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        seeded = datagen.generate(engine, users=1, tasks=tasks, notifications=0, share_rate=0.0)
+        for model, result in run(engine, seeded["first_user_id"], args.repeat).items():
+            print(f"{tasks:>8} {model:>5} {result['load_ms']:>8.1f}ms {result['render_ms']:>8.1f}ms "
+                  f"{result['bytes_per_row']:>10.0f}")
+        engine.dispose()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Process start to first served request.
+
+Each run is a fresh Python process against a migrated SQLite file (or
+--database-url) and reports:
+
+- import: `import main`
+- startup: the lifespan startup (schema check, background jobs)
+- first request: GET /api
+- first user request: GET /notifications/unread-count as a logged-in user
+  (first JWT decode and user lookup)
+
+The medians over --runs are printed; --importtime lists the slowest
+top-level imports of main.
+
+    python -m benchmarks.startup --runs 10 --importtime 15
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STEPS = ["import", "startup", "first request", "first user request"]
+
+def child(email: str):
+    """Runs in the measured process; prints the step timings as JSON"""
+    from fastapi.testclient import TestClient
+
+    timings = {}
+    started = time.perf_counter()
+    import main
+    timings["import"] = time.perf_counter() - started
+
+    import auth
+    step = time.perf_counter()
+    with TestClient(main.app) as client:
+        timings["startup"] = time.perf_counter() - step
+        step = time.perf_counter()
+        assert client.get("/api").status_code == 200
+        timings["first request"] = time.perf_counter() - step
+        client.cookies.set("access_token", auth.create_access_token({"sub": email}))
+        step = time.perf_counter()
+        assert client.get("/notifications/unread-count").status_code == 200
+        timings["first user request"] = time.perf_counter() - step
+    print(json.dumps({name: seconds * 1000 for name, seconds in timings.items()}))
+
+def prepare(database_url: str) -> str:
+    """Migrate the database and make sure it has a user to log in as"""
+    from database import create_database_engine
+    from sqlalchemy.orm import Session
+    import migrate
+    import models
+
+    engine = create_database_engine(database_url)
+    migrate.upgrade(engine)
+    with Session(bind=engine) as db:
+        user = db.query(models.User).first()
+        if user is None:
+            user = models.User(name="Startup Bench", email="startup-bench@example.com", password="x")
+            db.add(user)
+            db.commit()
+        email = user.email
+    engine.dispose()
+    return email
+
+def measure(database_url: str, email: str) -> Dict[str, float]:
+    env = dict(os.environ, DATABASE_URL=database_url)
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", email],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def top_level_imports(code: str, env: Dict[str, str]) -> Dict[str, float]:
+    """Milliseconds (cumulative) per top-level module imported while running code"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            env=env, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Top-level imports have a single level of indentation
+        if cumulative.strip().isdigit() and not name.startswith("    "):
+            modules[name.strip()] = int(cumulative) / 1000
+    return modules
+
+def slowest_imports(database_url: str, count: int) -> List[str]:
+    """Modules imported by main, slowest first (interpreter startup excluded)"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    interpreter = top_level_imports("pass", env)
+    modules = {name: ms for name, ms in top_level_imports("import main", env).items() if name not in interpreter}
+    rows = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:count]
+    return [f"{ms:8.1f} ms  {name}" for name, ms in rows]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to use (default: a temporary SQLite file)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to time (median is reported)")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="Also list the N slowest imports")
+    parser.add_argument("--child", metavar="EMAIL", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child)
+        return 0
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='startup-bench-'), 'bench.db')}"
+    email = prepare(database_url)
+    runs = [measure(database_url, email) for _ in range(args.runs)]
+    print(f"{args.runs} runs ({database_url}), median:")
+    for step in STEPS:
+        print(f"  {step:18} {statistics.median(run[step] for run in runs):8.1f} ms")
+    total = statistics.median(sum(run.values()) for run in runs)
+    print(f"  {'total':18} {total:8.1f} ms")
+    if args.importtime:
+        print("Slowest imports:")
+        for line in slowest_imports(database_url, args.importtime):
+            print(f"  {line}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
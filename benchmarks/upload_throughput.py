@@ -0,0 +1,83 @@
+"""
+Concurrent attachment upload benchmark.
+
+Compares the old inline copy (blocking open() + shutil.copyfileobj on the
+event loop) with storage.store_upload, reporting aggregate throughput and the
+worst event-loop stall seen by a ticker coroutine while uploads run.
+
+    python -m benchmarks.upload_throughput --uploads 16 --size-mb 8
+"""
+from fastapi import UploadFile
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import storage
+
+async def _loop_monitor(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Measure the largest delay between expected and actual wake-ups"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+async def _blocking_save(upload: UploadFile, filename: str, directory: str, max_size: int):
+    """The previous implementation, kept here as the baseline"""
+    with open(os.path.join(directory, filename), "wb") as buffer:
+        shutil.copyfileobj(upload.file, buffer)
+
+async def _streaming_save(upload: UploadFile, filename: str, directory: str, max_size: int):
+    await storage.store_upload(upload, storage.LocalStorage(directory), max_size)
+
+async def _run(save, sources, directory: str) -> dict:
+    uploads = [UploadFile(file=open(path, "rb"), filename=os.path.basename(path)) for path in sources]
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_loop_monitor(stop))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            save(upload, f"{i}_{upload.filename}", directory, storage.MAX_UPLOAD_SIZE * 1000)
+            for i, upload in enumerate(uploads)
+        ))
+    finally:
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for upload in uploads:
+            upload.file.close()
+    worst_stall = await monitor
+
+    total_bytes = sum(os.path.getsize(path) for path in sources)
+    return {
+        "seconds": round(elapsed, 3),
+        "throughput_mb_s": round(total_bytes / (1024 * 1024) / elapsed, 1),
+        "max_loop_stall_ms": round(worst_stall * 1000, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=16, help="Concurrent uploads")
+    parser.add_argument("--size-mb", type=int, default=8, help="Size of each upload in MB")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="upload-bench-")
+    try:
+        sources = []
+        for i in range(args.uploads):
+            path = os.path.join(workdir, f"source_{i}.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.size_mb * 1024 * 1024))
+            sources.append(path)
+
+        for name, save in (("blocking copyfileobj", _blocking_save), ("streaming store_upload", _streaming_save)):
+            target = tempfile.mkdtemp(dir=workdir)
+            result = asyncio.run(_run(save, sources, target))
+            print(f"{name:24} {result}")
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Shared test setup.
+
+The app's engine is created when database.py is imported, so DATABASE_URL
+points at a throwaway SQLite file before any test module imports it; the
+repository's tasks.db is never opened.
+"""
+import os
+import shutil
+import tempfile
+import pytest
+
+_test_dir = tempfile.mkdtemp(prefix="task-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_test_dir, 'tasks.db')}"
+
+@pytest.fixture(scope="session", autouse=True)
+def app_database():
+    """Create the schema in the test database, and remove it afterwards"""
+    import database
+    import migrate
+
+    migrate.upgrade(database.engine)
+    yield database.engine
+    database.dispose_engines()
+    shutil.rmtree(_test_dir, ignore_errors=True)
@@ -1,16 +1,47 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-import models, schemas
+from sqlalchemy import func, extract, or_, insert, update, delete, select, bindparam
+import database
+import models, schemas, storage
+from read_models import SharedTaskRow, ShareResult, TaskRow, UpdatedTask, UserRef
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Iterable, List, Optional, Set, Tuple
 
 def get_tasks(db: Session) -> List[models.Task]:
     """Retrieve all tasks from the database"""
     return db.query(models.Task).all()
 
+# Hot reads use statements built once at import with bound parameters: each
+# call only binds values and hits the engine's compiled cache, instead of
+# rebuilding and cache-keying a Query every time.
+_TASK_BY_ID = select(models.Task).where(models.Task.id == bindparam("task_id"))
+
+# List pages select only the columns of read_models.TaskRow
+_TASK_ROW_COLUMNS = (models.Task.id, models.Task.title, models.Task.description, models.Task.status, models.Task.due_date)
+
+def _user_tasks_statement(search: bool, by_status: bool):
+    statement = select(*_TASK_ROW_COLUMNS).where(models.Task.owner_id == bindparam("user_id"))
+    if search:
+        statement = statement.where(
+            or_(
+                models.Task.title.contains(bindparam("q")),
+                models.Task.description.contains(bindparam("q"))
+            )
+        )
+    if by_status:
+        statement = statement.where(models.Task.status == bindparam("status"))
+    return statement
+
+_USER_TASKS = {
+    (search, by_status): _user_tasks_statement(search, by_status)
+    for search in (False, True) for by_status in (False, True)
+}
+_RECENT_TASKS = select(*_TASK_ROW_COLUMNS).where(
+    models.Task.owner_id == bindparam("user_id")
+).order_by(models.Task.id.desc()).limit(bindparam("limit"))
+
 def get_task(db: Session, task_id: int) -> Optional[models.Task]:
     """Retrieve a specific task by ID"""
-    return db.query(models.Task).filter(models.Task.id == task_id).first()
+    return db.execute(_TASK_BY_ID, {"task_id": task_id}).scalars().first()
 
 def create_task(db: Session, task: schemas.TaskCreate) -> models.Task:
     """Create a new task in the database"""
@@ -32,14 +63,291 @@ def update_task(db: Session, task_id: int, task: schemas.TaskUpdate) -> Optional
         db.refresh(db_task)
     return db_task
 
+def update_owned_task(db: Session, task_id: int, owner_id: int, task: schemas.TaskUpdate) -> Optional[UpdatedTask]:
+    """Update a task owned by owner_id; returns it with its previous status, or None"""
+    # Read the old status in the same transaction, locking the row where the
+    # database supports it, so it is the status this update replaced
+    previous_status = db.execute(
+        select(models.Task.status)
+        .where(models.Task.id == task_id, models.Task.owner_id == owner_id)
+        .with_for_update()
+    ).scalar()
+    if previous_status is None:
+        db.rollback()
+        return None
+    statement = (
+        update(models.Task)
+        .where(models.Task.id == task_id, models.Task.owner_id == owner_id)
+        .values(**task.model_dump(exclude_unset=True))
+        .execution_options(synchronize_session=False)
+    )
+    columns = (models.Task.id, models.Task.title, models.Task.status)
+    if db.get_bind().dialect.update_returning:
+        row = db.execute(statement.returning(*columns)).first()
+    else:
+        # No RETURNING (e.g. MySQL): read the row back in the same transaction
+        updated = db.execute(statement).rowcount
+        row = db.query(*columns).filter(models.Task.id == task_id).first() if updated else None
+    db.commit()
+    return UpdatedTask(*row, previous_status) if row else None
+
+def get_shared_user_ids(db: Session, task_id: int) -> List[int]:
+    """IDs of the users a task is shared with"""
+    return [user_id for user_id, in db.query(models.task_shares.c.user_id).filter(
+        models.task_shares.c.task_id == task_id
+    )]
+
+def _insert_shares(db: Session):
+    """INSERT into task_shares that skips pairs a concurrent request added first"""
+    dialect_insert = database.dialect_insert(db)
+    if dialect_insert is None:
+        return insert(models.task_shares)
+    return dialect_insert(models.task_shares).on_conflict_do_nothing()
+
+def _add_shares(db: Session, pairs: List[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    """Insert (task_id, user_id) share pairs, returning the ones this call added"""
+    statement = _insert_shares(db)
+    rows = [{"task_id": task_id, "user_id": user_id} for task_id, user_id in pairs]
+    if database.dialect_insert(db) is None:
+        # Plain INSERT: a concurrent duplicate fails the whole statement instead
+        db.execute(statement, rows)
+        return set(pairs)
+    if db.get_bind().dialect.insert_executemany_returning:
+        returning = statement.returning(models.task_shares.c.task_id, models.task_shares.c.user_id)
+        return set(db.execute(returning, rows).tuples().all())
+    # No RETURNING (e.g. SQLite before 3.35): a skipped pair matches no row
+    return {pair for pair, row in zip(pairs, rows) if db.execute(statement, row).rowcount}
+
+def share_tasks(db: Session, owner_id: int, task_ids: Iterable[int], emails: Iterable[str]) -> ShareResult:
+    """Share the owner's tasks with the users behind emails: one query per step, one bulk insert"""
+    task_ids = list(dict.fromkeys(task_ids))
+    emails = list(dict.fromkeys(email.strip() for email in emails if email.strip()))
+    titles = dict(db.execute(select(models.Task.id, models.Task.title).where(
+        models.Task.id.in_(task_ids), models.Task.owner_id == owner_id
+    )).all()) if task_ids else {}
+    found = db.execute(select(models.User.id, models.User.name, models.User.email).where(
+        models.User.email.in_(emails)
+    )).all() if emails else []
+    users = {user_id: UserRef(name, email) for user_id, name, email in found if user_id != owner_id}
+    known = {email for _, _, email in found}
+
+    already_shared, shared = [], []
+    if titles and users:
+        existing = set(db.execute(select(models.task_shares.c.task_id, models.task_shares.c.user_id).where(
+            models.task_shares.c.task_id.in_(titles), models.task_shares.c.user_id.in_(users)
+        )).all())
+        for task_id in titles:
+            for user_id in users:
+                (already_shared if (task_id, user_id) in existing else shared).append((task_id, user_id))
+    if shared:
+        inserted = _add_shares(db, shared)
+        db.commit()
+        # Pairs a concurrent request added since the read above are not reported (or notified) twice
+        already_shared += [pair for pair in shared if pair not in inserted]
+        shared = [pair for pair in shared if pair in inserted]
+    return ShareResult(
+        shared=shared,
+        already_shared=already_shared,
+        unknown_emails=[email for email in emails if email not in known],
+        not_owned=[task_id for task_id in task_ids if task_id not in titles],
+        own_email=any(user_id == owner_id for user_id, _, _ in found),
+        titles=titles,
+        users=users,
+    )
+
+def _delete_task(db: Session, db_task: models.Task) -> Optional[str]:
+    """Delete a task, returning the digest of a blob it orphaned (caller commits, then deletes the blob)"""
+    digest = db_task.attachment_ref.digest if db_task.attachment_ref else None
+    db.delete(db_task)
+    return digest if digest and release_blob(db, digest) else None
+
 def delete_task(db: Session, task_id: int) -> Optional[models.Task]:
     """Delete a task from the database"""
     db_task = db.query(models.Task).filter(models.Task.id == task_id).first()
     if db_task:
-        db.delete(db_task)
+        orphaned = _delete_task(db, db_task)
         db.commit()
+        if orphaned:
+            collect_blob(db, orphaned)
     return db_task
 
+def apply_task_batch(db: Session, owner_id: int, operations: List[schemas.TaskBatchOperation]) -> List[dict]:
+    """Apply queued task mutations in order, in one transaction, to tasks owned by owner_id"""
+    results, orphaned = [], []
+    for operation in operations:
+        data = operation.task.model_dump(exclude_unset=True) if operation.task else {}
+        if operation.op == "create":
+            db_task = models.Task(**schemas.TaskCreate(**data).model_dump())
+            db_task.owner_id = owner_id
+            db.add(db_task)
+            db.flush()
+        else:
+            db_task = db.get(models.Task, operation.task_id) if operation.task_id is not None else None
+            if db_task is None or db_task.owner_id != owner_id:
+                # Someone else's task is reported like a missing one
+                results.append({"op": operation.op, "task_id": operation.task_id, "status": "not_found"})
+                continue
+            if operation.op == "update":
+                for key, value in data.items():
+                    setattr(db_task, key, value)
+            else:
+                digest = _delete_task(db, db_task)
+                if digest:
+                    orphaned.append(digest)
+                # Later operations in the batch must not see the deleted task
+                db.flush()
+        results.append({"op": operation.op, "task_id": db_task.id, "status": "ok"})
+    db.commit()
+    for digest in orphaned:
+        collect_blob(db, digest)
+    return results
+
+def claim_blob(db: Session, digest: str) -> bool:
+    """Take a reference on a stored blob if it has a row, and commit it.
+
+    Used to decide whether an upload can skip the put: once the reference is
+    committed, collect_blob can no longer delete the file.
+    """
+    statement = (
+        update(models.AttachmentBlob)
+        .where(models.AttachmentBlob.digest == digest)
+        .values(ref_count=models.AttachmentBlob.ref_count + 1)
+    )
+    if db.get_bind().dialect.update_returning:
+        claimed = db.execute(statement.returning(models.AttachmentBlob.digest)).first() is not None
+    else:
+        # No RETURNING (e.g. SQLite before 3.35): the matched row count says the same
+        claimed = db.execute(statement).rowcount > 0
+    db.commit()
+    return claimed
+
+def attach_blob(
+    db: Session,
+    task: models.Task,
+    blob: storage.StoredBlob,
+    filename: str,
+    content_type: Optional[str] = None
+) -> models.TaskAttachment:
+    """Point a task at a stored blob and take a reference on it (caller commits)"""
+    if not blob.deduplicated:
+        # A deduplicated blob was already referenced by claim_blob
+        dialect_insert = database.dialect_insert(db)
+        if dialect_insert is not None:
+            # Another upload of the same new content may have inserted the row first
+            db.execute(dialect_insert(models.AttachmentBlob).values(
+                digest=blob.digest, size=blob.size, ref_count=1
+            ).on_conflict_do_update(
+                index_elements=[models.AttachmentBlob.digest],
+                set_={"ref_count": models.AttachmentBlob.ref_count + 1}
+            ))
+        elif not db.query(models.AttachmentBlob).filter(models.AttachmentBlob.digest == blob.digest).update(
+            {models.AttachmentBlob.ref_count: models.AttachmentBlob.ref_count + 1}, synchronize_session=False
+        ):
+            db.add(models.AttachmentBlob(digest=blob.digest, size=blob.size, ref_count=1))
+            # Make the new row visible to later attaches in this transaction
+            db.flush()
+
+    attachment = models.TaskAttachment(digest=blob.digest, filename=filename, content_type=content_type)
+    task.attachment_ref = attachment
+    task.attachment = filename
+    return attachment
+
+def release_blob(db: Session, digest: str) -> bool:
+    """Drop one reference to a blob, returning True if it became unreferenced (caller commits)"""
+    statement = (
+        update(models.AttachmentBlob)
+        .where(models.AttachmentBlob.digest == digest)
+        .values(ref_count=models.AttachmentBlob.ref_count - 1)
+    )
+    if db.get_bind().dialect.update_returning:
+        remaining = db.execute(statement.returning(models.AttachmentBlob.ref_count)).scalar()
+    else:
+        # No RETURNING: read the count back in the same transaction
+        updated = db.execute(statement).rowcount
+        remaining = db.query(models.AttachmentBlob.ref_count).filter(
+            models.AttachmentBlob.digest == digest
+        ).scalar() if updated else None
+    return remaining is not None and remaining <= 0
+
+def collect_blob(db: Session, digest: str) -> bool:
+    """Delete a blob's row and file if nothing references it at this moment.
+
+    The file is deleted before the row deletion commits, while the row is
+    locked, so a concurrent claim_blob either keeps the blob alive or finds
+    no row and stores the file again.
+    """
+    statement = delete(models.AttachmentBlob).where(
+        models.AttachmentBlob.digest == digest, models.AttachmentBlob.ref_count <= 0
+    )
+    if db.get_bind().dialect.delete_returning:
+        deleted = db.execute(statement.returning(models.AttachmentBlob.digest)).first() is not None
+    else:
+        # No RETURNING: the deleted row count says the same
+        deleted = db.execute(statement).rowcount > 0
+    if not deleted:
+        db.rollback()
+        return False
+    try:
+        storage.delete_blob(digest)
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+    return True
+
+def is_task_shared_with(db: Session, task_id: int, user_id: int) -> bool:
+    """Check whether a task is shared with a user without loading the share list"""
+    return db.query(
+        db.query(models.task_shares).filter(
+            models.task_shares.c.task_id == task_id,
+            models.task_shares.c.user_id == user_id
+        ).exists()
+    ).scalar()
+
+def get_user_tasks(db: Session, user_id: int, q: Optional[str] = None, status: Optional[str] = None) -> List[TaskRow]:
+    """Retrieve a user's own tasks, optionally searched and filtered by status"""
+    params = {"user_id": user_id}
+    if q:
+        params["q"] = q
+    if status:
+        params["status"] = status
+    return list(map(TaskRow._make, db.execute(_USER_TASKS[bool(q), bool(status)], params)))
+
+def get_recent_tasks(db: Session, user_id: int, limit: int = 5) -> List[TaskRow]:
+    """Retrieve a user's most recently created tasks"""
+    return list(map(TaskRow._make, db.execute(_RECENT_TASKS, {"user_id": user_id, "limit": limit})))
+
+def get_tasks_shared_by(db: Session, user_id: int) -> List[SharedTaskRow]:
+    """Retrieve tasks a user owns and has shared with someone, with who they are shared with"""
+    shared_with = {}
+    for task_id, name, email in db.query(
+        models.task_shares.c.task_id, models.User.name, models.User.email
+    ).join(
+        models.Task, models.Task.id == models.task_shares.c.task_id
+    ).join(
+        models.User, models.User.id == models.task_shares.c.user_id
+    ).filter(models.Task.owner_id == user_id):
+        shared_with.setdefault(task_id, []).append(UserRef(name, email))
+
+    # A share added between the two queries must not raise KeyError
+    rows = db.query(*_TASK_ROW_COLUMNS).filter(
+        models.Task.owner_id == user_id,
+        models.Task.shared_with.any()
+    )
+    return [SharedTaskRow(*row, shared_with=tuple(shared_with.get(row.id, ()))) for row in rows]
+
+def get_tasks_shared_with(db: Session, user_id: int) -> List[SharedTaskRow]:
+    """Retrieve tasks shared with a user, with their owners"""
+    rows = db.query(*_TASK_ROW_COLUMNS, models.User.name, models.User.email).join(
+        models.task_shares, models.task_shares.c.task_id == models.Task.id
+    ).outerjoin(
+        models.User, models.User.id == models.Task.owner_id
+    ).filter(models.task_shares.c.user_id == user_id)
+    return [
+        SharedTaskRow(*row[:5], owner=UserRef(row.name, row.email) if row.name is not None else None)
+        for row in rows
+    ]
+
 def get_tasks_by_status(db: Session, status: str) -> List[models.Task]:
     """Retrieve tasks filtered by status"""
     return db.query(models.Task).filter(models.Task.status == status).all()
@@ -1,35 +1,312 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Mapping, Optional
+import itertools
+import logging
 import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 # Get database URL from environment variable with fallback to SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./tasks.db")
 
-# Create SQLAlchemy engine with proper configuration
-if DATABASE_URL.startswith("sqlite"):
+# Read replicas (comma-separated URLs). Read-only routes round-robin across
+# them; a user's reads go to the primary for REPLICA_STICKY_SECONDS after
+# they write, so they always see their own changes despite replication lag
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))  # how long a failed replica is skipped
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# Connection pool for server databases. DB_POOL_TIMEOUT is only the backstop:
+# requests are admitted with much shorter budgets by pool_control.PoolGate
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # seconds
+# Compiled SQL cache per engine (SQLAlchemy's default of 500 entries is shared
+# with every ad-hoc ORM query, which can evict the statements crud and
+# notifications pre-build at import for their hot reads)
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
+
+# SQLite tuning. SQLITE_PROFILE=production applies the pragmas below on every
+# new connection: WAL lets readers run alongside the single writer, and
+# synchronous=NORMAL only fsyncs at checkpoints (safe in WAL mode)
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", str(-64 * 1024)))  # negative = KiB
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "10"))
+# Take an in-process lock (and BEGIN IMMEDIATE) before writing, so bursts of
+# writers queue up instead of failing with "database is locked"
+SQLITE_SERIALIZE_WRITES = os.getenv("SQLITE_SERIALIZE_WRITES", "0").lower() in ("1", "true", "yes")
+SQLITE_WRITE_LOCK_TIMEOUT = float(os.getenv("SQLITE_WRITE_LOCK_TIMEOUT", "30"))  # seconds
+
+def sqlite_pragmas(profile: str = SQLITE_PROFILE) -> Dict[str, object]:
+    """Pragmas applied to each new SQLite connection for a profile"""
+    pragmas = {"busy_timeout": SQLITE_BUSY_TIMEOUT}
+    if profile == "production":
+        pragmas.update({
+            "journal_mode": SQLITE_JOURNAL_MODE,
+            "synchronous": SQLITE_SYNCHRONOUS,
+            "mmap_size": SQLITE_MMAP_SIZE,
+            "cache_size": SQLITE_CACHE_SIZE,
+            "temp_store": SQLITE_TEMP_STORE,
+        })
+    return pragmas
+
+def _is_memory_database(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+def create_database_engine(
+    url: str = DATABASE_URL,
+    profile: str = SQLITE_PROFILE,
+    serialize_writes: bool = SQLITE_SERIALIZE_WRITES
+):
+    """Create an engine configured for the kind of database behind url"""
+    if not url.startswith("sqlite"):
+        if url.startswith("postgresql"):
+            # Configure for PostgreSQL with SSL settings
+            connect_args = {
+                "sslmode": "prefer",
+                "connect_timeout": 30,
+                "application_name": "task_management_app"
+            }
+        else:
+            connect_args = {}
+        return create_engine(
+            url,
+            connect_args=connect_args,
+            pool_pre_ping=True,
+            pool_recycle=300,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            query_cache_size=DB_QUERY_CACHE_SIZE
+        )
+
     connect_args = {"check_same_thread": False}
-elif DATABASE_URL.startswith("postgresql"):
-    # Configure for PostgreSQL with SSL settings
-    connect_args = {
-        "sslmode": "prefer",
-        "connect_timeout": 30,
-        "application_name": "task_management_app"
-    }
-else:
-    connect_args = {}
-
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    pool_size=10,
-    max_overflow=20
-)
+    if _is_memory_database(url):
+        # Every connection to :memory: is a separate database, so share one
+        pool_args = {"poolclass": StaticPool}
+    else:
+        # A local file never drops connections, so no pre-ping or recycling;
+        # a small pool keeps each connection's page cache and mmap warm
+        pool_args = {"poolclass": QueuePool, "pool_size": SQLITE_POOL_SIZE, "max_overflow": SQLITE_MAX_OVERFLOW,
+                     "pool_timeout": DB_POOL_TIMEOUT}
+    engine = create_engine(url, connect_args=connect_args, query_cache_size=DB_QUERY_CACHE_SIZE, **pool_args)
+
+    pragmas = sqlite_pragmas(profile)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+        if serialize_writes:
+            # Let sessions decide when a transaction starts (see serialize_sqlite_writes)
+            dbapi_connection.isolation_level = None
+    return engine
+
+def pool_capacity(engine) -> Optional[int]:
+    """Most connections the engine's pool hands out at once (None if unbounded)"""
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        return pool.size() + pool._max_overflow
+    return None
+
+def dialect_insert(db: Session):
+    """The dialect's insert() with ON CONFLICT support, or None where there is none"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+# Process-wide lock held by the session currently writing to SQLite
+_sqlite_write_lock = threading.Lock()
+
+def _begin_write(session: Session):
+    """Wait for the write lock, then start an IMMEDIATE transaction"""
+    if session.info.get("holds_write_lock"):
+        return
+    if not _sqlite_write_lock.acquire(timeout=SQLITE_WRITE_LOCK_TIMEOUT):
+        # Same error as a pool checkout timeout: the app answers 503 with Retry-After
+        raise exc.TimeoutError("Timed out waiting for the database write lock")
+    session.info["holds_write_lock"] = True
+    try:
+        session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+    except BaseException:
+        _release_write(session)
+        raise
+
+def _release_write(session: Session):
+    if session.info.pop("holds_write_lock", False):
+        _sqlite_write_lock.release()
+
+def serialize_sqlite_writes(session_factory: sessionmaker):
+    """Serialize writes of sessions from session_factory on a process-wide lock.
+
+    Reads run in autocommit mode and hold no locks. The first write of a
+    transaction (flush, bulk UPDATE/DELETE/INSERT) waits for the lock and
+    issues BEGIN IMMEDIATE; the lock is released at commit or rollback.
+    """
+    @event.listens_for(session_factory, "before_flush")
+    def before_flush(session, flush_context, instances):
+        if session.new or session.dirty or session.deleted:
+            _begin_write(session)
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def before_bulk_write(orm_execute_state):
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            _begin_write(orm_execute_state.session)
+
+    @event.listens_for(session_factory, "after_transaction_end")
+    def after_transaction_end(session, transaction):
+        if transaction.parent is None:
+            _release_write(session)
+
+class ReplicaRouter:
+    """Picks the engine for read-only sessions: replicas round-robin, else the primary"""
+
+    def __init__(self, primary, replicas: List = (), retry_seconds: float = REPLICA_RETRY_SECONDS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.retry_seconds = retry_seconds
+        self._turn = itertools.count()
+        self._down_until: Dict[int, float] = {}
+
+    def healthy_replicas(self) -> List:
+        now = time.monotonic()
+        return [replica for i, replica in enumerate(self.replicas) if self._down_until.get(i, 0) <= now]
+
+    def connect(self, use_primary: bool = False):
+        """Check out a connection from the next healthy replica, falling back to the primary"""
+        if not use_primary and self.replicas:
+            start = next(self._turn)
+            for offset in range(len(self.replicas)):
+                i = (start + offset) % len(self.replicas)
+                if self._down_until.get(i, 0) > time.monotonic():
+                    continue
+                try:
+                    # Pre-ping on checkout makes this a health check too
+                    return self.replicas[i].connect()
+                except exc.DBAPIError:
+                    logger.warning("Replica %s unavailable, skipping it for %ss", i, self.retry_seconds, exc_info=True)
+                    self._down_until[i] = time.monotonic() + self.retry_seconds
+        return self.primary.connect()
+
+class _RequestWrites:
+    """Whether the current request wrote to the primary"""
+
+    __slots__ = ("wrote",)
+
+    def __init__(self):
+        self.wrote = False
+
+# Like profiling's per-request stats, the object is shared with the worker
+# thread a sync route runs on, so writes made there are visible here
+_request_writes: ContextVar[Optional[_RequestWrites]] = ContextVar("request_writes", default=None)
+
+def mark_write():
+    """Record that the current request wrote to the primary"""
+    state = _request_writes.get()
+    if state is not None:
+        state.wrote = True
+
+def track_writes(session_factory: sessionmaker):
+    """Record writes made through session_factory against the current request"""
+    @event.listens_for(session_factory, "after_flush")
+    def after_flush(session, flush_context):
+        mark_write()
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def after_bulk_write(orm_execute_state):
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            mark_write()
+
+def reads_pinned_to_primary(cookies: Mapping[str, str]) -> bool:
+    """Whether the client wrote recently enough that replicas may not have caught up"""
+    try:
+        return float(cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware pinning a client's reads to the primary for a while after it writes"""
+
+    def __init__(self, app, sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = _RequestWrites()
+        token = _request_writes.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                until = time.time() + self.sticky_seconds
+                cookie = (f"{READ_PRIMARY_COOKIE}={until:.0f}; Max-Age={self.sticky_seconds:.0f}; "
+                          f"Path=/; HttpOnly; SameSite=Lax")
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_writes.reset(token)
+
+# Create SQLAlchemy engine with proper configuration
+engine = create_database_engine(DATABASE_URL)
+replica_engines = [create_database_engine(url) for url in DATABASE_REPLICA_URLS]
+replica_router = ReplicaRouter(engine, replica_engines)
+
+def dispose_engines(close: bool = True):
+    """Drop the pooled connections of the primary and replica engines"""
+    # In a forked worker pass close=False: the connections belong to the parent
+    for pooled in [engine, *replica_engines]:
+        pooled.dispose(close=close)
 
 # Create SessionLocal class for database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if engine.dialect.name == "sqlite" and SQLITE_SERIALIZE_WRITES:
+    serialize_sqlite_writes(SessionLocal)
+track_writes(SessionLocal)
+
+# Sessions for read-only routes; each is bound to a connection picked by the router
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, info={"read_only": True})
+
+@event.listens_for(ReadSessionLocal, "before_flush")
+def _reject_read_session_writes(session, flush_context, instances):
+    raise RuntimeError("Attempted to write through a read-only session")
+
+@contextmanager
+def read_session(use_primary: bool = False, router: Optional[ReplicaRouter] = None) -> Iterator[Session]:
+    """Session for reads, on a healthy replica unless use_primary (or none is available)"""
+    connection = (router or replica_router).connect(use_primary)
+    db = ReadSessionLocal(bind=connection)
+    try:
+        yield db
+    finally:
+        db.close()
+        connection.close()
 
 # Create Base class for declarative models
-Base = declarative_base()
+Base = declarative_base()
\ No newline at end of file
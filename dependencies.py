@@ -0,0 +1,24 @@
+"""
+Request-scoped database sessions shared by the routes and auth.
+
+FastAPI caches a dependency's value for the whole request, so every
+Depends(get_db) in one request (the route, get_current_user, require_auth)
+gets the same session and pool slot instead of each opening its own.
+"""
+from fastapi import Request
+import database
+import pool_control
+
+# Dependency to get database session (waiting for a pool slot by route priority)
+def get_db(request: Request):
+    with pool_control.session(pool_control.route_priority(request.method, request.url.path)) as db:
+        yield db
+
+# Dependency for read-only routes: a replica session when replicas are configured
+def get_read_db(request: Request):
+    # With every replica down the router falls back to the primary
+    use_primary = database.reads_pinned_to_primary(request.cookies) or not database.replica_router.healthy_replicas()
+    gate = pool_control.gate if use_primary else pool_control.replica_gate
+    with gate.slot(pool_control.route_priority(request.method, request.url.path)):
+        with database.read_session(use_primary=use_primary) as db:
+            yield db
@@ -0,0 +1,195 @@
+"""
+Group commit for task writes.
+
+Every crud.create_task / crud.update_task call is its own transaction, so
+under bursty load write throughput is capped by how many fsyncs per second
+the database can do. With GROUP_COMMIT=1 the API write routes hand their
+writes to a single writer thread instead. It collects the requests that
+arrive within GROUP_COMMIT_WINDOW_MS (up to GROUP_COMMIT_MAX_BATCH), applies
+them in one transaction and commits once, then hands each caller its own row.
+
+If anything in a batch fails, the batch is rolled back and its writes are
+retried one transaction each, so a bad request only fails its own caller.
+"""
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+import logging
+import os
+import queue
+import threading
+import time
+import models
+import schemas
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0").lower() in ("1", "true", "yes")
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "200"))
+
+class WriteRequest:
+    """One caller's write, applied by the writer thread"""
+
+    __slots__ = ("apply", "args", "future")
+
+    def __init__(self, apply: Callable, args: tuple):
+        self.apply = apply
+        self.args = args
+        self.future: Future = Future()
+
+def _create_task(db, data: dict) -> models.Task:
+    task = models.Task(**data)
+    db.add(task)
+    db.flush()
+    return task
+
+def _update_task(db, task_id: int, data: dict) -> Optional[models.Task]:
+    task = db.get(models.Task, task_id)
+    if task:
+        for key, value in data.items():
+            setattr(task, key, value)
+        db.flush()
+    return task
+
+class GroupCommitWriter:
+    """Background thread committing queued writes in batches"""
+
+    def __init__(self, session_factory=None, window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        if session_factory is None:
+            # Not gated by pool_control: every caller waiting on the writer
+            # already holds a gate slot whose own session it leaves unused
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: "queue.Queue[Optional[WriteRequest]]" = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Commit what is queued and stop the writer thread"""
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, apply: Callable, *args) -> Future:
+        """Queue a write; the future resolves to its result once committed"""
+        import database
+        # The write runs on the writer thread, outside this request's context,
+        # so record it here for read-your-writes
+        database.mark_write()
+        self.start()
+        request = WriteRequest(apply, args)
+        self.queue.put(request)
+        return request.future
+
+    def create_task(self, task: schemas.TaskCreate) -> models.Task:
+        """Create a task in the next batch (blocks until committed)"""
+        return self.submit(_create_task, task.model_dump()).result()
+
+    def update_task(self, task_id: int, task: schemas.TaskUpdate) -> Optional[models.Task]:
+        """Update a task in the next batch (blocks until committed)"""
+        return self.submit(_update_task, task_id, task.model_dump(exclude_unset=True)).result()
+
+    def _collect(self, first: WriteRequest) -> Tuple[List[WriteRequest], bool]:
+        """Gather requests arriving within the window after the first one (and whether to stop)"""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is None:
+                break
+            batch, stopping = self._collect(first)
+            try:
+                self._commit_batch(batch)
+            except BaseException:
+                # Keep the writer alive for the requests still queued
+                logger.exception("Group commit failed")
+
+    def _commit_batch(self, batch: List[WriteRequest]):
+        try:
+            self._apply_batch(batch)
+        except BaseException as e:
+            # Whatever went wrong, no caller may be left waiting on its future
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            raise
+
+    def _apply_batch(self, batch: List[WriteRequest]):
+        # Keep loaded attributes after commit so callers get usable rows
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            results = [request.apply(db, *request.args) for request in batch]
+            db.commit()
+        except Exception:
+            db.rollback()
+            db.close()
+            # Find the failing write(s): retry each on its own
+            for request in batch:
+                self._commit_one(request)
+            return
+        db.close()
+        self.batches += 1
+        self.writes += len(batch)
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+
+    def _commit_one(self, request: WriteRequest):
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            result = request.apply(db, *request.args)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            request.future.set_exception(e)
+        else:
+            self.batches += 1
+            self.writes += 1
+            request.future.set_result(result)
+        finally:
+            db.close()
+
+_writer: Optional[GroupCommitWriter] = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> GroupCommitWriter:
+    """Get the shared writer, starting it on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = GroupCommitWriter()
+            _writer.start()
+        return _writer
+
+def shutdown():
+    """Flush and stop the shared writer, if it was started"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
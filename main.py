@@ -1,27 +1,86 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form, Query, WebSocket, WebSocketDisconnect, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, Form, Query, WebSocket, WebSocketDisconnect, UploadFile, File, BackgroundTasks
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse, Response, StreamingResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+from fastapi.routing import APIRoute
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 import models, schemas, crud
-from database import SessionLocal, engine, Base
+import analytics_engine
+import assets
+from database import SessionLocal, engine
+import database
+from dependencies import get_db, get_read_db
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+from typing import Optional
+from contextlib import asynccontextmanager
+from sqlalchemy import exc as sa_exc
 import auth
+import group_commit
 import notifications
+import maintenance
+import metrics
+import migrate
+import pool_control
+import profiling
+import storage
 import asyncio
-import shutil
+import json
+import logging
 import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Create missing tables and indexes on startup (set to 0 when migrations run separately)
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the database and start and stop background jobs with the application"""
+    if DB_AUTO_MIGRATE:
+        await asyncio.to_thread(migrate.upgrade, engine)
+    # In-memory analytics snapshot (ANALYTICS_ENGINE=1)
+    analytics_engine.setup(engine, SessionLocal)
+    background_jobs = []
+    if maintenance.NOTIFICATION_COMPACTION_INTERVAL > 0:
+        background_jobs.append(asyncio.create_task(
+            maintenance.run_periodic_compaction(maintenance.NOTIFICATION_COMPACTION_INTERVAL)
+        ))
+    if analytics_engine.snapshot is not None:
+        # Builds the snapshot in the background; analytics use SQL until it is ready
+        background_jobs.append(asyncio.create_task(analytics_engine.run_periodic_refresh()))
+    yield
+    for job in background_jobs:
+        job.cancel()
+    await asyncio.gather(*background_jobs, return_exceptions=True)
+    # Commit writes still waiting for a batch
+    await asyncio.to_thread(group_commit.shutdown)
+
+class LimitedFormRequest(Request):
+    """Request whose form() caps each non-file field at storage.UPLOAD_FORM_OVERHEAD"""
+
+    def form(self, *, max_files=1000, max_fields=1000, max_part_size=storage.UPLOAD_FORM_OVERHEAD):
+        return super().form(max_files=max_files, max_fields=max_fields, max_part_size=max_part_size)
+
+class LimitedFormRoute(APIRoute):
+    """Route parsing its form body through LimitedFormRequest"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request) -> Response:
+            return await handler(LimitedFormRequest(request.scope, request.receive))
+
+        return limited_handler
 
 # Create FastAPI app instance
-app = FastAPI(title="Task Management System", version="1.0")
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+app = FastAPI(title="Task Management System", version="1.0", lifespan=lifespan)
+app.router.route_class = LimitedFormRoute
 
 # Initialize Jinja2 templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = assets.asset_url
 
 # Add CORS middleware for future frontend integration
 app.add_middleware(
@@ -32,21 +91,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Setup uploads directory and static files
-UPLOAD_DIR = "uploads"
+# Per-route latency/size histograms, exposed on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Per-request SQL statement count and time, slow query log, Server-Timing
+profiling.install(engine)
+for replica in database.replica_engines:
+    profiling.install(replica)
+app.add_middleware(profiling.QueryProfilingMiddleware)
+
+# After a client writes, send its reads to the primary until replicas catch up
+if database.replica_engines:
+    app.add_middleware(database.ReadYourWritesMiddleware)
+
+# Uploads are created on first write; see storage.py
+UPLOAD_DIR = storage.UPLOAD_DIR
 STATIC_DIR = "static"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(STATIC_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Hashed asset URLs are immutable; see assets.py
+app.mount("/static", assets.HashedStaticFiles(directory=STATIC_DIR), name="static")
+
+# Oversized request bodies get a 413 before they are read in full; see storage.py
+app.add_middleware(storage.UploadSizeLimitMiddleware)
+
+@app.exception_handler(pool_control.PoolExhausted)
+@app.exception_handler(sa_exc.TimeoutError)
+async def database_busy(request: Request, exc: Exception):
+    """Shed load with 503 instead of queueing for a database connection"""
+    retry_after = getattr(exc, "retry_after", pool_control.DB_POOL_RETRY_AFTER)
+    return JSONResponse(
+        {"detail": "Server is busy, please retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)}
+    )
 
 # Authentication Routes
 @app.get("/register", response_class=HTMLResponse)
@@ -121,8 +197,8 @@ def login_user(
         )
         return response
     
-    except Exception as e:
-        print(f"Login error: {e}")
+    except Exception:
+        logger.exception("Login error")
         return templates.TemplateResponse("auth.html", {
             "request": request,
             "action": "login", 
@@ -137,10 +213,24 @@ def logout_user():
     response.delete_cookie(key="access_token")
     return response
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics for requests, the DB pool and WebSockets"""
+    return PlainTextResponse(
+        metrics.render_metrics(engine=engine, manager=notifications.manager, gate=pool_control.gate),
+        media_type="text/plain; version=0.0.4"
+    )
+
 @app.get("/sw.js")
 def service_worker():
-    """Serve the service worker file"""
-    return FileResponse("static/sw.js", media_type="application/javascript")
+    """Serve the service worker with this deploy's asset version and URLs"""
+    with open(os.path.join(STATIC_DIR, "sw.js")) as f:
+        script = f.read()
+    script = script.replace("__ASSET_VERSION__", assets.version()).replace(
+        "__PRECACHE_URLS__", json.dumps(list(assets.manifest().values()))
+    )
+    # Browsers must always see a new deploy's worker
+    return Response(script, media_type="application/javascript", headers={"Cache-Control": "no-cache"})
 
 # Frontend HTML Routes with Search and Filtering
 @app.get("/", response_class=HTMLResponse)
@@ -148,7 +238,7 @@ def read_root(
     request: Request, 
     q: str = Query(None, description="Search query"),
     status: str = Query(None, description="Filter by status"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Main page showing user's tasks with search and filter functionality"""
     current_user = auth.get_current_user(request, db)
@@ -157,23 +247,8 @@ def read_root(
     if not current_user:
         return RedirectResponse("/login", status_code=303)
     
-    # Build query for user's tasks only
-    query = db.query(models.Task).filter(models.Task.owner_id == current_user.id)
-    
-    # Apply search filter
-    if q:
-        query = query.filter(
-            or_(
-                models.Task.title.contains(q),
-                models.Task.description.contains(q)
-            )
-        )
-    
-    # Apply status filter
-    if status:
-        query = query.filter(models.Task.status == status)
-    
-    tasks = query.all()
+    # User's tasks only, with search and status filters
+    tasks = crud.get_user_tasks(db, current_user.id, q, status)
     
     return templates.TemplateResponse("index.html", {
         "request": request, 
@@ -219,16 +294,18 @@ async def create_task_form(
             parsed_due_date = None
     
     # Handle file upload
-    filename = None
+    stored_blob = None
     if attachment and attachment.filename:
-        # Create safe filename
-        safe_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{attachment.filename}"
-        file_path = os.path.join(UPLOAD_DIR, safe_filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(attachment.file, buffer)
-        filename = safe_filename
+        # Stream the file into content-addressed storage off the event loop
+        try:
+            stored_blob = await storage.store_upload(attachment, claim=lambda digest: crud.claim_blob(db, digest))
+        except storage.UploadTooLarge as e:
+            return templates.TemplateResponse("form.html", {
+                "request": request,
+                "task": None,
+                "current_user": current_user,
+                "error": str(e)
+            }, status_code=413)
     
     # Create task using schema
     task_data = schemas.TaskCreate(
@@ -242,14 +319,18 @@ async def create_task_form(
     task = crud.create_task(db=db, task=task_data)
     if current_user:
         task.owner_id = current_user.id
-    if filename:
-        setattr(task, 'attachment', filename)
+    if stored_blob:
+        crud.attach_blob(
+            db, task, stored_blob,
+            filename=os.path.basename(attachment.filename),
+            content_type=attachment.content_type
+        )
     db.commit()
     
     return RedirectResponse("/", status_code=303)
 
 @app.get("/tasks/{task_id}", response_class=HTMLResponse)
-def task_detail(task_id: int, request: Request, db: Session = Depends(get_db)):
+def task_detail(task_id: int, request: Request, db: Session = Depends(get_read_db)):
     """Show task detail page"""
     current_user = auth.get_current_user(request, db)
     if not current_user:
@@ -271,6 +352,76 @@ def task_detail(task_id: int, request: Request, db: Session = Depends(get_db)):
         "current_user": current_user
     })
 
+# Content-addressed files never change, so browsers may cache them forever
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+@app.get("/tasks/{task_id}/attachment")
+@app.get("/tasks/{task_id}/attachment/{digest}")
+def download_attachment(task_id: int, request: Request, digest: str = None, db: Session = Depends(get_db)):
+    """Download a task attachment.
+
+    Only the owner and users the task is shared with may download it. Range
+    requests are supported for resumable downloads. The digest form of the
+    URL is immutable and cached by the browser for a year.
+    """
+    current_user = auth.get_current_user(request, db)
+    if not current_user:
+        return RedirectResponse("/login", status_code=303)
+    
+    task = crud.get_task(db, task_id)
+    if not task or not task.attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    if task.owner_id != current_user.id and not crud.is_task_shared_with(db, task_id, current_user.id):
+        raise HTTPException(status_code=403, detail="Not authorized to view this task")
+    
+    ref = task.attachment_ref
+    backend = storage.get_backend()
+    if ref:
+        if digest is not None and digest != ref.digest:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        etag = f'"{ref.digest}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL if digest else REVALIDATE_CACHE_CONTROL
+        key = ref.storage_key
+        filename, media_type = ref.filename, ref.content_type
+        path = backend.local_path(key)
+    else:
+        # Legacy attachment stored on local disk under its upload name
+        etag = None
+        cache_control = REVALIDATE_CACHE_CONTROL
+        key = os.path.basename(task.attachment)
+        filename, media_type = key, None
+        path = os.path.join(UPLOAD_DIR, key)
+    
+    headers = {"Cache-Control": cache_control}
+    if etag:
+        headers["ETag"] = etag
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+    
+    if ref:
+        # Object stores serve the bytes themselves from a short-lived URL
+        presigned_url = backend.presigned_url(key, filename=filename, content_type=media_type)
+        if presigned_url:
+            return RedirectResponse(presigned_url, status_code=307, headers={"Cache-Control": "no-store"})
+    
+    if storage.ATTACHMENT_ACCEL_PREFIX:
+        # Let nginx serve the bytes (sendfile + Range) after our auth check
+        headers["X-Accel-Redirect"] = storage.ATTACHMENT_ACCEL_PREFIX.rstrip("/") + "/" + key
+        headers["Content-Disposition"] = storage.content_disposition(filename)
+        return Response(headers=headers, media_type=media_type)
+    
+    if path is None:
+        # Backend without local files or presigned URLs - stream through the app
+        headers["Content-Disposition"] = storage.content_disposition(filename)
+        return StreamingResponse(backend.open_stream(key), headers=headers, media_type=media_type)
+    
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    # FileResponse handles Range/If-Range and uses the ASGI pathsend
+    # extension (zero-copy) when the server offers it
+    return FileResponse(path, headers=headers, media_type=media_type, filename=filename)
+
 @app.get("/tasks/{task_id}/edit", response_class=HTMLResponse)
 def edit_task(task_id: int, request: Request, db: Session = Depends(get_db)):
     """Show form to edit an existing task"""
@@ -296,6 +447,7 @@ def edit_task(task_id: int, request: Request, db: Session = Depends(get_db)):
 def update_task_form(
     task_id: int,
     request: Request,
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: str = Form(""),
     status: str = Form("Pending"),
@@ -307,13 +459,6 @@ def update_task_form(
     if not current_user:
         return RedirectResponse("/login", status_code=303)
     
-    # Check task ownership
-    task = crud.get_task(db, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if task.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to edit this task")
-    
     # Convert due_date string to date object if provided
     parsed_due_date = None
     if due_date:
@@ -322,36 +467,29 @@ def update_task_form(
         except ValueError:
             parsed_due_date = None
     
-    # Get task to check for status changes and shared users
-    task = crud.get_task(db, task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    old_status = task.status
+    # Read before the commit expires the user
+    updater_name = current_user.name
     
-    # Update task using schema
+    # Update task using schema (ownership is part of the UPDATE's WHERE clause)
     task_data = schemas.TaskUpdate(
         title=title,
         description=description if description else None,
         status=status,
         due_date=parsed_due_date
     )
-    updated = crud.update_task(db, task_id, task_data)
-    if not updated:
-        raise HTTPException(status_code=404, detail="Task not found")
+    updated = crud.update_owned_task(db, task_id, current_user.id, task_data)
+    if updated is None:
+        if crud.get_task(db, task_id) is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        raise HTTPException(status_code=403, detail="Not authorized to edit this task")
     
     # Notify shared users if status changed
-    if old_status != status and len(task.shared_with) > 0:
-        updater_name = current_user.username if current_user else "Someone"
-        message = f"Task '{task.title}' status changed from '{old_status}' to '{status}' by {updater_name}"
-        
-        # Create notification task for each shared user
-        async def notify_all_users():
-            for shared_user in task.shared_with:
-                await notifications.notify_user(db, shared_user.id, message)
-        
-        # Run the async notification in background
-        asyncio.create_task(notify_all_users())
+    if updated.previous_status != status:
+        shared_user_ids = crud.get_shared_user_ids(db, task_id)
+        if shared_user_ids:
+            message = f"Task '{updated.title}' status changed from '{updated.previous_status}' to '{status}' by {updater_name}"
+            # Notify after the response is sent, using the event loop
+            background_tasks.add_task(notifications.notify_users, shared_user_ids, message)
     
     return RedirectResponse("/", status_code=303)
 
@@ -372,17 +510,51 @@ def delete_task_form(task_id: int, request: Request, db: Session = Depends(get_d
     crud.delete_task(db, task_id)
     return RedirectResponse("/", status_code=303)
 
+def _websocket_user_id(websocket: WebSocket) -> Optional[int]:
+    """Id of the user logged in on a WebSocket handshake, if any"""
+    with pool_control.session() as db:
+        user = auth.get_current_user(websocket, db)
+        return user.id if user else None
+
 # WebSocket endpoint for real-time notifications
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    """WebSocket endpoint for real-time notifications"""
-    await notifications.manager.connect(user_id, websocket)
+async def websocket_endpoint(websocket: WebSocket, user_id: int, last_seen_id: int = Query(None)):
+    """WebSocket endpoint for real-time notifications.
+
+    The server pings every WS_PING_INTERVAL seconds and evicts clients that
+    stay silent for WS_IDLE_TIMEOUT. A reconnecting client passes the id of
+    the last notification it saw as ?last_seen_id= to get what it missed.
+    """
+    # Same cookie as the HTTP routes; a socket only ever serves its own user
+    if await asyncio.to_thread(_websocket_user_id, websocket) != user_id:
+        await websocket.close(code=1008)
+        return
+
+    manager = notifications.manager
+    connection = await manager.connect(user_id, websocket)
+    with pool_control.session() as db:
+        if last_seen_id is None:
+            await manager.welcome(db, connection)
+        else:
+            await manager.replay(db, connection, last_seen_id)
+    
     try:
         while True:
-            # Keep connection alive and listen for messages
-            await websocket.receive_text()
+            try:
+                await asyncio.wait_for(websocket.receive_text(), timeout=notifications.WS_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                if connection.idle_for() >= notifications.WS_IDLE_TIMEOUT:
+                    # Half-open connection - nobody answered our pings
+                    await manager.evict(connection)
+                    break
+                manager.ping(connection)
+                continue
+            # Any message (usually a pong) proves the client is alive
+            connection.touch()
     except WebSocketDisconnect:
-        notifications.manager.disconnect(user_id)
+        pass
+    finally:
+        manager.disconnect(user_id, connection)
 
 # Task Sharing Routes
 @app.get("/tasks/{task_id}/share", response_class=HTMLResponse)
@@ -406,14 +578,29 @@ def share_task_page(task_id: int, request: Request, db: Session = Depends(get_db
         "current_user": current_user
     })
 
+# The share form takes one or more emails separated by commas, semicolons or whitespace
+_EMAIL_SEPARATORS = re.compile(r"[\s,;]+")
+
+def _share_messages(result, sharer_name: str) -> list:
+    """One notification per new share"""
+    return [
+        (user_id, f"Task '{result.titles[task_id]}' was shared with you by {sharer_name}")
+        for task_id, user_id in result.shared
+    ]
+
+def _user_list(result, pairs) -> str:
+    user_ids = dict.fromkeys(user_id for _, user_id in pairs)
+    return ", ".join(f"{result.users[user_id].name} ({result.users[user_id].email})" for user_id in user_ids)
+
 @app.post("/tasks/{task_id}/share")
-async def share_task_action(
+def share_task_action(
     task_id: int,
     request: Request,
+    background_tasks: BackgroundTasks,
     email: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    """Share a task with another user by email"""
+    """Share a task with one or more users by email"""
     current_user = auth.get_current_user(request, db)
     if not current_user:
         return RedirectResponse("/login", status_code=303)
@@ -431,54 +618,29 @@ async def share_task_action(
             "error": "Not authorized to share this task"
         })
     
-    # Find user to share with by email
-    user_to_share = db.query(models.User).filter(models.User.email == email).first()
-    if not user_to_share:
-        return templates.TemplateResponse("share_task.html", {
-            "request": request,
-            "task": task,
-            "current_user": current_user,
-            "error": f"No user found with email: {email}",
-            "email": email
-        })
-    
-    # Don't allow sharing with yourself
-    if user_to_share.id == current_user.id:
-        return templates.TemplateResponse("share_task.html", {
-            "request": request,
-            "task": task,
-            "current_user": current_user,
-            "error": "You cannot share a task with yourself",
-            "email": email
-        })
-    
-    # Check if already shared
-    if user_to_share in task.shared_with:
-        return templates.TemplateResponse("share_task.html", {
-            "request": request,
-            "task": task,
-            "current_user": current_user,
-            "error": f"Task is already shared with {user_to_share.name} ({email})",
-            "email": email
-        })
-    
-    # Share the task
-    task.shared_with.append(user_to_share)
-    db.commit()
-    
-    # Send notification
-    message = f"Task '{task.title}' was shared with you by {current_user.name}"
-    await notifications.notify_user(db, user_to_share.id, message)
-    
-    return templates.TemplateResponse("share_task.html", {
-        "request": request,
-        "task": task,
-        "current_user": current_user,
-        "success": f"Task successfully shared with {user_to_share.name} ({email})"
-    })
+    # Resolve every email and add the new shares in one go
+    result = crud.share_tasks(db, current_user.id, [task_id], _EMAIL_SEPARATORS.split(email))
+    if result.shared:
+        # Notify after the response is sent
+        background_tasks.add_task(notifications.notify_many, _share_messages(result, current_user.name))
+    
+    context = {"request": request, "task": task, "current_user": current_user}
+    errors = []
+    if result.unknown_emails:
+        errors.append(f"No user found with email: {', '.join(result.unknown_emails)}")
+        context["email"] = ", ".join(result.unknown_emails)
+    if result.own_email:
+        errors.append("You cannot share a task with yourself")
+    if result.already_shared:
+        errors.append(f"Task is already shared with {_user_list(result, result.already_shared)}")
+    if errors:
+        context["error"] = "; ".join(errors)
+    if result.shared:
+        context["success"] = f"Task successfully shared with {_user_list(result, result.shared)}"
+    return templates.TemplateResponse("share_task.html", context)
 
 @app.get("/shared-tasks", response_class=HTMLResponse)
-def get_shared_tasks(request: Request, view: str = Query("with-me"), db: Session = Depends(get_db)):
+def get_shared_tasks(request: Request, view: str = Query("with-me"), db: Session = Depends(get_read_db)):
     """Show tasks shared with or by the current user"""
     current_user = auth.get_current_user(request, db)
     if not current_user:
@@ -486,14 +648,11 @@ def get_shared_tasks(request: Request, view: str = Query("with-me"), db: Session
     
     if view == "by-me":
         # Tasks shared by the current user (tasks they own that are shared with others)
-        tasks = db.query(models.Task).filter(
-            models.Task.owner_id == current_user.id,
-            models.Task.shared_with.any()
-        ).all()
+        tasks = crud.get_tasks_shared_by(db, current_user.id)
         page_title = "Tasks I've Shared"
     else:
         # Tasks shared with the current user
-        tasks = current_user.shared_tasks
+        tasks = crud.get_tasks_shared_with(db, current_user.id)
         page_title = "Tasks Shared with Me"
     
     return templates.TemplateResponse("shared_tasks.html", {
@@ -505,22 +664,77 @@ def get_shared_tasks(request: Request, view: str = Query("with-me"), db: Session
     })
 
 @app.get("/notifications", response_class=HTMLResponse)
-def get_notifications(request: Request, db: Session = Depends(get_db)):
-    """Show user notifications"""
+def get_notifications(
+    request: Request,
+    before: int = Query(None, description="Show notifications older than this id"),
+    limit: int = Query(notifications.NOTIFICATIONS_PAGE_SIZE, ge=1, le=notifications.MAX_NOTIFICATIONS_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    """Show user notifications one page at a time"""
     current_user = auth.get_current_user(request, db)
     if not current_user:
         return RedirectResponse("/login", status_code=303)
     
-    user_notifications = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id
-    ).order_by(models.Notification.created_at.desc()).all()
+    user_notifications, next_before = notifications.get_notifications_page(
+        db, int(current_user.id), before_id=before, limit=limit
+    )
     
     return templates.TemplateResponse("notifications.html", {
         "request": request,
         "notifications": user_notifications,
+        "next_before": next_before,
+        "is_first_page": before is None,
+        "unread_count": notifications.get_unread_count(db, int(current_user.id)),
         "current_user": current_user
     })
 
+@app.get("/notifications/unread-count")
+def unread_notifications_count(request: Request, db: Session = Depends(get_read_db)):
+    """Get the number of unread notifications for the current user"""
+    current_user = auth.get_current_user(request, db)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    return {"unread": notifications.get_unread_count(db, int(current_user.id))}
+
+@app.get("/api/notifications")
+def read_notifications_api(
+    request: Request,
+    before: int = Query(None),
+    limit: int = Query(notifications.NOTIFICATIONS_PAGE_SIZE, ge=1, le=notifications.MAX_NOTIFICATIONS_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    """Get one page of the current user's notifications via API"""
+    current_user = auth.get_current_user(request, db)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    items, next_before = notifications.get_notifications_page(
+        db, int(current_user.id), before_id=before, limit=limit
+    )
+    return {
+        "items": [
+            {
+                "id": n.id,
+                "message": n.message,
+                "created_at": n.created_at.isoformat() if n.created_at else None,
+                "read": n.read
+            }
+            for n in items
+        ],
+        "next_before": next_before
+    }
+
+@app.post("/notifications/mark-all-read")
+def mark_all_notifications_read(request: Request, db: Session = Depends(get_db)):
+    """Mark all of the current user's notifications as read"""
+    current_user = auth.get_current_user(request, db)
+    if not current_user:
+        return RedirectResponse("/login", status_code=303)
+    
+    notifications.mark_all_notifications_read(db, int(current_user.id))
+    return RedirectResponse("/notifications", status_code=303)
+
 @app.post("/notifications/{notification_id}/mark-read")
 def mark_notification_read(
     notification_id: int,
@@ -537,12 +751,15 @@ def mark_notification_read(
 
 # Analytics Routes
 @app.get("/analytics/overview")
-def analytics_overview_api(db: Session = Depends(get_db)):
+def analytics_overview_api(db: Session = Depends(get_read_db)):
     """Get analytics overview data via API"""
+    snapshot = analytics_engine.get_snapshot()
+    if snapshot is not None:
+        return snapshot.overview()
     return crud.get_analytics_overview(db)
 
 @app.get("/analytics", response_class=HTMLResponse)
-def analytics_dashboard(request: Request, db: Session = Depends(get_db)):
+def analytics_dashboard(request: Request, db: Session = Depends(get_read_db)):
     """Show analytics dashboard with charts and statistics for current user's tasks"""
     current_user = auth.get_current_user(request, db)
     if not current_user:
@@ -550,15 +767,20 @@ def analytics_dashboard(request: Request, db: Session = Depends(get_db)):
     
     # Get analytics data for current user's tasks only
     user_id = int(current_user.id)
-    overview = crud.get_analytics_overview(db, user_id)
-    trends = crud.get_weekly_trends(db, user_id)
-    monthly_stats = crud.get_monthly_stats(db, user_id)
-    user_productivity = crud.get_user_productivity(db, user_id)
+    snapshot = analytics_engine.get_snapshot()
+    if snapshot is not None:
+        overview = snapshot.overview(user_id)
+        trends = snapshot.weekly_trends(user_id)
+        monthly_stats = snapshot.monthly_stats(user_id)
+        user_productivity = snapshot.user_productivity(user_id)
+    else:
+        overview = crud.get_analytics_overview(db, user_id)
+        trends = crud.get_weekly_trends(db, user_id)
+        monthly_stats = crud.get_monthly_stats(db, user_id)
+        user_productivity = crud.get_user_productivity(db, user_id)
     
     # Get recent task activity for the user (using id since created_at may not exist)
-    recent_tasks = db.query(models.Task).filter(
-        models.Task.owner_id == current_user.id
-    ).order_by(models.Task.id.desc()).limit(5).all()
+    recent_tasks = crud.get_recent_tasks(db, current_user.id)
     
     return templates.TemplateResponse("analytics.html", {
         "request": request,
@@ -579,13 +801,44 @@ def api_home():
 @app.post("/api/tasks", response_model=schemas.TaskOut)
 def create_task_api(task: schemas.TaskCreate, db: Session = Depends(get_db)):
     """Create a new task via API"""
+    if group_commit.GROUP_COMMIT:
+        return group_commit.get_writer().create_task(task)
     return crud.create_task(db=db, task=task)
 
+@app.post("/api/tasks/batch")
+def batch_tasks_api(batch: schemas.TaskBatch, request: Request, db: Session = Depends(get_db)):
+    """Apply several of the current user's task mutations at once (used by the offline queue)"""
+    current_user = auth.get_current_user(request, db)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return {"results": crud.apply_task_batch(db, current_user.id, batch.operations)}
+
+@app.post("/api/tasks/share")
+def share_tasks_api(
+    batch: schemas.TaskShareBatch,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Share several of the current user's tasks with several users at once"""
+    current_user = auth.get_current_user(request, db)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    result = crud.share_tasks(db, current_user.id, batch.task_ids, batch.emails)
+    if result.shared:
+        background_tasks.add_task(notifications.notify_many, _share_messages(result, current_user.name))
+    return {
+        "shared": [{"task_id": task_id, "user_id": user_id} for task_id, user_id in result.shared],
+        "already_shared": [{"task_id": task_id, "user_id": user_id} for task_id, user_id in result.already_shared],
+        "unknown_emails": result.unknown_emails,
+        "not_owned": result.not_owned,
+    }
+
 @app.get("/api/tasks", response_model=list[schemas.TaskOut])
 def read_tasks_api(
     q: str = Query(None), 
     status: str = Query(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all tasks via API with optional search and filter"""
     query = db.query(models.Task)
@@ -604,7 +857,7 @@ def read_tasks_api(
     return query.all()
 
 @app.get("/api/tasks/{task_id}", response_model=schemas.TaskOut)
-def read_task_api(task_id: int, db: Session = Depends(get_db)):
+def read_task_api(task_id: int, db: Session = Depends(get_read_db)):
     """Get a specific task by ID via API"""
     task = crud.get_task(db, task_id)
     if not task:
@@ -614,7 +867,10 @@ def read_task_api(task_id: int, db: Session = Depends(get_db)):
 @app.put("/api/tasks/{task_id}", response_model=schemas.TaskOut)
 def update_task_api(task_id: int, task: schemas.TaskUpdate, db: Session = Depends(get_db)):
     """Update an existing task via API"""
-    updated = crud.update_task(db, task_id, task)
+    if group_commit.GROUP_COMMIT:
+        updated = group_commit.get_writer().update_task(task_id, task)
+    else:
+        updated = crud.update_task(db, task_id, task)
     if not updated:
         raise HTTPException(status_code=404, detail="Task not found")
     return updated
@@ -0,0 +1,196 @@
+"""
+Database maintenance jobs.
+
+Currently this covers notification retention: read notifications older than
+a maximum age, or beyond a per-user cap, are deleted in small batches so the
+table does not grow forever and no single statement holds locks for long.
+
+Run from the command line:
+
+    python maintenance.py compact-notifications --max-age-days 90 --max-read-per-user 500
+
+or enable the periodic background job by setting NOTIFICATION_COMPACTION_INTERVAL
+(seconds) before starting the app.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+import argparse
+import asyncio
+import logging
+import os
+import time
+import models
+
+logger = logging.getLogger(__name__)
+
+# Retention policy defaults (0 disables a rule)
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_MAX_READ_PER_USER = int(os.getenv("NOTIFICATION_MAX_READ_PER_USER", "500"))
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "1000"))
+NOTIFICATION_COMPACTION_INTERVAL = int(os.getenv("NOTIFICATION_COMPACTION_INTERVAL", "0"))
+
+def _delete_in_batches(db: Session, filters: List, batch_size: int, pause: float = 0.0) -> int:
+    """Delete matching notifications batch by batch, committing after each batch"""
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.query(models.Notification.id).filter(*filters).limit(batch_size)]
+        if not ids:
+            break
+        db.query(models.Notification).filter(
+            models.Notification.id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            # Give concurrent writers a chance to grab the lock between batches
+            time.sleep(pause)
+    return deleted
+
+def delete_expired_notifications(
+    db: Session,
+    max_age_days: int = NOTIFICATION_RETENTION_DAYS,
+    batch_size: int = COMPACTION_BATCH_SIZE,
+    pause: float = 0.0
+) -> int:
+    """Delete read notifications older than max_age_days"""
+    if max_age_days <= 0:
+        return 0
+    # created_at defaults to the database clock, which is UTC
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    return _delete_in_batches(db, [
+        models.Notification.read == True,
+        models.Notification.created_at < cutoff
+    ], batch_size, pause)
+
+def delete_excess_read_notifications(
+    db: Session,
+    max_read_per_user: int = NOTIFICATION_MAX_READ_PER_USER,
+    batch_size: int = COMPACTION_BATCH_SIZE,
+    pause: float = 0.0
+) -> int:
+    """Keep only the newest max_read_per_user read notifications of each user"""
+    if max_read_per_user <= 0:
+        return 0
+
+    over_limit = db.query(models.Notification.user_id).filter(
+        models.Notification.read == True
+    ).group_by(models.Notification.user_id).having(
+        func.count(models.Notification.id) > max_read_per_user
+    ).all()
+
+    deleted = 0
+    for (user_id,) in over_limit:
+        # Id of the oldest read notification we keep for this user
+        keep_from = db.query(models.Notification.id).filter(
+            models.Notification.user_id == user_id,
+            models.Notification.read == True
+        ).order_by(models.Notification.id.desc()).offset(max_read_per_user - 1).limit(1).scalar()
+        deleted += _delete_in_batches(db, [
+            models.Notification.user_id == user_id,
+            models.Notification.read == True,
+            models.Notification.id < keep_from
+        ], batch_size, pause)
+    return deleted
+
+def optimize_database(db: Session, vacuum: bool = False):
+    """Refresh planner statistics and optionally reclaim free pages"""
+    bind = db.get_bind()
+    # VACUUM cannot run inside a transaction
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if bind.dialect.name == "postgresql":
+            conn.execute(text("VACUUM (ANALYZE) notifications" if vacuum else "ANALYZE notifications"))
+        else:
+            if vacuum:
+                conn.execute(text("VACUUM"))
+            conn.execute(text("ANALYZE notifications"))
+
+def compact_notifications(
+    db: Session,
+    max_age_days: int = NOTIFICATION_RETENTION_DAYS,
+    max_read_per_user: int = NOTIFICATION_MAX_READ_PER_USER,
+    batch_size: int = COMPACTION_BATCH_SIZE,
+    vacuum: bool = False,
+    pause: float = 0.0
+) -> dict:
+    """Apply the notification retention policy and report rows reclaimed.
+
+    Unread notifications are never deleted, so the cached unread counters
+    stay valid.
+    """
+    started = time.perf_counter()
+    expired = delete_expired_notifications(db, max_age_days, batch_size, pause)
+    excess = delete_excess_read_notifications(db, max_read_per_user, batch_size, pause)
+    if expired or excess or vacuum:
+        optimize_database(db, vacuum=vacuum)
+
+    return {
+        "expired_deleted": expired,
+        "excess_deleted": excess,
+        "rows_reclaimed": expired + excess,
+        "vacuumed": vacuum,
+        "duration_seconds": round(time.perf_counter() - started, 3)
+    }
+
+async def run_periodic_compaction(interval: int = NOTIFICATION_COMPACTION_INTERVAL):
+    """Background loop that compacts notifications every interval seconds"""
+    import pool_control
+
+    def compact_once():
+        # Low priority: when the pool is busy this run is skipped
+        with pool_control.session("low") as db:
+            # Pause between batches so request traffic is not starved
+            return compact_notifications(db, pause=0.05)
+
+    while True:
+        await asyncio.sleep(interval)
+        work = asyncio.ensure_future(asyncio.to_thread(compact_once))
+        try:
+            report = await asyncio.shield(work)
+            logger.info("Notification compaction: %s", report)
+        except asyncio.CancelledError:
+            # Shutting down: let the running transaction finish first
+            await asyncio.gather(work, return_exceptions=True)
+            raise
+        except Exception:
+            logger.exception("Notification compaction failed")
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Task Management System maintenance jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact = subparsers.add_parser("compact-notifications", help="Delete old read notifications")
+    compact.add_argument("--max-age-days", type=int, default=NOTIFICATION_RETENTION_DAYS,
+                         help="Delete read notifications older than this (0 disables)")
+    compact.add_argument("--max-read-per-user", type=int, default=NOTIFICATION_MAX_READ_PER_USER,
+                         help="Keep at most this many read notifications per user (0 disables)")
+    compact.add_argument("--batch-size", type=int, default=COMPACTION_BATCH_SIZE,
+                         help="Rows deleted per transaction")
+    compact.add_argument("--vacuum", action="store_true",
+                         help="Run VACUUM afterwards to return free pages to the OS")
+
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        report = compact_notifications(
+            db,
+            max_age_days=args.max_age_days,
+            max_read_per_user=args.max_read_per_user,
+            batch_size=args.batch_size,
+            vacuum=args.vacuum
+        )
+    finally:
+        db.close()
+
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Request instrumentation and Prometheus metrics.
+
+MetricsMiddleware is a plain ASGI middleware (no BaseHTTPMiddleware task
+switching) that records, per route template:
+
+- a latency histogram
+- a response size histogram
+- a request counter by status code
+
+plus a gauge of in-flight requests. render_metrics() adds database pool and
+WebSocket gauges and formats everything in the Prometheus text format served
+on /metrics.
+
+All updates happen on the event loop thread, so no locking is needed.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        """Prometheus sample lines for this histogram"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class RequestMetrics:
+    """In-process store for HTTP request metrics"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.db_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, method: str, route: str, status: int, duration: float, size: int):
+        key = (method, route)
+        latency = self.latency.get(key)
+        if latency is None:
+            latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.response_size[key] = Histogram(SIZE_BUCKETS)
+        latency.observe(duration)
+        self.response_size[key].observe(size)
+        counter_key = (method, route, status)
+        self.requests[counter_key] = self.requests.get(counter_key, 0) + 1
+
+    def observe_db(self, method: str, route: str, queries: int, duration: float):
+        """Record the statements issued and DB time spent by one request"""
+        key = (method, route)
+        histogram = self.db_queries.get(key)
+        if histogram is None:
+            histogram = self.db_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            self.db_time[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(queries)
+        self.db_time[key].observe(duration)
+
+    def reset(self):
+        self.__init__()
+
+# Global metrics store
+request_metrics = RequestMetrics()
+
+def route_label(scope) -> str:
+    """Route template (e.g. /tasks/{task_id}) so label cardinality stays bounded"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request"""
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            metrics.observe(scope["method"], route_label(scope), status, time.perf_counter() - started, size)
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{str(value)}"' for key, value in labels.items())
+
+def _pool_metrics(engine) -> List[str]:
+    """Gauges for the SQLAlchemy connection pool, where the pool exposes them"""
+    pool = engine.pool
+    lines = [
+        "# TYPE taskapp_db_pool_info gauge",
+        f'taskapp_db_pool_info{{{_labels(pool=type(pool).__name__)}}} 1',
+    ]
+    for name, method in (("size", "size"), ("checked_in", "checkedin"),
+                         ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if hasattr(pool, method):
+            lines.append(f"# TYPE taskapp_db_pool_{name} gauge")
+            lines.append(f"taskapp_db_pool_{name} {getattr(pool, method)()}")
+    return lines
+
+def _pool_gate_metrics(gate) -> List[str]:
+    """Admission gauges, checkout wait histograms and load-shedding counters"""
+    lines = []
+    if gate.capacity is not None:
+        lines += ["# TYPE taskapp_db_pool_gate_capacity gauge", f"taskapp_db_pool_gate_capacity {gate.capacity}"]
+    lines += [
+        "# TYPE taskapp_db_pool_gate_in_use gauge",
+        f"taskapp_db_pool_gate_in_use {gate.in_use}",
+        "# TYPE taskapp_db_pool_wait_seconds histogram",
+    ]
+    for priority, histogram in gate.wait_seconds.items():
+        lines.extend(histogram.samples("taskapp_db_pool_wait_seconds", _labels(priority=priority)))
+    lines.append("# TYPE taskapp_db_pool_rejections_total counter")
+    for priority, count in gate.rejections.items():
+        lines.append(f"taskapp_db_pool_rejections_total{{{_labels(priority=priority)}}} {count}")
+    return lines
+
+def _websocket_metrics(manager) -> List[str]:
+    stats = manager.stats()
+    return [
+        "# TYPE taskapp_websocket_connections gauge",
+        f"taskapp_websocket_connections {stats['connections']}",
+        "# TYPE taskapp_websocket_users gauge",
+        f"taskapp_websocket_users {stats['users']}",
+        "# TYPE taskapp_websocket_queued_messages gauge",
+        f"taskapp_websocket_queued_messages {stats['queued_messages']}",
+        "# TYPE taskapp_websocket_queued_bytes gauge",
+        f"taskapp_websocket_queued_bytes {stats['queued_bytes']}",
+        "# TYPE taskapp_websocket_evictions_total counter",
+        f"taskapp_websocket_evictions_total {stats['evictions']}",
+    ]
+
+def render_metrics(engine=None, manager=None, metrics: RequestMetrics = request_metrics, gate=None) -> str:
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = [
+        "# TYPE taskapp_http_requests_in_flight gauge",
+        f"taskapp_http_requests_in_flight {metrics.in_flight}",
+        "# TYPE taskapp_http_requests_total counter",
+    ]
+    for (method, route, status), count in sorted(metrics.requests.items()):
+        lines.append(f"taskapp_http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}")
+
+    lines.append("# TYPE taskapp_http_request_duration_seconds histogram")
+    for (method, route), histogram in sorted(metrics.latency.items()):
+        lines.extend(histogram.samples("taskapp_http_request_duration_seconds", _labels(method=method, route=route)))
+
+    lines.append("# TYPE taskapp_http_response_size_bytes histogram")
+    for (method, route), histogram in sorted(metrics.response_size.items()):
+        lines.extend(histogram.samples("taskapp_http_response_size_bytes", _labels(method=method, route=route)))
+
+    lines.append("# TYPE taskapp_http_request_db_queries histogram")
+    for (method, route), histogram in sorted(metrics.db_queries.items()):
+        lines.extend(histogram.samples("taskapp_http_request_db_queries", _labels(method=method, route=route)))
+
+    lines.append("# TYPE taskapp_http_request_db_seconds histogram")
+    for (method, route), histogram in sorted(metrics.db_time.items()):
+        lines.extend(histogram.samples("taskapp_http_request_db_seconds", _labels(method=method, route=route)))
+
+    if engine is not None:
+        lines.extend(_pool_metrics(engine))
+    if gate is not None:
+        lines.extend(_pool_gate_metrics(gate))
+    if manager is not None:
+        lines.extend(_websocket_metrics(manager))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,63 @@
+"""
+Schema migrations.
+
+Creates the tables and indexes defined in models.py that the database is
+missing, including indexes added to tables that already exist (which
+create_all skips). Columns are never added or changed.
+
+    python migrate.py
+    python migrate.py --database-url postgresql://...
+
+Importing the app no longer touches the database. `uvicorn main:app` runs
+this on startup unless DB_AUTO_MIGRATE=0, and server.py runs it once before
+starting the workers.
+"""
+from typing import List, Optional
+from sqlalchemy import inspect
+import argparse
+import logging
+import sys
+from database import Base
+import models  # noqa: F401  (registers the tables on Base.metadata)
+
+logger = logging.getLogger(__name__)
+
+def upgrade(engine=None) -> List[str]:
+    """Create missing tables and indexes; returns what was created"""
+    if engine is None:
+        from database import engine
+    created = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        missing_tables = [table for table in Base.metadata.sorted_tables if table.name not in existing_tables]
+        # New tables come with their indexes
+        Base.metadata.create_all(bind=conn, tables=missing_tables)
+        created.extend(table.name for table in missing_tables)
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name not in existing_indexes:
+                    index.create(bind=conn)
+                    created.append(index.name)
+    if created:
+        logger.info("Created %s", ", ".join(created))
+    return created
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to migrate (default: DATABASE_URL)")
+    args = parser.parse_args(argv)
+
+    engine = None
+    if args.database_url:
+        from database import create_database_engine
+        engine = create_database_engine(args.database_url)
+    created = upgrade(engine)
+    print(f"Created {', '.join(created)}" if created else "Schema is up to date")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Table, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Table, DateTime, func, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -6,7 +6,9 @@ from database import Base
 task_shares = Table(
     "task_shares", Base.metadata,
     Column("task_id", Integer, ForeignKey("tasks.id"), primary_key=True),
-    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True)
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # The primary key only serves lookups by task; "shared with me" goes by user
+    Index("ix_task_shares_user_id", "user_id")
 )
 
 class User(Base):
@@ -35,12 +37,13 @@ class Task(Base):
     description = Column(String, nullable=True)
     status = Column(String, default="Pending", nullable=False, index=True)
     due_date = Column(Date, nullable=True, index=True)
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     attachment = Column(String, nullable=True)  # store filename
     
     # Relationships
     owner = relationship("User", back_populates="owned_tasks")
     shared_with = relationship("User", secondary=task_shares, back_populates="shared_tasks")
+    attachment_ref = relationship("TaskAttachment", uselist=False, back_populates="task", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Task(id={self.id}, title='{self.title}', status='{self.status}')>"
@@ -58,5 +61,56 @@ class Notification(Base):
     # Relationship
     user = relationship("User", back_populates="notifications")
 
+    # Keyset pagination walks a user's notifications newest-first by id;
+    # retention compaction looks up old read rows by (read, created_at)
+    __table_args__ = (
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+        Index("ix_notifications_read_created_at", "read", "created_at"),
+    )
+
     def __repr__(self):
         return f"<Notification(id={self.id}, user_id={self.user_id}, message='{self.message[:50]}...')>"
+
+class NotificationCounter(Base):
+    """Per-user unread notification counter, maintained on every write"""
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<NotificationCounter(user_id={self.user_id}, unread_count={self.unread_count})>"
+
+
+class AttachmentBlob(Base):
+    """A stored attachment file, addressed by the SHA-256 of its content"""
+    __tablename__ = "attachment_blobs"
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<AttachmentBlob(digest='{self.digest[:12]}', size={self.size}, ref_count={self.ref_count})>"
+
+class TaskAttachment(Base):
+    """Links a task to the blob holding its attachment"""
+    __tablename__ = "task_attachments"
+
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    digest = Column(String(64), ForeignKey("attachment_blobs.digest"), nullable=False, index=True)
+    filename = Column(String, nullable=False)  # original upload name
+    content_type = Column(String, nullable=True)
+
+    # Relationships
+    task = relationship("Task", back_populates="attachment_ref")
+    blob = relationship("AttachmentBlob")
+
+    @property
+    def storage_key(self) -> str:
+        """Path of the blob relative to the uploads directory"""
+        return f"{self.digest[:2]}/{self.digest}"
+
+    def __repr__(self):
+        return f"<TaskAttachment(task_id={self.task_id}, digest='{self.digest[:12]}', filename='{self.filename}')>"
\ No newline at end of file
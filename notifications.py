@@ -1,40 +1,264 @@
-from typing import Dict, List
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
 from fastapi import WebSocket
 import json
 import asyncio
+import os
+import time
 from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, bindparam
+from database import dialect_insert
 import models
 
+# Default and maximum page size for the notifications list
+NOTIFICATIONS_PAGE_SIZE = 20
+MAX_NOTIFICATIONS_PAGE_SIZE = 100
+
+# WebSocket heartbeat and flow-control settings
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "25"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_REPLAY_LIMIT = int(os.getenv("WS_REPLAY_LIMIT", "100"))
+
+class Connection:
+    """A single WebSocket connection with its send queue and metrics"""
+
+    def __init__(self, user_id: int, websocket: WebSocket, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.time()
+        self.last_seen = time.monotonic()
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.queued_bytes = 0
+        self.sender: Optional[asyncio.Task] = None
+        # Live messages wait here while a replay is being loaded
+        self.held: Optional[List[str]] = None
+
+    def touch(self):
+        """Record that the client is still alive"""
+        self.last_seen = time.monotonic()
+
+    def idle_for(self) -> float:
+        """Seconds since the client was last heard from"""
+        return time.monotonic() - self.last_seen
+
+    def enqueue(self, message: str) -> bool:
+        """Queue a message for sending, returning False if the queue is full"""
+        if self.held is not None:
+            self.held.append(message)
+            return True
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        self.queued_bytes += len(message)
+        return True
+
+    def stats(self) -> dict:
+        """Per-connection queue and memory metrics"""
+        return {
+            "user_id": self.user_id,
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+            "idle_seconds": round(self.idle_for(), 1),
+            "queue_depth": self.queue.qsize(),
+            "queued_bytes": self.queued_bytes,
+            "messages_sent": self.messages_sent,
+            "bytes_sent": self.bytes_sent
+        }
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
+        self.active_connections: Dict[int, List[Connection]] = {}
+        self.evictions = 0
+        self.dropped_messages = 0
 
-    async def connect(self, user_id: int, websocket: WebSocket):
+    async def connect(self, user_id: int, websocket: WebSocket) -> Connection:
         """Connect a user to WebSocket"""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        connection = Connection(user_id, websocket)
+        connection.sender = asyncio.create_task(self._send_loop(connection))
+        self.active_connections.setdefault(user_id, []).append(connection)
+        return connection
 
-    def disconnect(self, user_id: int):
-        """Disconnect a user from WebSocket"""
-        self.active_connections.pop(user_id, None)
+    def disconnect(self, user_id: int, connection: Optional[Connection] = None):
+        """Disconnect one connection of a user, or all of them"""
+        connections = self.active_connections.get(user_id, [])
+        removed = connections if connection is None else [c for c in connections if c is connection]
+        for conn in removed:
+            if conn.sender and conn.sender is not asyncio.current_task():
+                conn.sender.cancel()
+        remaining = [c for c in connections if c not in removed]
+        if remaining:
+            self.active_connections[user_id] = remaining
+        else:
+            self.active_connections.pop(user_id, None)
 
-    async def send_personal_message(self, message: str, user_id: int):
-        """Send a message to a specific user"""
-        if user_id in self.active_connections:
+    async def evict(self, connection: Connection, code: int = 1001):
+        """Drop a dead or too slow connection so the client reconnects"""
+        self.evictions += 1
+        self.disconnect(connection.user_id, connection)
+        try:
+            await connection.websocket.close(code=code)
+        except Exception:
+            # Socket is already gone
+            pass
+
+    async def _send_loop(self, connection: Connection):
+        """Drain a connection's queue so slow clients never block senders"""
+        while True:
+            message = await connection.queue.get()
+            connection.queued_bytes -= len(message)
             try:
-                await self.active_connections[user_id].send_text(message)
+                await connection.websocket.send_text(message)
             except Exception:
                 # Connection might be closed, remove it
-                self.disconnect(user_id)
+                self.disconnect(connection.user_id, connection)
+                return
+            connection.messages_sent += 1
+            connection.bytes_sent += len(message)
+
+    def _enqueue(self, connection: Connection, message: str) -> bool:
+        """Queue a message, evicting the connection if it cannot keep up"""
+        if connection.enqueue(message):
+            return True
+        # The client missed messages; it replays them from the DB on reconnect
+        self.dropped_messages += 1
+        asyncio.create_task(self.evict(connection, code=1013))
+        return False
+
+    async def send_personal_message(self, message: str, user_id: int):
+        """Send a message to a specific user"""
+        for connection in list(self.active_connections.get(user_id, [])):
+            self._enqueue(connection, message)
 
     async def broadcast_to_users(self, message: str, user_ids: List[int]):
         """Send a message to multiple users"""
         for user_id in user_ids:
             await self.send_personal_message(message, user_id)
 
+    def ping(self, connection: Connection):
+        """Queue a heartbeat ping for a connection"""
+        self._enqueue(connection, json.dumps({"type": "ping"}))
+
+    async def replay(self, db: Session, connection: Connection, last_seen_id: int) -> int:
+        """Queue notifications the client missed since last_seen_id.
+
+        The query runs in a worker thread. The connection is already
+        registered, so live messages sent meanwhile are held back and queued
+        after the replayed ones (minus any the replay already covered).
+        """
+        connection.held = []
+        try:
+            missed = await asyncio.to_thread(
+                get_notifications_since, db, connection.user_id, last_seen_id, WS_REPLAY_LIMIT + 1
+            )
+            replayed = missed[:WS_REPLAY_LIMIT]
+            messages = [serialize_notification(notification) for notification in replayed]
+            if len(missed) > WS_REPLAY_LIMIT:
+                # Too far behind for a replay - tell the client to reload instead
+                messages.append(json.dumps({"type": "replay_truncated"}))
+        finally:
+            held, connection.held = connection.held, None
+        replayed_ids = {notification.id for notification in replayed}
+        for message in messages + [m for m in held if json.loads(m).get("id") not in replayed_ids]:
+            if not self._enqueue(connection, message):
+                break
+        return len(replayed)
+
+    async def welcome(self, db: Session, connection: Connection):
+        """Tell a fresh client the newest notification id to resume from"""
+        connection.held = []
+        try:
+            last_id = await asyncio.to_thread(
+                lambda: db.query(func.max(models.Notification.id)).filter(
+                    models.Notification.user_id == connection.user_id
+                ).scalar()
+            )
+        finally:
+            held, connection.held = connection.held, None
+        for message in [json.dumps({"type": "welcome", "last_id": last_id or 0})] + held:
+            if not self._enqueue(connection, message):
+                break
+
+    def connection_count(self) -> int:
+        """Number of open WebSocket connections"""
+        return sum(len(connections) for connections in self.active_connections.values())
+
+    def stats(self) -> dict:
+        """Connection, queue and memory metrics for all connections"""
+        connections = [c for conns in self.active_connections.values() for c in conns]
+        return {
+            "users": len(self.active_connections),
+            "connections": len(connections),
+            "queued_messages": sum(c.queue.qsize() for c in connections),
+            "queued_bytes": sum(c.queued_bytes for c in connections),
+            "evictions": self.evictions,
+            "dropped_messages": self.dropped_messages,
+            "per_connection": [c.stats() for c in connections]
+        }
+
 # Global connection manager instance
 manager = ConnectionManager()
 
+def serialize_notification(notification: models.Notification) -> str:
+    """Serialize a notification for delivery over WebSocket"""
+    return json.dumps({
+        "type": "notification",
+        "id": notification.id,
+        "message": notification.message,
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+        "read": notification.read
+    })
+
+def _insert_unread_counters(db: Session, unread: Dict[int, int], on_conflict=None):
+    """Insert counters ({user_id: unread_count}); where a concurrent transaction
+    inserted one first, set unread_count to on_conflict instead (None keeps theirs)"""
+    insert_counter = dialect_insert(db)
+    if insert_counter is None:
+        db.add_all(models.NotificationCounter(user_id=user_id, unread_count=count) for user_id, count in unread.items())
+        return
+    statement = insert_counter(models.NotificationCounter)
+    if on_conflict is None:
+        statement = statement.on_conflict_do_nothing()
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=[models.NotificationCounter.user_id], set_={"unread_count": on_conflict}
+        )
+    db.execute(statement, [{"user_id": user_id, "unread_count": count} for user_id, count in unread.items()])
+
+def _adjust_unread_counter(db: Session, user_id: int, delta: int):
+    """Add delta to a user's unread counter, creating the row on first use"""
+    updated = db.query(models.NotificationCounter).filter(
+        models.NotificationCounter.user_id == user_id
+    ).update(
+        {models.NotificationCounter.unread_count: models.NotificationCounter.unread_count + delta},
+        synchronize_session=False
+    )
+    if not updated:
+        # First notification activity for this user - seed from the table
+        db.flush()
+        unread = _count_unread(db, user_id)
+        _insert_unread_counters(db, {user_id: unread}, models.NotificationCounter.unread_count + delta)
+
+# Hot reads, built once and only bound per call
+_UNREAD = select(models.Notification).where(
+    models.Notification.user_id == bindparam("user_id"),
+    models.Notification.read == False
+).order_by(models.Notification.id.desc())
+_COUNT_UNREAD = select(func.count(models.Notification.id)).where(
+    models.Notification.user_id == bindparam("user_id"),
+    models.Notification.read == False
+)
+_UNREAD_COUNTER = select(models.NotificationCounter.unread_count).where(
+    models.NotificationCounter.user_id == bindparam("user_id")
+)
+
+def _count_unread(db: Session, user_id: int) -> int:
+    """Count unread notifications with a full scan of the user's rows"""
+    return db.execute(_COUNT_UNREAD, {"user_id": user_id}).scalar() or 0
+
 def create_notification(db: Session, user_id: int, message: str) -> models.Notification:
     """Create a notification in the database"""
     notification = models.Notification(
@@ -43,6 +267,7 @@ def create_notification(db: Session, user_id: int, message: str) -> models.Notif
         read=False
     )
     db.add(notification)
+    _adjust_unread_counter(db, user_id, 1)
     db.commit()
     db.refresh(notification)
     return notification
@@ -53,20 +278,119 @@ async def notify_user(db: Session, user_id: int, message: str):
     notification = create_notification(db, user_id, message)
     
     # Send via WebSocket if user is connected
-    notification_data = {
-        "id": notification.id,
-        "message": message,
-        "created_at": notification.created_at.isoformat(),
-        "read": notification.read
-    }
-    await manager.send_personal_message(json.dumps(notification_data), user_id)
+    await manager.send_personal_message(serialize_notification(notification), user_id)
+
+def _adjust_unread_counters(db: Session, deltas: Dict[int, int]):
+    """_adjust_unread_counter for many users: one UPDATE per distinct delta"""
+    counted = set(db.scalars(select(models.NotificationCounter.user_id).where(
+        models.NotificationCounter.user_id.in_(deltas)
+    )))
+    users_by_delta = defaultdict(list)
+    for user_id in counted:
+        users_by_delta[deltas[user_id]].append(user_id)
+    for delta, user_ids in users_by_delta.items():
+        db.query(models.NotificationCounter).filter(
+            models.NotificationCounter.user_id.in_(user_ids)
+        ).update(
+            {models.NotificationCounter.unread_count: models.NotificationCounter.unread_count + delta},
+            synchronize_session=False
+        )
+    uncounted = [user_id for user_id in deltas if user_id not in counted]
+    if uncounted:
+        # First notification activity for these users - seed from the table
+        db.flush()
+        unread = dict(db.query(models.Notification.user_id, func.count(models.Notification.id)).filter(
+            models.Notification.user_id.in_(uncounted),
+            models.Notification.read == False
+        ).group_by(models.Notification.user_id))
+        # One INSERT per distinct delta, adding it to rows a concurrent transaction seeded first
+        uncounted_by_delta = defaultdict(dict)
+        for user_id in uncounted:
+            uncounted_by_delta[deltas[user_id]][user_id] = unread.get(user_id, 0)
+        for delta, seeds in uncounted_by_delta.items():
+            _insert_unread_counters(db, seeds, models.NotificationCounter.unread_count + delta)
+
+def create_notifications(db: Session, messages: Sequence[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Create notifications for (user_id, message) pairs in one INSERT; returns (user_id, serialized) to deliver"""
+    if not messages:
+        return []
+    created = db.scalars(
+        insert(models.Notification).returning(models.Notification),
+        [{"user_id": user_id, "message": message, "read": False} for user_id, message in messages]
+    ).all()
+    # Serialized before the commit expires them
+    payloads = [(notification.user_id, serialize_notification(notification)) for notification in created]
+    _adjust_unread_counters(db, Counter(user_id for user_id, _ in messages))
+    db.commit()
+    return payloads
+
+def _create_notifications_in_own_session(messages: Sequence[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    import pool_control
+    # A write, so it may use the slots held back for high priority
+    with pool_control.session("high") as db:
+        return create_notifications(db, messages)
+
+async def notify_many(messages: Sequence[Tuple[int, str]]):
+    """Create and send (user_id, message) notifications from a background task, using its own session"""
+    # The INSERT and counter updates run in a worker thread, off the event loop
+    payloads = await asyncio.to_thread(_create_notifications_in_own_session, messages)
+    for user_id, payload in payloads:
+        await manager.send_personal_message(payload, user_id)
+
+async def notify_users(user_ids: List[int], message: str):
+    """Notify several users of the same message from a background task"""
+    await notify_many([(user_id, message) for user_id in user_ids])
 
 def get_unread_notifications(db: Session, user_id: int) -> List[models.Notification]:
-    """Get all unread notifications for a user"""
+    """Get all unread notifications for a user, newest first"""
+    # Ids follow creation order, and ordering by id lets (user_id, id) avoid a sort
+    return db.execute(_UNREAD, {"user_id": user_id}).scalars().all()
+
+def get_notifications_page(
+    db: Session,
+    user_id: int,
+    before_id: Optional[int] = None,
+    limit: int = NOTIFICATIONS_PAGE_SIZE
+) -> Tuple[List[models.Notification], Optional[int]]:
+    """Get one page of a user's notifications, newest first.
+
+    Uses keyset pagination on the notification id: pass the returned cursor
+    as before_id to fetch the next (older) page. The cursor is None on the
+    last page.
+    """
+    limit = max(1, min(limit, MAX_NOTIFICATIONS_PAGE_SIZE))
+    query = db.query(models.Notification).filter(models.Notification.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(models.Notification.id < before_id)
+
+    # Fetch one extra row to know whether an older page exists
+    rows = query.order_by(models.Notification.id.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def get_notifications_since(db: Session, user_id: int, last_seen_id: int, limit: int = WS_REPLAY_LIMIT) -> List[models.Notification]:
+    """Get a user's notifications newer than last_seen_id, oldest first"""
     return db.query(models.Notification).filter(
         models.Notification.user_id == user_id,
-        models.Notification.read == False
-    ).order_by(models.Notification.created_at.desc()).all()
+        models.Notification.id > last_seen_id
+    ).order_by(models.Notification.id).limit(limit).all()
+
+def get_unread_count(db: Session, user_id: int) -> int:
+    """Get the number of unread notifications from the cached counter"""
+    counter = db.execute(_UNREAD_COUNTER, {"user_id": user_id}).scalar()
+    if counter is not None:
+        return counter
+
+    # No counter yet (user predates the counter table) - backfill it once
+    unread = _count_unread(db, user_id)
+    if db.info.get("read_only"):
+        # Read-only sessions (replica or primary) cannot write, so nothing is
+        # backfilled here; the counter is seeded by the user's next
+        # notification write instead (see _adjust_unread_counter)
+        return unread
+    _insert_unread_counters(db, {user_id: unread})
+    db.commit()
+    return unread
 
 def mark_notification_read(db: Session, notification_id: int, user_id: int):
     """Mark a notification as read"""
@@ -75,7 +399,24 @@ def mark_notification_read(db: Session, notification_id: int, user_id: int):
         models.Notification.user_id == user_id
     ).first()
     if notification:
-        notification.read = True
+        if not notification.read:
+            notification.read = True
+            _adjust_unread_counter(db, user_id, -1)
         db.commit()
         return notification
-    return None
\ No newline at end of file
+    return None
+
+def mark_all_notifications_read(db: Session, user_id: int) -> int:
+    """Mark every unread notification of a user as read in a single UPDATE"""
+    updated = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.read == False
+    ).update({models.Notification.read: True}, synchronize_session=False)
+
+    reset = db.query(models.NotificationCounter).filter(
+        models.NotificationCounter.user_id == user_id
+    ).update({models.NotificationCounter.unread_count: 0}, synchronize_session=False)
+    if not reset:
+        _insert_unread_counters(db, {user_id: 0}, 0)
+    db.commit()
+    return updated
\ No newline at end of file
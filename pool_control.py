@@ -0,0 +1,178 @@
+"""
+Admission control for database connections.
+
+Requests take a slot from PoolGate before they get a database session, so
+under a spike they wait at most a small, per-priority budget and then fail
+fast with 503 + Retry-After instead of hanging on the pool's checkout
+timeout. Sessions opened outside a request (WebSocket handshakes,
+notifications, background jobs) go through session() and take a slot too,
+and replica reads have their own gate. Priorities:
+
+- high: sign-in/registration and every write (non-GET) request
+- normal: everything else
+- low: analytics, which is expensive and can be retried later
+
+High-priority requests may use every slot; normal ones leave
+DB_POOL_RESERVED slots free and low ones twice that, so a burst of dashboard
+loads cannot lock users out of logging in or saving.
+
+With DB_POOL_ADAPTIVE=1 the gate admits DB_POOL_MIN sessions at first and
+raises that towards the pool's hard limit (pool_size + max_overflow) while
+requests keep having to wait, lowering it again when the peak usage stays
+well below it. Only the gate's limit moves; the SQLAlchemy pool keeps its
+configured size, and the gate never admits more than it can hand out.
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from sqlalchemy.orm import Session
+import os
+import threading
+import time
+import database
+import metrics
+
+DB_POOL_WAIT_BUDGETS = {
+    "high": float(os.getenv("DB_POOL_WAIT_HIGH_MS", "2000")) / 1000,
+    "normal": float(os.getenv("DB_POOL_WAIT_NORMAL_MS", "1000")) / 1000,
+    "low": float(os.getenv("DB_POOL_WAIT_LOW_MS", "250")) / 1000,
+}
+DB_POOL_RESERVED = int(os.getenv("DB_POOL_RESERVED", "2"))
+DB_POOL_RETRY_AFTER = int(os.getenv("DB_POOL_RETRY_AFTER", "1"))  # seconds
+DB_POOL_ADAPTIVE = os.getenv("DB_POOL_ADAPTIVE", "0").lower() in ("1", "true", "yes")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "4"))
+DB_POOL_ADAPT_INTERVAL = float(os.getenv("DB_POOL_ADAPT_INTERVAL", "10"))  # seconds
+DB_POOL_ADAPT_WAIT_RATIO = float(os.getenv("DB_POOL_ADAPT_WAIT_RATIO", "0.1"))  # share of checkouts that waited
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+PRIORITIES = ("high", "normal", "low")
+HIGH_PRIORITY_PATHS = ("/login", "/register", "/logout", "/token")
+LOW_PRIORITY_PREFIXES = ("/analytics",)
+
+class PoolExhausted(Exception):
+    """No database connection became free within the request's wait budget"""
+
+    def __init__(self, priority: str, retry_after: int = DB_POOL_RETRY_AFTER):
+        super().__init__(f"No database connection available for {priority} priority request")
+        self.priority = priority
+        self.retry_after = retry_after
+
+def route_priority(method: str, path: str) -> str:
+    """Priority of a request for database connections"""
+    if path in HIGH_PRIORITY_PATHS or method not in ("GET", "HEAD"):
+        return "high"
+    if path.startswith(LOW_PRIORITY_PREFIXES):
+        return "low"
+    return "normal"
+
+class PoolGate:
+    """Counts database sessions in use and admits requests by priority"""
+
+    def __init__(
+        self,
+        capacity: Optional[int],
+        reserved: int = DB_POOL_RESERVED,
+        budgets: Optional[Dict[str, float]] = None,
+        adaptive: bool = False,
+        min_capacity: int = DB_POOL_MIN,
+        adapt_interval: float = DB_POOL_ADAPT_INTERVAL
+    ):
+        # capacity None means unlimited (e.g. a single shared in-memory connection)
+        self.max_capacity = capacity
+        self.adaptive = adaptive and capacity is not None
+        self.capacity = min(min_capacity, capacity) if self.adaptive else capacity
+        self.min_capacity = min(min_capacity, capacity) if capacity is not None else None
+        self.reserved = reserved
+        self.budgets = dict(DB_POOL_WAIT_BUDGETS, **(budgets or {}))
+        self.adapt_interval = adapt_interval
+        self.in_use = 0
+        self.wait_seconds = {priority: metrics.Histogram(WAIT_BUCKETS) for priority in PRIORITIES}
+        self.rejections = {priority: 0 for priority in PRIORITIES}
+        self._cond = threading.Condition()
+        self._window_start = time.monotonic()
+        self._window_checkouts = 0
+        self._window_waits = 0
+        self._window_peak = 0
+
+    def _limit(self, priority: str) -> int:
+        held_back = {"high": 0, "normal": self.reserved, "low": 2 * self.reserved}[priority]
+        return max(1, self.capacity - held_back)
+
+    def acquire(self, priority: str = "normal"):
+        """Take a slot, waiting at most the priority's budget"""
+        started = time.monotonic()
+        with self._cond:
+            if self.capacity is not None:
+                deadline = started + self.budgets[priority]
+                while self.in_use >= self._limit(priority):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejections[priority] += 1
+                        self.wait_seconds[priority].observe(time.monotonic() - started)
+                        self._window_checkouts += 1
+                        self._window_waits += 1
+                        if self.adaptive:
+                            self._adapt()
+                        raise PoolExhausted(priority)
+                    self._cond.wait(remaining)
+            self.in_use += 1
+            waited = time.monotonic() - started
+            self.wait_seconds[priority].observe(waited)
+            self._window_checkouts += 1
+            if waited > 0.001:
+                self._window_waits += 1
+            self._window_peak = max(self._window_peak, self.in_use)
+            if self.adaptive:
+                self._adapt()
+
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str = "normal") -> Iterator[None]:
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _adapt(self):
+        """Resize from the last window's waits (called with the lock held)"""
+        now = time.monotonic()
+        if now - self._window_start < self.adapt_interval:
+            return
+        checkouts = max(self._window_checkouts, 1)
+        if self._window_waits / checkouts > DB_POOL_ADAPT_WAIT_RATIO and self.capacity < self.max_capacity:
+            self.capacity = min(self.max_capacity, self.capacity + max(1, self.capacity // 4))
+            self._cond.notify_all()
+        elif self._window_peak < self.capacity // 2 and self.capacity > self.min_capacity:
+            self.capacity -= 1
+        self._window_start = now
+        self._window_checkouts = self._window_waits = self._window_peak = 0
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "rejections": dict(self.rejections),
+        }
+
+def _combined_capacity(engines) -> Optional[int]:
+    capacities = [database.pool_capacity(engine) for engine in engines]
+    return None if None in capacities else sum(capacities)
+
+# Gate in front of the primary's pool
+gate = PoolGate(database.pool_capacity(database.engine), adaptive=DB_POOL_ADAPTIVE)
+# Gate in front of the replicas' pools together (reads are spread over them)
+replica_gate = PoolGate(_combined_capacity(database.replica_engines)) if database.replica_engines else None
+
+@contextmanager
+def session(priority: str = "normal") -> Iterator[Session]:
+    """Primary session that holds a gate slot while it is open"""
+    with gate.slot(priority):
+        db = database.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
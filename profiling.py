@@ -0,0 +1,103 @@
+"""
+SQL profiling.
+
+SQLAlchemy engine events attribute the number of statements and the time
+spent in the database to the HTTP request that issued them. Statements slower
+than SLOW_QUERY_MS are logged with their parameters redacted, and with
+SERVER_TIMING=1 every response carries a Server-Timing header, e.g.
+
+    Server-Timing: db;dur=12.4;desc="7 queries", app;dur=31.0
+
+which browser dev tools show next to the request's network timings. Query
+counts and DB time per route are also exported on /metrics.
+"""
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+import logging
+import os
+import time
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+class QueryStats:
+    """Statements issued on behalf of one request"""
+
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # seconds
+
+# Stats of the request being handled. Sync routes run in a thread pool, but the
+# context (and so this same object) is carried over to the worker thread.
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+def current_stats() -> Optional[QueryStats]:
+    """Query stats of the current request, if any"""
+    return _current_stats.get()
+
+def _redact(parameters) -> str:
+    """Describe bound parameters without revealing their values"""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}=?" for key in parameters) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} parameter sets>"
+        return f"<{len(parameters)} parameters>"
+    return "<parameters>"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s -- parameters: %s",
+            elapsed * 1000, " ".join(statement.split()), _redact(parameters)
+        )
+
+def install(engine):
+    """Attach the profiling hooks to an engine (safe to call more than once)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class QueryProfilingMiddleware:
+    """ASGI middleware collecting per-request query stats"""
+
+    def __init__(self, app, server_timing: Optional[bool] = None):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        server_timing = SERVER_TIMING if self.server_timing is None else self.server_timing
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and server_timing:
+                total_ms = (time.perf_counter() - started) * 1000
+                value = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_stats.reset(token)
+            metrics.request_metrics.observe_db(scope["method"], metrics.route_label(scope), stats.count, stats.duration)
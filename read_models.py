@@ -0,0 +1,74 @@
+"""
+Read-only records returned by crud.
+
+The task list, shared task lists and the analytics page's recent tasks only
+display a handful of columns. Loading full ORM Task objects for them means
+identity-map entries, instance state and instrumented attributes for every
+row. These NamedTuples (tuples, so no per-instance __dict__) are filled
+straight from column-only selects in crud and expose the same attribute names
+the templates already use.
+"""
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+class TaskRow(NamedTuple):
+    """The columns a task list shows"""
+    id: int
+    title: str
+    description: Optional[str]
+    status: str
+    due_date: Optional[date]
+
+class UpdatedTask(NamedTuple):
+    """A task after an update, with the status it had before"""
+    id: int
+    title: str
+    status: str
+    previous_status: str
+
+class UserRef(NamedTuple):
+    """A user as shown next to a shared task"""
+    name: str
+    email: str
+
+class SharedTaskRow(NamedTuple):
+    """A task in the shared lists, with its owner and who it is shared with"""
+    id: int
+    title: str
+    description: Optional[str]
+    status: str
+    due_date: Optional[date]
+    owner: Optional[UserRef] = None
+    shared_with: Tuple[UserRef, ...] = ()
+
+class WeeklyTrendRow(NamedTuple):
+    """Tasks due in one week (numbered as the database's EXTRACT(WEEK) does) with one status"""
+    week: int
+    year: int
+    status: str
+    count: int
+
+class MonthlyStatRow(NamedTuple):
+    """Tasks due in one month with one status"""
+    month: int
+    year: int
+    status: str
+    count: int
+
+class ProductivityRow(NamedTuple):
+    """Task counts for one user"""
+    name: str
+    total_tasks: int
+    completed_tasks: int
+    in_progress_tasks: int
+    pending_tasks: int
+
+class ShareResult(NamedTuple):
+    """Outcome of sharing tasks with users by email"""
+    shared: List[Tuple[int, int]]  # (task_id, user_id) pairs added
+    already_shared: List[Tuple[int, int]]
+    unknown_emails: List[str]
+    not_owned: List[int]  # task ids missing or owned by someone else
+    own_email: bool  # the owner's own email was in the list (skipped)
+    titles: Dict[int, str]  # owned task id -> title
+    users: Dict[int, UserRef]  # user id -> user an email resolved to
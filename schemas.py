@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from datetime import date
-from typing import Optional
+from typing import List, Literal, Optional
 
 class TaskBase(BaseModel):
     """Base schema for Task with common fields"""
@@ -28,6 +28,29 @@ class TaskOut(TaskBase):
     class Config:
         from_attributes = True
 
+class TaskBatchOperation(BaseModel):
+    """One task mutation in a batch (replayed from the offline queue)"""
+    op: Literal["create", "update", "delete"]
+    task_id: Optional[int] = Field(None, description="Task to update or delete")
+    task: Optional[TaskUpdate] = Field(None, description="Fields to create or update")
+
+    @model_validator(mode="after")
+    def check_operation(self):
+        if self.op == "create" and not (self.task and self.task.title):
+            raise ValueError("create needs a task with a title")
+        if self.op != "create" and self.task_id is None:
+            raise ValueError(f"{self.op} needs a task_id")
+        return self
+
+class TaskBatch(BaseModel):
+    """Task mutations applied in order, in one transaction"""
+    operations: List[TaskBatchOperation] = Field(..., max_length=500)
+
+class TaskShareBatch(BaseModel):
+    """Share several tasks with several users at once"""
+    task_ids: List[int] = Field(..., min_length=1, max_length=1000)
+    emails: List[str] = Field(..., min_length=1, max_length=1000)
+
 # User schemas
 class UserBase(BaseModel):
     """Base schema for User"""
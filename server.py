@@ -0,0 +1,204 @@
+"""
+Production server: one worker process per CPU core.
+
+    python server.py --workers 8 --port 8000
+
+With gunicorn installed (pip install gunicorn) the app is imported once in the
+master process and forked into the workers (preload). The worker hooks below
+give each worker its own database connections, and only one worker runs the
+maintenance job. SIGHUP replaces the workers gracefully. With preload the code
+is not re-imported on SIGHUP; to deploy new code, send the master SIGUSR2 and
+then SIGTERM the old master, or run with --no-preload.
+
+Without gunicorn, uvicorn's own process manager is used. You get the same
+workers and socket tuning, and SIGHUP restarts the workers one at a time.
+There is no preload and there are no hooks, so every worker runs the
+background jobs.
+
+Either way, the schema is migrated once before any worker starts (see
+migrate.py), so the workers do not race to create tables.
+
+uvloop and httptools are used when installed (pip install uvloop httptools).
+"""
+from typing import Dict, List, Optional
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import warnings
+
+logger = logging.getLogger(__name__)
+
+APP = "main:app"
+SERVER_BACKEND = os.getenv("SERVER_BACKEND", "auto")  # auto, gunicorn or uvicorn
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))  # 0 = one worker per CPU core
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))  # pending connections the kernel queues
+# Seconds an idle keep-alive connection stays open; behind a load balancer keep
+# it above the balancer's idle timeout so it never reuses a closed connection
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", "5"))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))  # seconds to finish requests on shutdown
+SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", "60"))  # gunicorn restarts a worker silent for this long
+# Recycle a worker after this many requests (0 = never), plus up to the jitter
+# so the workers do not all restart at once
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "0"))
+
+def default_workers() -> int:
+    """One worker per CPU core this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+# Gunicorn worker hooks (run in the master unless noted)
+
+def pre_fork(server, worker):
+    # Exactly one live worker runs the background maintenance job
+    worker.runs_background_jobs = not any(
+        getattr(other, "runs_background_jobs", False) for other in server.WORKERS.values()
+    )
+
+def on_reload(server):
+    # Workers about to be replaced give up the background job to their replacements
+    for worker in server.WORKERS.values():
+        worker.runs_background_jobs = False
+
+def post_fork(server, worker):
+    """In the new worker: drop state inherited from the master"""
+    import database
+    import maintenance
+
+    # Connections opened while preloading must not be shared across processes
+    database.dispose_engines(close=False)
+    if not getattr(worker, "runs_background_jobs", False):
+        maintenance.NOTIFICATION_COMPACTION_INTERVAL = 0
+    server.log.info("Worker %s ready (background jobs: %s)", worker.pid, getattr(worker, "runs_background_jobs", False))
+
+def worker_exit(server, worker):
+    """In the exiting worker, after the app shut down"""
+    import database
+
+    database.dispose_engines()
+
+def worker_abort(worker):
+    """In a worker the master is killing for missing its heartbeat"""
+    worker.log.warning("Worker %s timed out after %ss and was aborted", worker.pid, worker.timeout)
+
+def gunicorn_worker_class():
+    """Uvicorn worker for gunicorn using the fastest available event loop and parser"""
+    try:
+        from uvicorn_worker import UvicornWorker
+    except ImportError:
+        with warnings.catch_warnings():
+            # Deprecated in favour of the uvicorn-worker package, which works the same
+            warnings.simplefilter("ignore", DeprecationWarning)
+            from uvicorn.workers import UvicornWorker
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": event_loop(), "http": http_protocol(), "lifespan": "on"}
+
+    return Worker
+
+def gunicorn_options(args: argparse.Namespace) -> Dict[str, object]:
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": gunicorn_worker_class(),
+        "preload_app": args.preload,
+        "backlog": args.backlog,
+        "keepalive": args.keepalive,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "on_reload": on_reload,
+        "pre_fork": pre_fork,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+        "worker_abort": worker_abort,
+    }
+
+def run_gunicorn(args: argparse.Namespace):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError as e:
+        raise RuntimeError("The gunicorn backend requires gunicorn: pip install gunicorn") from e
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(args).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Application().run()
+
+def run_uvicorn(args: argparse.Namespace):
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=event_loop(),
+        http=http_protocol(),
+        backlog=args.backlog,
+        timeout_keep_alive=args.keepalive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        limit_max_requests_jitter=args.max_requests_jitter,
+    )
+
+def choose_backend(requested: str) -> str:
+    if requested != "auto":
+        return requested
+    return "gunicorn" if importlib.util.find_spec("gunicorn") and os.name == "posix" else "uvicorn"
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["auto", "gunicorn", "uvicorn"], default=SERVER_BACKEND,
+                        help="Process manager (default: gunicorn when installed)")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY or default_workers(),
+                        help="Worker processes (default: one per CPU core)")
+    parser.add_argument("--backlog", type=int, default=SERVER_BACKLOG)
+    parser.add_argument("--keepalive", type=int, default=SERVER_KEEPALIVE, help="Keep-alive timeout in seconds")
+    parser.add_argument("--graceful-timeout", type=int, default=SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--timeout", type=int, default=SERVER_TIMEOUT, help="Worker heartbeat timeout (gunicorn)")
+    parser.add_argument("--max-requests", type=int, default=SERVER_MAX_REQUESTS)
+    parser.add_argument("--max-requests-jitter", type=int, default=SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="Import the app in each worker, so SIGHUP also reloads code (gunicorn)")
+    parser.add_argument("--no-migrate", dest="migrate", action="store_false",
+                        help="Skip creating missing tables and indexes before starting")
+    args = parser.parse_args(argv)
+
+    backend = choose_backend(args.backend)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    logger.info("Starting %s workers with %s (event loop %s, HTTP parser %s)",
+                args.workers, backend, event_loop(), http_protocol())
+    if args.migrate:
+        import migrate
+        migrate.upgrade()
+    # Already done once here, not again in every worker
+    os.environ["DB_AUTO_MIGRATE"] = "0"
+    if backend == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+// Registers the service worker and replays changes queued while offline
+(function () {
+  if (!('serviceWorker' in navigator)) {
+    return;
+  }
+
+  function replay() {
+    if (navigator.serviceWorker.controller) {
+      navigator.serviceWorker.controller.postMessage({type: 'replay'});
+    }
+  }
+
+  function showReplayed(count) {
+    const alert = document.getElementById('notifications-alert');
+    const content = document.getElementById('notifications-content');
+    if (!alert || !content) {
+      return;
+    }
+    content.textContent = `${count} change${count === 1 ? '' : 's'} made offline ${count === 1 ? 'was' : 'were'} saved.`;
+    alert.classList.remove('d-none');
+    setTimeout(function () { alert.classList.add('d-none'); }, 5000);
+  }
+
+  window.addEventListener('load', function () {
+    navigator.serviceWorker.register('/sw.js').catch(function (error) {
+      console.log('SW registration failed: ', error);
+    });
+  });
+
+  // Browsers without Background Sync replay when the page sees the network again
+  window.addEventListener('online', replay);
+
+  navigator.serviceWorker.addEventListener('message', function (event) {
+    if (event.data && event.data.type === 'replayed') {
+      showReplayed(event.data.count);
+    }
+  });
+})();
@@ -1,31 +1,316 @@
-// Simple Service Worker for Task Management System
-const CACHE_NAME = 'task-management-v1';
-const urlsToCache = [
-  '/',
-  '/static/css/bootstrap.min.css',
-  '/static/js/bootstrap.bundle.min.js'
-];
-
-self.addEventListener('install', function(event) {
-  // Perform install steps
+// Service Worker for Task Management System
+//
+// /sw.js fills in this deploy's asset version and hashed asset URLs, so every
+// deploy installs a new worker with new cache names and the old caches are
+// deleted when it activates.
+//
+// - Hashed /static assets and versioned CDN files: cache first (immutable)
+// - Pages: network first, the cached copy only when offline. API GETs:
+//   stale-while-revalidate. Any successful write, login or logout (including
+//   the plain /logout and delete links) clears both, so nobody sees a stale
+//   list or someone else's pages
+// - Task writes made while offline are queued in IndexedDB and replayed in
+//   order when back online, consecutive API writes as one /api/tasks/batch call.
+//   The new task form is multipart (it may carry a file) and is not queued:
+//   offline, the user is told the task was not created
+const VERSION = '__ASSET_VERSION__';
+const PRECACHE_URLS = __PRECACHE_URLS__;
+const CACHE_PREFIX = 'task-management-';
+const ASSET_CACHE = `${CACHE_PREFIX}assets-${VERSION}`;
+const RUNTIME_CACHE = `${CACHE_PREFIX}runtime-${VERSION}`;
+const CURRENT_CACHES = [ASSET_CACHE, RUNTIME_CACHE];
+
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com', 'fonts.googleapis.com', 'fonts.gstatic.com'];
+// Never cached: live, per-request or auth-sensitive URLs
+const NO_CACHE_PATHS = [/^\/ws\//, /^\/metrics$/, /^\/sw\.js$/, /^\/login$/, /^\/register$/, /^\/logout$/,
+                        /^\/tasks\/\d+\/(attachment|delete)/, /^\/notifications/];
+const SESSION_PATHS = [/^\/login$/, /^\/register$/, /^\/logout$/];
+// Writes made by following a link (GET)
+const LINK_WRITE = /^\/tasks\/\d+\/delete$/;
+// Writes that can wait in the offline queue
+const API_WRITE = /^\/api\/tasks(\/\d+)?$/;
+const FORM_WRITE = /^\/tasks\/\d+\/edit$/;
+
+const QUEUE_DB = 'task-management-offline';
+const QUEUE_STORE = 'mutations';
+const SYNC_TAG = 'replay-mutations';
+const BATCH_SIZE = 100;
+
+self.addEventListener('install', event => {
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(function(cache) {
-        return cache.addAll(urlsToCache);
-      })
+    caches.open(ASSET_CACHE)
+      .then(cache => cache.addAll(PRECACHE_URLS))
+      .then(() => self.skipWaiting())
   );
 });
 
-self.addEventListener('fetch', function(event) {
-  event.respondWith(
-    caches.match(event.request)
-      .then(function(response) {
-        // Cache hit - return response
-        if (response) {
-          return response;
-        }
-        return fetch(event.request);
-      }
-    )
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(names => Promise.all(
+        names
+          .filter(name => name.startsWith(CACHE_PREFIX) && !CURRENT_CACHES.includes(name))
+          .map(name => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+      .then(() => replayQueue())
   );
 });
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  const url = new URL(request.url);
+
+  if (url.origin !== self.location.origin) {
+    if (request.method === 'GET' && CDN_HOSTS.includes(url.hostname)) {
+      event.respondWith(cacheFirst(request));
+    }
+    return;
+  }
+  if (request.method !== 'GET') {
+    event.respondWith(sendWrite(request, url));
+    return;
+  }
+  if (SESSION_PATHS.some(pattern => pattern.test(url.pathname)) || LINK_WRITE.test(url.pathname)) {
+    // Logging out, switching user or deleting makes every cached page suspect
+    event.respondWith(caches.delete(RUNTIME_CACHE).then(() => fetch(request)));
+    return;
+  }
+  if (NO_CACHE_PATHS.some(pattern => pattern.test(url.pathname))) {
+    return;
+  }
+  if (url.pathname.startsWith('/static/')) {
+    // Only content-hashed URLs are safe to keep forever
+    if (/\.[0-9a-f]{12}\.[^./]+$/.test(url.pathname)) {
+      event.respondWith(cacheFirst(request));
+    }
+    return;
+  }
+  if (request.mode === 'navigate') {
+    event.respondWith(networkFirst(request));
+  } else if (url.pathname.startsWith('/api/')) {
+    event.respondWith(staleWhileRevalidate(event, request));
+  }
+});
+
+self.addEventListener('sync', event => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(replayQueue());
+  }
+});
+
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'replay') {
+    event.waitUntil(replayQueue());
+  }
+});
+
+async function cacheFirst(request) {
+  const cached = await caches.match(request);
+  if (cached) {
+    return cached;
+  }
+  const response = await fetch(request);
+  if (response.ok || response.type === 'opaque') {
+    const cache = await caches.open(ASSET_CACHE);
+    await cache.put(request, response.clone());
+  }
+  return response;
+}
+
+function cacheable(response) {
+  // Redirects (e.g. to /login) and errors are not worth keeping
+  return response.ok && !response.redirected && response.type !== 'opaqueredirect';
+}
+
+async function networkFirst(request) {
+  // Pages are per user, so one is only served from the cache when offline
+  const cache = await caches.open(RUNTIME_CACHE);
+  try {
+    const response = await fetch(request);
+    if (cacheable(response)) {
+      await cache.put(request, response.clone());
+    }
+    return response;
+  } catch (error) {
+    const cached = await cache.match(request);
+    return cached || offlinePage('You are offline and this page has not been loaded before.', 503);
+  }
+}
+
+async function staleWhileRevalidate(event, request) {
+  const cache = await caches.open(RUNTIME_CACHE);
+  const cached = await cache.match(request);
+  const network = fetch(request).then(async response => {
+    if (cacheable(response)) {
+      await cache.put(request, response.clone());
+    }
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(network.catch(() => undefined));
+    return cached;
+  }
+  try {
+    return await network;
+  } catch (error) {
+    return offlinePage('You are offline and this page has not been loaded before.', 503);
+  }
+}
+
+async function sendWrite(request, url) {
+  const queueable = API_WRITE.test(url.pathname) || FORM_WRITE.test(url.pathname);
+  // Keep a copy: the body can only be read once
+  const body = queueable ? await request.clone().text() : null;
+  const isSession = SESSION_PATHS.some(pattern => pattern.test(url.pathname));
+  try {
+    const response = await fetch(request);
+    if (response.status < 400 || isSession) {
+      // Cached pages may now be stale, or belong to another user
+      await caches.delete(RUNTIME_CACHE);
+    }
+    return response;
+  } catch (error) {
+    const contentType = request.headers.get('Content-Type') || '';
+    if (!queueable || contentType.startsWith('multipart/')) {
+      // File uploads are too big to park in the queue
+      if (request.mode === 'navigate') {
+        return offlinePage('You are offline, so this was not saved. Please try again when you are back online.', 503);
+      }
+      throw error;
+    }
+    await enqueue({
+      method: request.method,
+      path: url.pathname + url.search,
+      contentType,
+      body,
+      queuedAt: Date.now()
+    });
+    if (self.registration.sync) {
+      self.registration.sync.register(SYNC_TAG).catch(() => undefined);
+    }
+    if (API_WRITE.test(url.pathname)) {
+      return new Response(JSON.stringify({queued: true}), {
+        status: 202,
+        headers: {'Content-Type': 'application/json'}
+      });
+    }
+    return offlinePage('You are offline. Your change was saved and will be sent when you are back online.', 202);
+  }
+}
+
+function offlinePage(message, status) {
+  const html = `<!DOCTYPE html><html><head><meta charset="utf-8"><title>Offline</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1"></head>
+    <body style="font-family: sans-serif; padding: 2rem"><p>${message}</p><p><a href="/">Back to tasks</a></p></body></html>`;
+  return new Response(html, {status, headers: {'Content-Type': 'text/html; charset=utf-8'}});
+}
+
+// Offline queue (IndexedDB keeps it across browser restarts)
+
+function openQueue() {
+  return new Promise((resolve, reject) => {
+    const open = indexedDB.open(QUEUE_DB, 1);
+    open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, {keyPath: 'id', autoIncrement: true});
+    open.onsuccess = () => resolve(open.result);
+    open.onerror = () => reject(open.error);
+  });
+}
+
+async function withStore(mode, use) {
+  const db = await openQueue();
+  return new Promise((resolve, reject) => {
+    const transaction = db.transaction(QUEUE_STORE, mode);
+    const request = use(transaction.objectStore(QUEUE_STORE));
+    transaction.oncomplete = () => resolve(request ? request.result : undefined);
+    transaction.onerror = () => reject(transaction.error);
+  });
+}
+
+function enqueue(mutation) {
+  return withStore('readwrite', store => store.add(mutation));
+}
+
+function queuedMutations() {
+  return withStore('readonly', store => store.getAll());
+}
+
+function dequeue(ids) {
+  return withStore('readwrite', store => ids.forEach(id => store.delete(id)));
+}
+
+function toBatchOperation(mutation) {
+  const match = mutation.path.match(/^\/api\/tasks(?:\/(\d+))?$/);
+  const taskId = match && match[1] ? parseInt(match[1], 10) : null;
+  const task = mutation.body ? JSON.parse(mutation.body) : null;
+  if (mutation.method === 'POST' && taskId === null) {
+    return {op: 'create', task};
+  }
+  if (mutation.method === 'PUT' && taskId !== null) {
+    return {op: 'update', task_id: taskId, task};
+  }
+  if (mutation.method === 'DELETE' && taskId !== null) {
+    return {op: 'delete', task_id: taskId};
+  }
+  return null;
+}
+
+let replaying = null;
+
+function replayQueue() {
+  // One replay at a time, however many triggers fire
+  if (!replaying) {
+    replaying = replayAll().finally(() => { replaying = null; });
+  }
+  return replaying;
+}
+
+async function replayAll() {
+  const mutations = await queuedMutations();
+  let sent = 0;
+  let i = 0;
+  while (i < mutations.length) {
+    const batch = [];
+    while (i < mutations.length && batch.length < BATCH_SIZE && toBatchOperation(mutations[i])) {
+      batch.push(mutations[i]);
+      i++;
+    }
+    try {
+      if (batch.length) {
+        const response = await fetch('/api/tasks/batch', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify({operations: batch.map(toBatchOperation)})
+        });
+        if (response.status >= 500 || response.status === 401) {
+          break;  // try again on the next trigger (or once logged in again)
+        }
+        await dequeue(batch.map(mutation => mutation.id));
+        sent += batch.length;
+      } else {
+        // Form posts are replayed as they were sent, with the user's cookies
+        const mutation = mutations[i];
+        const response = await fetch(mutation.path, {
+          method: mutation.method,
+          headers: mutation.contentType ? {'Content-Type': mutation.contentType} : {},
+          body: mutation.body,
+          credentials: 'same-origin',
+          redirect: 'manual'
+        });
+        if (response.status >= 500) {
+          break;
+        }
+        await dequeue([mutation.id]);
+        sent += 1;
+        i++;
+      }
+    } catch (error) {
+      break;  // still offline
+    }
+  }
+  if (sent) {
+    await caches.delete(RUNTIME_CACHE);
+    const clients = await self.clients.matchAll({type: 'window'});
+    clients.forEach(client => client.postMessage({type: 'replayed', count: sent}));
+  }
+}
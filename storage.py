@@ -0,0 +1,366 @@
+"""
+Attachment storage.
+
+Request bodies are counted as they arrive (UploadSizeLimitMiddleware): once
+one grows past MAX_UPLOAD_SIZE plus UPLOAD_FORM_OVERHEAD it is answered with
+413 and the rest is never read, with or without a Content-Length. Form fields
+other than files are limited to UPLOAD_FORM_OVERHEAD each.
+
+Uploads are streamed in fixed-size chunks on a worker thread so a large file
+never blocks the event loop. Each file is spooled to a temporary file first
+and only committed to the storage backend once it is complete, and the copy
+is aborted as soon as it exceeds MAX_UPLOAD_SIZE.
+
+Files are content-addressed: the SHA-256 of the upload is computed while
+streaming and the file is stored once under the key <digest[:2]>/<digest>.
+Which tasks use a blob is tracked in the database. Uploading the same content
+again reuses the existing file only if it can take a reference on it first
+(crud.claim_blob); a blob's file is deleted only while its row shows no
+references (crud.collect_blob).
+
+Where the bytes live is decided by the backend, selected with STORAGE_BACKEND:
+
+- "local" (default): files under UPLOAD_DIR on the app server's disk
+- "s3": any S3-compatible object store (AWS S3, MinIO, ...), configured with
+  S3_BUCKET, S3_ENDPOINT_URL, S3_REGION and S3_PREFIX. Needs boto3.
+"""
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(25 * 1024 * 1024)))  # bytes
+# Room for the other form fields sent alongside an attachment
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# S3-compatible backend settings
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+S3_PREFIX = os.getenv("S3_PREFIX", "attachments/")
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))  # S3 minimum is 5 MB
+PRESIGNED_URL_EXPIRY = int(os.getenv("PRESIGNED_URL_EXPIRY", "300"))  # seconds
+
+# When set (e.g. "/protected-uploads/"), downloads are handed to the front-end
+# web server with X-Accel-Redirect so it can sendfile() them directly
+ATTACHMENT_ACCEL_PREFIX = os.getenv("ATTACHMENT_ACCEL_PREFIX", "")
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured maximum size"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Attachment exceeds the maximum size of {max_size // (1024 * 1024)} MB")
+        self.max_size = max_size
+
+class StoredBlob(NamedTuple):
+    """Result of storing an upload"""
+    digest: str
+    size: int
+    deduplicated: bool  # True if an existing blob was reused (and already referenced)
+
+def blob_key(digest: str) -> str:
+    """Storage key of a blob"""
+    return f"{digest[:2]}/{digest}"
+
+def content_disposition(filename: str) -> str:
+    """Content-Disposition header value that survives non-ASCII filenames"""
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+class StorageBackend:
+    """Interface implemented by attachment storage drivers"""
+
+    def spool_dir(self) -> str:
+        """Directory where uploads are spooled before being committed"""
+        return tempfile.gettempdir()
+
+    def put_file(self, key: str, path: str, size: int):
+        """Commit a complete local file under key (the file may be moved away)"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def open_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the bytes of key (optionally only start..end inclusive) in chunks"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def presigned_url(self, key: str, filename: Optional[str] = None, content_type: Optional[str] = None,
+                      expires_in: int = PRESIGNED_URL_EXPIRY) -> Optional[str]:
+        """Time-limited URL clients can download from directly, if supported"""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path on this machine's disk, if the backend keeps files locally"""
+        return None
+
+class LocalStorage(StorageBackend):
+    """Files on the local filesystem under a root directory"""
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = str(root)
+
+    def spool_dir(self) -> str:
+        # Same filesystem as the final location, so commits are atomic renames
+        os.makedirs(self.root, exist_ok=True)
+        return self.root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key: str, path: str, size: int):
+        final_path = self.local_path(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # Readers only ever see complete files
+        os.replace(path, final_path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def open_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(self.local_path(key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(UPLOAD_CHUNK_SIZE if remaining is None else min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, Ceph, R2, ...)"""
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        prefix: str = S3_PREFIX,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        multipart_threshold: int = S3_MULTIPART_THRESHOLD,
+        part_size: int = S3_PART_SIZE,
+        client=None
+    ):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put_file(self, key: str, path: str, size: int):
+        object_key = self._object_key(key)
+        if size <= self.multipart_threshold:
+            with open(path, "rb") as f:
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=f)
+        else:
+            self._multipart_upload(object_key, path)
+
+    def _multipart_upload(self, object_key: str, path: str):
+        """Upload a large file in parts, aborting the upload on failure"""
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=object_key)["UploadId"]
+        parts = []
+        try:
+            with open(path, "rb") as f:
+                part_number = 1
+                while True:
+                    data = f.read(self.part_size)
+                    if not data:
+                        break
+                    response = self.client.upload_part(
+                        Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                        PartNumber=part_number, Body=data
+                    )
+                    parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+                    part_number += 1
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            # Don't leave orphaned parts behind (they are billed)
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            response = getattr(e, "response", None) or {}
+            if response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+                return False
+            raise
+        return True
+
+    def open_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": self._object_key(key)}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**params)["Body"]
+        try:
+            for chunk in body.iter_chunks(UPLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def presigned_url(self, key: str, filename: Optional[str] = None, content_type: Optional[str] = None,
+                      expires_in: int = PRESIGNED_URL_EXPIRY) -> str:
+        params = {"Bucket": self.bucket, "Key": self._object_key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        if content_type:
+            params["ResponseContentType"] = content_type
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+_backend: Optional[StorageBackend] = None
+
+def get_backend() -> StorageBackend:
+    """Get the configured storage backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND == "s3":
+            _backend = S3Storage()
+        elif STORAGE_BACKEND == "local":
+            _backend = LocalStorage(UPLOAD_DIR)
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _backend
+
+def set_backend(backend: Optional[StorageBackend]):
+    """Replace the storage backend (None re-reads the configuration)"""
+    global _backend
+    _backend = backend
+
+def _write_stream(source: BinaryIO, tmp_path: str, max_size: int) -> Tuple[int, str]:
+    """Copy source to tmp_path chunk by chunk, returning its size and SHA-256"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, "wb") as out:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLarge(max_size)
+            digest.update(chunk)
+            out.write(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    return size, digest.hexdigest()
+
+def _store_stream(source: BinaryIO, backend: StorageBackend, max_size: int,
+                  claim: Optional[Callable[[str], bool]] = None) -> StoredBlob:
+    """Stream source into content-addressed storage"""
+    tmp_path = os.path.join(backend.spool_dir(), f".tmp-{uuid.uuid4().hex}")
+    try:
+        size, digest = _write_stream(source, tmp_path, max_size)
+        # Whether the file exists is not enough: it may be garbage collected
+        # before the new reference commits. Only a claimed reference is safe.
+        if claim is not None and claim(digest):
+            return StoredBlob(digest, size, True)
+        backend.put_file(blob_key(digest), tmp_path, size)
+        return StoredBlob(digest, size, False)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+async def store_upload(upload: UploadFile, backend: Optional[StorageBackend] = None, max_size: Optional[int] = None,
+                       claim: Optional[Callable[[str], bool]] = None) -> StoredBlob:
+    """Stream an uploaded file into storage without blocking the event loop.
+
+    claim(digest) runs on the worker thread once the digest is known and
+    returns True if it took a reference on an existing blob (see
+    crud.claim_blob); the put is then skipped. Otherwise the file is put.
+    """
+    return await asyncio.to_thread(
+        _store_stream, upload.file, backend or get_backend(), max_size or MAX_UPLOAD_SIZE, claim
+    )
+
+def delete_blob(digest: str, backend: Optional[StorageBackend] = None):
+    """Remove a blob that is no longer referenced by any task"""
+    (backend or get_backend()).delete(blob_key(digest))
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware answering 413 as soon as a request body is too large"""
+
+    def __init__(self, app, max_upload_size: int = MAX_UPLOAD_SIZE, form_overhead: int = UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_upload_size = max_upload_size
+        self.max_body_size = max_upload_size + form_overhead
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        too_large = JSONResponse({"detail": str(UploadTooLarge(self.max_upload_size))}, status_code=413)
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await too_large(scope, receive, send)
+            return
+
+        # Chunked bodies have no Content-Length; count the bytes as they arrive
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise UploadTooLarge(self.max_upload_size)
+            return message
+
+        async def limited_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Whatever the app made of the aborted body (usually a 400), send 413 instead
+                if not response_started:
+                    response_started = True
+                    await too_large(scope, receive, send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLarge:
+            if not exceeded:
+                raise
+            if not response_started:
+                await too_large(scope, receive, send)
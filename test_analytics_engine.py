@@ -0,0 +1,129 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from benchmarks import datagen
+from database import Base
+import os
+import crud
+import models
+import schemas
+import pytest
+
+pytest.importorskip("numpy")
+import analytics_engine
+
+# An empty PostgreSQL database to compare the snapshot with PostgreSQL's SQL as well
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(TEST_DATABASE_URL or f"sqlite:///{tmp_path / 'analytics.db'}")
+    engine.seeded = datagen.generate(engine, users=20, tasks=3000, notifications=0, share_rate=0.0)
+    yield engine
+    if TEST_DATABASE_URL:
+        # Leave the database empty for the next test
+        Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+@pytest.fixture
+def Session(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def assert_matches_sql(snapshot, db, user_id):
+    for owner in (None, user_id):
+        assert snapshot.overview(owner) == crud.get_analytics_overview(db, owner)
+        assert snapshot.user_productivity(owner) == sorted(tuple(row) for row in crud.get_user_productivity(db, owner))
+        assert sorted(snapshot.monthly_stats(owner)) == sorted(
+            (int(row.month), int(row.year), row.status, row.count) for row in crud.get_monthly_stats(db, owner)
+        )
+        assert sorted(snapshot.weekly_trends(owner)) == sorted(weekly_rows(db, owner))
+
+def weekly_rows(db, user_id):
+    return [(int(row.week), int(row.year), row.status, row.count) for row in crud.get_weekly_trends(db, user_id)]
+
+def test_snapshot_matches_sql(engine, Session):
+    """Test vectorized analytics agree with the SQL queries"""
+    snapshot = analytics_engine.TaskSnapshot(engine, chunk_size=1000)
+    snapshot.load()
+    assert snapshot.stats()["tasks"] == 3000
+    db = Session()
+    try:
+        assert_matches_sql(snapshot, db, engine.seeded["first_user_id"])
+    finally:
+        db.close()
+
+def test_snapshot_follows_committed_writes(engine, Session):
+    """Test creates, owner-scoped updates and deletes reach the snapshot incrementally"""
+    snapshot = analytics_engine.TaskSnapshot(engine)
+    snapshot.load()
+    analytics_engine.track_task_writes(Session, snapshot)
+    user_id = engine.seeded["first_user_id"]
+
+    db = Session()
+    try:
+        task = crud.create_task(db, schemas.TaskCreate(title="New", due_date=date.today() - timedelta(days=1)))
+        task.owner_id = user_id
+        db.commit()
+        crud.update_owned_task(db, task.id, user_id, schemas.TaskUpdate(status="Completed"))
+        victim = db.query(models.Task).filter(models.Task.owner_id == user_id).first()
+        crud.delete_task(db, victim.id)
+
+        # Rolled back writes never reach the snapshot
+        db.query(models.Task).filter(models.Task.id == task.id).update({"status": "Pending"})
+        db.rollback()
+
+        assert snapshot.stats()["pending"] == 2
+        snapshot.apply_pending()
+        assert snapshot.stats()["pending"] == 0
+        assert_matches_sql(snapshot, db, user_id)
+
+        # A bulk write without ids forces a rebuild on the next refresh
+        db.query(models.Task).filter(models.Task.status == "Pending").update({"status": "In Progress"})
+        db.commit()
+        snapshot.refresh()
+        assert_matches_sql(snapshot, db, user_id)
+    finally:
+        db.close()
+
+def test_weekly_trends_number_weeks_like_sql(engine, Session, monkeypatch):
+    """Test weeks and years around New Year match the database's SQL"""
+    dues = [date(2024, 12, 29), date(2024, 12, 30), date(2024, 12, 31), date(2025, 1, 1),
+            date(2025, 1, 5), date(2025, 1, 6), date(2026, 1, 1), date(2026, 1, 4),
+            date(2026, 1, 5), date(2026, 10, 12), date(2026, 10, 18)]
+    db = Session()
+    try:
+        user = models.User(name="Weeks", email="weeks@example.com", password="x")
+        db.add(user)
+        db.commit()
+        for i, due in enumerate(dues):
+            task = crud.create_task(db, schemas.TaskCreate(title=f"Due {due}", due_date=due))
+            task.owner_id, task.status = user.id, ("Pending", "Completed")[i % 2]
+        db.commit()
+        snapshot = analytics_engine.TaskSnapshot(engine)
+        snapshot.load()
+
+        for today in (date(2025, 1, 10), date(2026, 1, 10), date(2026, 10, 18)):
+            class Today(datetime):
+                @classmethod
+                def now(cls, tz=None):
+                    return cls.combine(today, datetime.min.time())
+
+            monkeypatch.setattr(crud, "datetime", Today)
+            expected = weekly_rows(db, user.id)
+            assert expected
+            assert sorted(snapshot.weekly_trends(user.id, today=today)) == sorted(expected)
+        if engine.dialect.name == "sqlite":
+            # %W: 2024-12-30 is in week 53 of 2024 (ISO: week 1), 2025-01-01 in week 0
+            assert (53, 2024, "Completed", 1) in snapshot.weekly_trends(user.id, today=date(2025, 1, 10))
+            assert (0, 2025, "Pending", 1) in snapshot.weekly_trends(user.id, today=date(2025, 1, 10))
+    finally:
+        db.close()
+
+def test_weekly_trends_use_iso_weeks_on_postgresql(engine, monkeypatch):
+    """Test the snapshot numbers weeks like PostgreSQL's EXTRACT(WEEK), with the calendar year"""
+    snapshot = analytics_engine.TaskSnapshot(engine)
+    snapshot.load()
+    monkeypatch.setattr(engine.dialect, "name", "postgresql")
+    days = [date(2024, 12, 29) + timedelta(days=i) for i in range(900)]
+    weeks = snapshot._week_numbers(snapshot.np.array([snapshot._days(day) for day in days]))
+    assert weeks.tolist() == [day.isocalendar()[1] for day in days]
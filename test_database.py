@@ -0,0 +1,226 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from database import Base
+import threading
+import database
+import models
+import pytest
+
+@pytest.fixture
+def sqlite_file(tmp_path):
+    return f"sqlite:///{tmp_path / 'app.db'}"
+
+def test_production_profile_applies_pragmas(sqlite_file):
+    """Test every new SQLite connection gets the production pragmas"""
+    engine = database.create_database_engine(sqlite_file, profile="production")
+    with engine.connect() as conn:
+        pragmas = {
+            name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout", "temp_store")
+        }
+    assert pragmas == {
+        "journal_mode": "wal",
+        "synchronous": 1,  # NORMAL
+        "mmap_size": database.SQLITE_MMAP_SIZE,
+        "cache_size": database.SQLITE_CACHE_SIZE,
+        "busy_timeout": database.SQLITE_BUSY_TIMEOUT,
+        "temp_store": 2,  # MEMORY
+    }
+    assert isinstance(engine.pool, QueuePool)
+    engine.dispose()
+
+def test_memory_database_shares_one_connection():
+    """Test an in-memory database is the same database across checkouts"""
+    engine = database.create_database_engine("sqlite://")
+    assert isinstance(engine.pool, StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM tasks").scalar() == 0
+
+def test_serialized_writes_survive_bursts(sqlite_file):
+    """Test concurrent read-modify-write sessions queue up instead of failing"""
+    engine = database.create_database_engine(sqlite_file, profile="production", serialize_writes=True)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    database.serialize_sqlite_writes(Session)
+    errors = []
+
+    def writer(n):
+        for i in range(20):
+            db = Session()
+            try:
+                db.query(models.Task).count()
+                task = models.Task(title=f"task {n}-{i}", status="Pending")
+                db.add(task)
+                db.commit()
+                db.query(models.Task).filter(models.Task.id == task.id).update({"status": "Completed"})
+                db.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db = Session()
+    assert db.query(models.Task).filter(models.Task.status == "Completed").count() == 160
+    db.close()
+    engine.dispose()
+
+def test_write_lock_timeout_is_a_busy_database(sqlite_file, monkeypatch):
+    """Test waiting too long for the write lock raises the error the app turns into a 503"""
+    from sqlalchemy import exc
+    import main
+
+    engine = database.create_database_engine(sqlite_file, serialize_writes=True)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    database.serialize_sqlite_writes(Session)
+    monkeypatch.setattr(database, "SQLITE_WRITE_LOCK_TIMEOUT", 0.05)
+
+    db = Session()
+    db.add(models.User(name="Late", email="late@example.com", password="x"))
+    with database._sqlite_write_lock:
+        with pytest.raises(exc.TimeoutError):
+            db.commit()
+    db.close()
+    engine.dispose()
+    assert main.app.exception_handlers[exc.TimeoutError] is main.database_busy
+
+def test_write_lock_released_on_rollback(sqlite_file):
+    """Test a failed write does not leave the write lock held"""
+    engine = database.create_database_engine(sqlite_file, serialize_writes=True)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    database.serialize_sqlite_writes(Session)
+
+    db = Session()
+    db.add_all([
+        models.User(name="A", email="same@example.com", password="x"),
+        models.User(name="B", email="same@example.com", password="x"),
+    ])
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+    db.close()
+    assert not database._sqlite_write_lock.locked()
+
+    db = Session()
+    db.add(models.User(name="C", email="c@example.com", password="x"))
+    db.commit()
+    assert not database._sqlite_write_lock.locked()
+    db.close()
+    engine.dispose()
+
+def _engine_with_marker(url, marker):
+    """SQLite engine whose database identifies itself"""
+    engine = database.create_database_engine(url)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE whoami (name TEXT)")
+        conn.exec_driver_sql(f"INSERT INTO whoami VALUES ('{marker}')")
+    return engine
+
+def _served_by(router, use_primary=False):
+    with database.read_session(use_primary, router=router) as db:
+        return db.connection().exec_driver_sql("SELECT name FROM whoami").scalar()
+
+def test_reads_round_robin_across_replicas(tmp_path):
+    """Test read sessions alternate between replicas, and can be pinned to the primary"""
+    primary = _engine_with_marker(f"sqlite:///{tmp_path / 'primary.db'}", "primary")
+    replicas = [_engine_with_marker(f"sqlite:///{tmp_path / f'r{i}.db'}", f"replica{i}") for i in range(2)]
+    router = database.ReplicaRouter(primary, replicas)
+
+    assert sorted(_served_by(router) for _ in range(4)) == ["replica0", "replica0", "replica1", "replica1"]
+    assert _served_by(router, use_primary=True) == "primary"
+
+def test_unavailable_replica_falls_back(tmp_path):
+    """Test a replica that cannot be reached is skipped, then the primary serves reads"""
+    primary = _engine_with_marker(f"sqlite:///{tmp_path / 'primary.db'}", "primary")
+    healthy = _engine_with_marker(f"sqlite:///{tmp_path / 'healthy.db'}", "healthy")
+    broken = database.create_database_engine(f"sqlite:///{tmp_path / 'missing' / 'broken.db'}")
+
+    router = database.ReplicaRouter(primary, [broken, healthy])
+    assert [_served_by(router) for _ in range(3)] == ["healthy"] * 3
+    assert router.healthy_replicas() == [healthy]
+
+    router = database.ReplicaRouter(primary, [broken])
+    assert _served_by(router) == "primary"
+
+def test_read_session_rejects_writes():
+    """Test read-only sessions refuse to flush changes"""
+    engine = database.create_database_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with database.read_session(router=database.ReplicaRouter(engine)) as db:
+        db.add(models.Task(title="Nope"))
+        with pytest.raises(RuntimeError):
+            db.flush()
+
+def test_writes_pin_reads_to_primary():
+    """Test a response to a request that wrote sets the read-your-writes cookie"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    engine = database.create_database_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    database.track_writes(Session)
+
+    app = FastAPI()
+    app.add_middleware(database.ReadYourWritesMiddleware, sticky_seconds=30)
+
+    @app.get("/read")
+    def read():
+        db = Session()
+        count = db.query(models.Task).count()
+        db.close()
+        return {"count": count}
+
+    @app.post("/write")
+    def write():
+        db = Session()
+        db.add(models.Task(title="Written"))
+        db.commit()
+        db.close()
+        return {}
+
+    client = TestClient(app)
+    assert database.READ_PRIMARY_COOKIE not in client.get("/read").cookies
+    response = client.post("/write")
+    assert database.reads_pinned_to_primary(response.cookies)
+    assert not database.reads_pinned_to_primary({database.READ_PRIMARY_COOKIE: "0"})
+
+def test_migrate_creates_missing_tables_and_indexes(sqlite_file):
+    """Test migrate adds new tables and indexes added to existing tables, once"""
+    import migrate
+
+    engine = database.create_database_engine(sqlite_file)
+    # An older schema: no notification counters, tasks without the owner index
+    models.Task.__table__.create(bind=engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_tasks_owner_id")
+    models.User.__table__.create(bind=engine)
+
+    created = migrate.upgrade(engine)
+    assert "notification_counters" in created
+    assert "ix_tasks_owner_id" in created
+    assert "tasks" not in created and "users" not in created
+    assert migrate.upgrade(engine) == []
+    engine.dispose()
+
+def test_importing_the_app_does_not_touch_the_database():
+    """Test main imports without a reachable database, and without jose/passlib"""
+    import os
+    import subprocess
+    import sys
+
+    code = "import main, sys; sys.exit(' '.join({'jose', 'passlib'} & set(sys.modules)) or None)"
+    # SQLite cannot open a file in a missing directory, so any connection would fail
+    env = dict(os.environ, DATABASE_URL="sqlite:////nonexistent/dir/app.db")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr[-2000:]
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+import group_commit
+import models
+import schemas
+import pytest
+
+@pytest.fixture
+def writer(tmp_path):
+    """Writer committing to a fresh SQLite file, with a generous batching window"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'writes.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    writer = group_commit.GroupCommitWriter(
+        sessionmaker(autocommit=False, autoflush=False, bind=engine), window_ms=50
+    )
+    writer.start()
+    yield writer
+    writer.stop()
+    engine.dispose()
+
+def test_concurrent_creates_share_commits(writer):
+    """Test concurrent creates are committed together and each caller gets its own row"""
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        tasks = list(pool.map(
+            lambda i: writer.create_task(schemas.TaskCreate(title=f"Task {i}")), range(20)
+        ))
+
+    assert [task.title for task in tasks] == [f"Task {i}" for i in range(20)]
+    assert len({task.id for task in tasks}) == 20
+    assert all(task.status == "Pending" for task in tasks)
+    assert writer.writes == 20
+    assert writer.batches < 20
+
+def test_update_returns_row_or_none(writer):
+    """Test updates go through the writer and a missing task yields None"""
+    task = writer.create_task(schemas.TaskCreate(title="Draft"))
+    updated = writer.update_task(task.id, schemas.TaskUpdate(status="Completed"))
+    assert (updated.id, updated.title, updated.status) == (task.id, "Draft", "Completed")
+    assert writer.update_task(task.id + 1000, schemas.TaskUpdate(status="Completed")) is None
+
+def test_failing_write_only_fails_its_caller(writer):
+    """Test a write that violates a constraint does not take its batch down"""
+    def broken_insert(db):
+        db.add(models.Task(title=None))
+        db.flush()
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        good = [pool.submit(writer.create_task, schemas.TaskCreate(title=f"Task {i}")) for i in range(9)]
+        bad = writer.submit(broken_insert)
+        results = [future.result() for future in good]
+
+    with pytest.raises(Exception):
+        bad.result()
+    assert len({task.id for task in results}) == 9
+
+def test_submitting_a_write_marks_the_request(writer):
+    """Test a request whose write goes to the writer thread still pins its reads to the primary"""
+    import database
+
+    state = database._RequestWrites()
+    token = database._request_writes.set(state)
+    try:
+        writer.create_task(schemas.TaskCreate(title="Through the writer"))
+    finally:
+        database._request_writes.reset(token)
+    assert state.wrote
+
+def test_unexpected_failure_resolves_every_future(writer):
+    """Test a failure outside the per-write handling fails the callers instead of hanging them"""
+    class Interrupted(BaseException):
+        pass
+
+    def broken_session_factory(**kwargs):
+        raise Interrupted()
+
+    working_factory, writer.session_factory = writer.session_factory, broken_session_factory
+    futures = [writer.submit(group_commit._create_task, {"title": f"Lost {i}"}) for i in range(3)]
+    for future in futures:
+        assert isinstance(future.exception(timeout=5), Interrupted)
+
+    # The writer thread survives and keeps committing
+    writer.session_factory = working_factory
+    assert writer.create_task(schemas.TaskCreate(title="After")).title == "After"
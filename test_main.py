@@ -1,9 +1,39 @@
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
 from main import app
+from database import SessionLocal
+import asyncio
+import io
+import json
+import shutil
+import subprocess
+import uuid
+from fastapi import UploadFile
+import auth
+import crud
+import models
+import notifications
+import profiling
+import schemas
+import storage
 import pytest
 
+# The schema is created in a temporary database by conftest.py
 client = TestClient(app)
 
+def create_user(db, name="Test User"):
+    """Create a user with a unique email directly in the database"""
+    user = models.User(name=name, email=f"{uuid.uuid4().hex}@example.com", password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+def client_for(user):
+    """Test client logged in as the given user"""
+    logged_in = TestClient(app)
+    logged_in.cookies.set("access_token", auth.create_access_token({"sub": user.email}))
+    return logged_in
+
 def test_home_page():
     """Test that the home page loads successfully"""
     response = client.get("/")
@@ -71,6 +101,28 @@ def test_filter_tasks_by_status_api():
     tasks = filter_response.json()
     assert all(task["status"] == "Completed" for task in tasks)
 
+def test_metrics_endpoint():
+    """Test per-route latency histograms and gauges are exposed for Prometheus"""
+    client.get("/api/tasks/999999")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'taskapp_http_requests_total{method="GET",route="/api/tasks/{task_id}",status="404"}' in body
+    assert 'taskapp_http_request_duration_seconds_bucket{method="GET",route="/api/tasks/{task_id}",le="+Inf"}' in body
+    assert "taskapp_http_requests_in_flight" in body
+    assert "taskapp_db_pool_info" in body
+    assert "taskapp_websocket_connections" in body
+
+def test_server_timing_reports_query_count(monkeypatch, caplog):
+    """Test DB statements are attributed to the request and slow ones logged"""
+    monkeypatch.setattr(profiling, "SERVER_TIMING", True)
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+    response = client.get("/api/tasks?q=secret-search-term")
+    assert response.status_code == 200
+    assert 'desc="1 queries"' in response.headers["server-timing"]
+    assert "Slow query" in caplog.text
+    assert "secret-search-term" not in caplog.text
+
 def test_register_page():
     """Test that the register page loads"""
     response = client.get("/register")
@@ -89,5 +141,491 @@ def test_new_task_page():
     assert response.status_code == 200
     assert "Create" in response.text or "Task" in response.text
 
+def test_websocket_welcome_and_replay():
+    """Test a reconnecting WebSocket client gets the notifications it missed"""
+    db = SessionLocal()
+    try:
+        user = create_user(db, "Socket User")
+        first_id = notifications.create_notification(db, user.id, "Missed while offline").id
+        second_id = notifications.create_notification(db, user.id, "Also missed").id
+        user_id, user_client = user.id, client_for(user)
+    finally:
+        db.close()
+
+    with user_client.websocket_connect(f"/ws/{user_id}") as ws:
+        assert ws.receive_json() == {"type": "welcome", "last_id": second_id}
+
+    with user_client.websocket_connect(f"/ws/{user_id}?last_seen_id={first_id - 1}") as ws:
+        assert ws.receive_json()["message"] == "Missed while offline"
+        assert ws.receive_json()["id"] == second_id
+
+def test_websocket_requires_matching_login():
+    """Test a socket is refused without a login or for another user's id"""
+    db = SessionLocal()
+    try:
+        user = create_user(db, "Socket Owner")
+        other = create_user(db, "Socket Snooper")
+        user_id, other_client = user.id, client_for(other)
+    finally:
+        db.close()
+
+    for socket_client in (TestClient(app), other_client):
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            with socket_client.websocket_connect(f"/ws/{user_id}") as ws:
+                ws.receive_json()
+        assert excinfo.value.code == 1008
+    assert user_id not in notifications.manager.active_connections
+
+def test_websocket_idle_eviction(monkeypatch):
+    """Test the server pings and evicts clients that never answer"""
+    monkeypatch.setattr(notifications, "WS_PING_INTERVAL", 0.05)
+    monkeypatch.setattr(notifications, "WS_IDLE_TIMEOUT", 0.2)
+    db = SessionLocal()
+    try:
+        user = create_user(db, "Silent User")
+        user_id, user_client = user.id, client_for(user)
+    finally:
+        db.close()
+
+    with user_client.websocket_connect(f"/ws/{user_id}") as ws:
+        assert ws.receive_json()["type"] == "welcome"
+        assert ws.receive_json()["type"] == "ping"
+        with pytest.raises(WebSocketDisconnect):
+            while True:
+                ws.receive_json()
+    assert user_id not in notifications.manager.active_connections
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    """Keep attachments in a temporary directory instead of ./uploads"""
+    previous = storage._backend
+    storage.set_backend(storage.LocalStorage(tmp_path))
+    yield tmp_path
+    storage.set_backend(previous)
+
+def test_attachment_download_authorization_range_and_caching(upload_dir):
+    """Test attachment downloads are access checked, resumable and cacheable"""
+    data = b"0123456789" * 100
+    db = SessionLocal()
+    try:
+        owner = create_user(db, "Owner")
+        stranger = create_user(db, "Stranger")
+        blob = asyncio.run(storage.store_upload(UploadFile(file=io.BytesIO(data), filename="spec.txt")))
+        task = crud.create_task(db, schemas.TaskCreate(title="With attachment"))
+        task.owner_id = owner.id
+        crud.attach_blob(db, task, blob, "spec.txt", "text/plain")
+        db.commit()
+        url = f"/tasks/{task.id}/attachment/{blob.digest}"
+        owner_client, stranger_client = client_for(owner), client_for(stranger)
+    finally:
+        db.close()
+
+    assert stranger_client.get(url).status_code == 403
+
+    response = owner_client.get(url)
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["etag"] == f'"{blob.digest}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    partial = owner_client.get(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == data[10:20]
+
+    cached = owner_client.get(url, headers={"If-None-Match": f'"{blob.digest}"'})
+    assert cached.status_code == 304
+
+def test_oversized_form_bodies_are_rejected():
+    """Test chunked uploads over the limit get 413 and long text fields 400"""
+    limited = TestClient(storage.UploadSizeLimitMiddleware(app, max_upload_size=1024, form_overhead=1024))
+    boundary = "limit-test"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nBig\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"attachment\"; filename=\"big.bin\"\r\n\r\n"
+            ).encode() + b"x" * 4096 + f"\r\n--{boundary}--\r\n".encode()
+
+    def chunked():
+        for start in range(0, len(body), 512):
+            yield body[start:start + 512]
+
+    response = limited.post("/tasks/new", content=chunked(),
+                            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+
+    long_field = client.post("/tasks/new", data={"title": "t", "description": "x" * (storage.UPLOAD_FORM_OVERHEAD + 1)},
+                             files={"attachment": ("", b"")})
+    assert long_field.status_code == 400
+
+def test_status_change_notifies_shared_users():
+    """Test editing a shared task's status notifies everyone it is shared with"""
+    db = SessionLocal()
+    try:
+        owner = create_user(db, "Owner")
+        watcher = create_user(db, "Watcher")
+        task = crud.create_task(db, schemas.TaskCreate(title="Shared task"))
+        task.owner_id = owner.id
+        task.shared_with.append(watcher)
+        db.commit()
+        task_id, watcher_id = task.id, watcher.id
+        owner_client = client_for(owner)
+    finally:
+        db.close()
+
+    response = owner_client.post(
+        f"/tasks/{task_id}/edit",
+        # A client-supplied previous status is not trusted
+        data={"title": "Shared task", "status": "Completed", "previous_status": "Completed"},
+        follow_redirects=False
+    )
+    assert response.status_code == 303
+
+    db = SessionLocal()
+    try:
+        messages = [n.message for n in notifications.get_unread_notifications(db, watcher_id)]
+    finally:
+        db.close()
+    assert messages == ["Task 'Shared task' status changed from 'Pending' to 'Completed' by Owner"]
+
+def test_edit_is_one_update_statement():
+    """Test a form edit costs the user lookup, the old status read and one UPDATE ... RETURNING"""
+    from benchmarks.micro import capture_statements
+    from database import engine
+
+    db = SessionLocal()
+    try:
+        owner = create_user(db, "Owner")
+        stranger = create_user(db, "Stranger")
+        task = crud.create_task(db, schemas.TaskCreate(title="Draft"))
+        task.owner_id = owner.id
+        db.commit()
+        task_id = task.id
+        owner_client, stranger_client = client_for(owner), client_for(stranger)
+    finally:
+        db.close()
+
+    form = {"title": "Final", "status": "Pending"}
+    responses = []
+    statements = capture_statements(engine, lambda: responses.append(
+        owner_client.post(f"/tasks/{task_id}/edit", data=form, follow_redirects=False)
+    ))
+    assert responses[0].status_code == 303
+    sql = [statement.split()[0] for statement, _ in statements]
+    assert sql == ["SELECT", "SELECT", "UPDATE"]
+    assert "owner_id" in statements[2][0]
+
+    assert stranger_client.post(f"/tasks/{task_id}/edit", data=form, follow_redirects=False).status_code == 403
+    assert owner_client.post("/tasks/0/edit", data=form, follow_redirects=False).status_code == 404
+    db = SessionLocal()
+    try:
+        assert db.get(models.Task, task_id).title == "Final"
+    finally:
+        db.close()
+
+def test_shared_lists_use_read_models():
+    """Test the shared task lists return plain records the templates can render"""
+    from main import templates
+    from read_models import UserRef
+
+    db = SessionLocal()
+    try:
+        owner = create_user(db, "Owner")
+        watcher = create_user(db, "Watcher")
+        task = crud.create_task(db, schemas.TaskCreate(title="Shared list task"))
+        task.owner_id = owner.id
+        task.shared_with.append(watcher)
+        db.commit()
+
+        shared_with_me = crud.get_tasks_shared_with(db, watcher.id)
+        shared_by_me = crud.get_tasks_shared_by(db, owner.id)
+        assert [(row.title, row.owner) for row in shared_with_me] == [("Shared list task", UserRef("Owner", owner.email))]
+        assert [(row.title, row.shared_with) for row in shared_by_me] == [("Shared list task", (UserRef("Watcher", watcher.email),))]
+        assert not hasattr(shared_by_me[0], "__dict__")
+        assert crud.get_user_tasks(db, owner.id)[0].title == "Shared list task"
+
+        page = templates.get_template("shared_tasks.html")
+        assert owner.email in page.render(tasks=shared_with_me, view="with-me", current_user=watcher, page_title="")
+        assert "Watcher" in page.render(tasks=shared_by_me, view="by-me", current_user=owner, page_title="")
+    finally:
+        db.close()
+
+def test_hashed_assets_are_immutable():
+    """Test content-hashed static URLs are cached for good and the rest revalidate"""
+    import assets
+
+    url = assets.asset_url("js/offline.js")
+    assert url != "/static/js/offline.js"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == assets.IMMUTABLE
+    assert client.get("/static/js/offline.js").headers["cache-control"] == "no-cache"
+    assert client.get("/static/js/offline.000000000000.js").headers["cache-control"] == "no-cache"
+
+    worker = client.get("/sw.js")
+    assert worker.headers["cache-control"] == "no-cache"
+    assert assets.version() in worker.text
+    assert url in worker.text
+    assert "__PRECACHE_URLS__" not in worker.text
+
+def test_hashed_asset_paths_stay_in_the_static_directory(monkeypatch, tmp_path):
+    """Test a hashed-looking path outside the static directory is never read"""
+    import assets
+    from starlette.exceptions import HTTPException
+
+    (tmp_path / "secret.txt").write_text("secret")
+    static = tmp_path / "static"
+    static.mkdir()
+    hashed = []
+    monkeypatch.setattr(assets, "file_hash", lambda *args: hashed.append(args[0]) or "0" * assets.HASH_LENGTH)
+    files = assets.HashedStaticFiles(directory=str(static))
+    scope = {"type": "http", "method": "GET", "headers": []}
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(files.get_response("../secret.000000000000.txt", scope))
+    assert error.value.status_code == 404
+    assert hashed == []
+
+# Runs the served service worker in node with an in-memory Cache API and a
+# fake server whose pages show who is logged in
+SW_HARNESS = r"""
+const source = require('fs').readFileSync(process.argv[2], 'utf8');
+const stores = new Map();
+const listeners = {};
+let user = 'alice';
+let online = true;
+function openStore(name) {
+  if (!stores.has(name)) {
+    const entries = new Map();
+    stores.set(name, {
+      match: async request => entries.has(request.url) ? entries.get(request.url).clone() : undefined,
+      put: async (request, response) => { entries.set(request.url, response); },
+      addAll: async () => undefined
+    });
+  }
+  return stores.get(name);
+}
+const sandbox = {
+  self: {location: {origin: 'http://app'}, addEventListener: (type, fn) => { listeners[type] = fn; }, registration: {}},
+  caches: {open: async name => openStore(name), delete: async name => stores.delete(name),
+           keys: async () => [...stores.keys()], match: async () => undefined},
+  fetch: async request => {
+    if (!online) throw new TypeError('offline');
+    const path = new URL(request.url).pathname;
+    if (path === '/logout') user = null;
+    if (path === '/login') user = 'bob';
+    return new Response(`tasks of ${user}`);
+  },
+  Response, URL, console
+};
+require('vm').runInNewContext(source, sandbox);
+async function send(path, method, mode, headers = {}) {
+  const request = {url: 'http://app' + path, method, mode, headers: new Headers(headers)};
+  let response;
+  listeners.fetch({request, respondWith: promise => { response = promise; }, waitUntil: () => undefined});
+  // Requests the worker leaves alone go straight to the network
+  return await (response || sandbox.fetch(request));
+}
+async function visit(path, method = 'GET') {
+  const result = await send(path, method, method === 'GET' ? 'navigate' : 'cors');
+  return result.status === 200 ? await result.text() : result.status;
+}
+(async () => {
+  const seen = [await visit('/')];
+  await visit('/tasks/1/delete');
+  online = false;
+  seen.push(await visit('/'));
+  online = true;
+  seen.push(await visit('/'));
+  await visit('/logout');
+  await visit('/login', 'POST');
+  online = false;
+  seen.push(await visit('/'));
+  online = true;
+  seen.push(await visit('/'));
+  // Not queued, so the new task form must say it was not saved
+  online = false;
+  const created = await send('/tasks/new', 'POST', 'navigate', {'Content-Type': 'multipart/form-data; boundary=x'});
+  seen.push(created.status, (await created.text()).includes('not saved'));
+  console.log(JSON.stringify(seen));
+})();
+"""
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_service_worker_forgets_pages_on_logout_and_delete(tmp_path):
+    """Test logging out and in as someone else never shows the first user's pages,
+    and an offline new task form says it was not saved"""
+    worker = tmp_path / "sw.js"
+    worker.write_text(client.get("/sw.js").text)
+    harness = tmp_path / "harness.js"
+    harness.write_text(SW_HARNESS)
+
+    result = subprocess.run(["node", str(harness), str(worker)], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    # Offline after the delete link and after switching user: no cached page to show
+    assert json.loads(result.stdout) == ["tasks of alice", 503, "tasks of alice", 503, "tasks of bob", 503, True]
+
+def test_task_batch_api():
+    """Test queued offline writes are applied in order, to the user's own tasks only"""
+    db = SessionLocal()
+    try:
+        owner, stranger = create_user(db, "Batch owner"), create_user(db, "Batch stranger")
+        existing = crud.create_task(db, schemas.TaskCreate(title="Batch existing"))
+        foreign = crud.create_task(db, schemas.TaskCreate(title="Batch foreign"))
+        existing.owner_id, foreign.owner_id = owner.id, stranger.id
+        db.commit()
+        owner_id, existing_id, foreign_id = owner.id, existing.id, foreign.id
+        owner_client = client_for(owner)
+    finally:
+        db.close()
+
+    operations = [
+        {"op": "create", "task": {"title": "Batch created"}},
+        {"op": "update", "task_id": existing_id, "task": {"status": "Completed"}},
+        {"op": "delete", "task_id": existing_id},
+        {"op": "delete", "task_id": 0},
+        {"op": "update", "task_id": foreign_id, "task": {"title": "Taken over"}},
+        {"op": "delete", "task_id": foreign_id},
+    ]
+    assert client.post("/api/tasks/batch", json={"operations": operations}).status_code == 401
+    response = owner_client.post("/api/tasks/batch", json={"operations": operations})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [(result["op"], result["status"]) for result in results] == [
+        ("create", "ok"), ("update", "ok"), ("delete", "ok"), ("delete", "not_found"),
+        ("update", "not_found"), ("delete", "not_found"),
+    ]
+    created = client.get(f"/api/tasks/{results[0]['task_id']}").json()
+    assert created["title"] == "Batch created"
+    assert client.get(f"/api/tasks/{existing_id}").status_code == 404
+    assert client.get(f"/api/tasks/{foreign_id}").json()["title"] == "Batch foreign"
+    db = SessionLocal()
+    try:
+        assert db.get(models.Task, results[0]["task_id"]).owner_id == owner_id
+    finally:
+        db.close()
+    assert owner_client.post("/api/tasks/batch", json={"operations": [{"op": "update"}]}).status_code == 422
+
+def test_share_tasks_in_bulk():
+    """Test sharing tasks with many users costs a fixed number of statements"""
+    from benchmarks.micro import capture_statements
+    from database import engine
+
+    db = SessionLocal()
+    try:
+        owner = create_user(db, "Owner")
+        watchers = [create_user(db, f"Watcher {i}") for i in range(3)]
+        tasks = [crud.create_task(db, schemas.TaskCreate(title=f"Team task {i}")) for i in range(2)]
+        for task in tasks:
+            task.owner_id = owner.id
+        tasks[0].shared_with.append(watchers[0])
+        other = crud.create_task(db, schemas.TaskCreate(title="Not mine"))
+        db.commit()
+        task_ids = [task.id for task in tasks]
+        watcher_ids = [watcher.id for watcher in watchers]
+        emails = [watcher.email for watcher in watchers] + ["nobody@example.com", owner.email]
+        other_id = other.id
+        owner_client = client_for(owner)
+    finally:
+        db.close()
+
+    responses = []
+    statements = capture_statements(engine, lambda: responses.append(owner_client.post(
+        "/api/tasks/share", json={"task_ids": task_ids + [other_id], "emails": emails}
+    )))
+    assert responses[0].status_code == 200
+    result = responses[0].json()
+    new_pairs = {(task_id, user_id) for task_id in task_ids for user_id in watcher_ids} - {(task_ids[0], watcher_ids[0])}
+    assert {(pair["task_id"], pair["user_id"]) for pair in result["shared"]} == new_pairs
+    assert result["already_shared"] == [{"task_id": task_ids[0], "user_id": watcher_ids[0]}]
+    assert result["unknown_emails"] == ["nobody@example.com"]
+    assert result["not_owned"] == [other_id]
+
+    inserts = [statement for statement, _ in statements if statement.startswith("INSERT")]
+    assert len([statement for statement in inserts if "task_shares" in statement]) == 1
+    assert len([statement for statement in inserts if "INTO notifications" in statement]) == 1
+
+    db = SessionLocal()
+    try:
+        for user_id, expected in zip(watcher_ids, (1, 2, 2)):
+            messages = [n.message for n in notifications.get_unread_notifications(db, user_id)]
+            assert len(messages) == expected
+            assert notifications.get_unread_count(db, user_id) == expected
+        assert "Team task 1' was shared with you by Owner" in messages[0]
+        assert set(crud.get_shared_user_ids(db, task_ids[1])) == set(watcher_ids)
+    finally:
+        db.close()
+
+    # Sharing again adds nothing
+    again = owner_client.post("/api/tasks/share", json={"task_ids": task_ids, "emails": emails}).json()
+    assert again["shared"] == [] and len(again["already_shared"]) == 6
+    assert client.post("/api/tasks/share", json={"task_ids": task_ids, "emails": emails}).status_code == 401
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_share_added_concurrently_is_not_notified_twice(monkeypatch, returning):
+    """Test a pair shared by another request after the pre-read counts as already shared"""
+    from database import engine
+
+    db = SessionLocal()
+    try:
+        owner, raced, fresh = create_user(db, "Owner"), create_user(db, "Raced"), create_user(db, "Fresh")
+        task = crud.create_task(db, schemas.TaskCreate(title="Raced task"))
+        task.owner_id = owner.id
+        db.commit()
+        task_id, raced_id, fresh_id = task.id, raced.id, fresh.id
+        emails = [raced.email, fresh.email]
+        owner_client = client_for(owner)
+    finally:
+        db.close()
+
+    add_shares = crud._add_shares
+
+    def concurrent_share_first(db, pairs):
+        other = SessionLocal()
+        try:
+            other.execute(models.task_shares.insert().values(task_id=task_id, user_id=raced_id))
+            other.commit()
+        finally:
+            other.close()
+        supported = engine.dialect.insert_executemany_returning
+        engine.dialect.insert_executemany_returning = returning
+        try:
+            return add_shares(db, pairs)
+        finally:
+            engine.dialect.insert_executemany_returning = supported
+
+    monkeypatch.setattr(crud, "_add_shares", concurrent_share_first)
+    result = owner_client.post("/api/tasks/share", json={"task_ids": [task_id], "emails": emails}).json()
+    assert result["shared"] == [{"task_id": task_id, "user_id": fresh_id}]
+    assert result["already_shared"] == [{"task_id": task_id, "user_id": raced_id}]
+
+    db = SessionLocal()
+    try:
+        assert notifications.get_unread_count(db, raced_id) == 0
+        assert notifications.get_unread_count(db, fresh_id) == 1
+    finally:
+        db.close()
+
+def test_shutdown_waits_for_running_compaction(monkeypatch):
+    """Test stopping the app lets a running compaction transaction finish"""
+    import main
+    import maintenance
+    import threading
+    import time
+
+    started, finished = threading.Event(), []
+
+    def slow_compaction(db, **kwargs):
+        started.set()
+        time.sleep(0.3)
+        finished.append(True)
+        return {}
+
+    monkeypatch.setattr(main, "DB_AUTO_MIGRATE", False)
+    monkeypatch.setattr(maintenance, "NOTIFICATION_COMPACTION_INTERVAL", 0.01)
+    monkeypatch.setattr(maintenance, "compact_notifications", slow_compaction)
+    # The rest of shutdown (flushing group commits) must come after it
+    shutdown_saw = []
+    monkeypatch.setattr(main.group_commit, "shutdown", lambda: shutdown_saw.append(list(finished)))
+    with TestClient(app):
+        assert started.wait(5)
+    assert shutdown_saw == [[True]]
+
 if __name__ == "__main__":
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])
@@ -0,0 +1,144 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import Base
+import models
+import notifications
+import pytest
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database for each test"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user(db):
+    user = models.User(name="Alice", email="alice@example.com", password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+def test_unread_counter_tracks_create_and_mark_read(db, user):
+    """Test the cached unread counter follows writes"""
+    first = notifications.create_notification(db, user.id, "one")
+    notifications.create_notification(db, user.id, "two")
+    assert notifications.get_unread_count(db, user.id) == 2
+
+    notifications.mark_notification_read(db, first.id, user.id)
+    assert notifications.get_unread_count(db, user.id) == 1
+
+    # Marking the same notification again must not decrement twice
+    notifications.mark_notification_read(db, first.id, user.id)
+    assert notifications.get_unread_count(db, user.id) == 1
+
+def test_unread_counter_backfills_for_existing_rows(db, user):
+    """Test users with notifications but no counter row get one seeded"""
+    db.add_all([models.Notification(user_id=user.id, message=str(i), read=False) for i in range(3)])
+    db.commit()
+    assert notifications.get_unread_count(db, user.id) == 3
+    assert db.get(models.NotificationCounter, user.id).unread_count == 3
+
+def test_unread_counter_seeding_survives_a_concurrent_insert(db, user, monkeypatch):
+    """Test a counter another transaction inserts while this one seeds gets the delta added"""
+    count_unread = notifications._count_unread
+
+    def count_while_someone_seeds(session, user_id):
+        # Lands between this transaction's UPDATE (no row) and its INSERT
+        session.execute(models.NotificationCounter.__table__.insert().values(user_id=user_id, unread_count=5))
+        return count_unread(session, user_id)
+
+    monkeypatch.setattr(notifications, "_count_unread", count_while_someone_seeds)
+    notifications.create_notification(db, user.id, "raced")
+    assert db.get(models.NotificationCounter, user.id).unread_count == 6
+
+def test_bulk_counter_seeding_survives_a_concurrent_insert(db, user, monkeypatch):
+    """Test create_notifications adds its delta to counters seeded concurrently"""
+    other = models.User(name="Bob", email="bob@example.com", password="x")
+    db.add(other)
+    db.commit()
+    insert_counters = notifications._insert_unread_counters
+
+    def insert_after_someone_else(session, unread, on_conflict=None):
+        if user.id in unread:
+            session.execute(models.NotificationCounter.__table__.insert().values(user_id=user.id, unread_count=5))
+        insert_counters(session, unread, on_conflict)
+
+    monkeypatch.setattr(notifications, "_insert_unread_counters", insert_after_someone_else)
+    notifications.create_notifications(db, [(user.id, "one"), (user.id, "two"), (other.id, "three")])
+    assert db.get(models.NotificationCounter, user.id).unread_count == 7
+    assert db.get(models.NotificationCounter, other.id).unread_count == 1
+
+def test_notifications_keyset_pagination(db, user):
+    """Test pages are newest-first and the cursor walks to the end"""
+    for i in range(5):
+        notifications.create_notification(db, user.id, f"message {i}")
+
+    page, cursor = notifications.get_notifications_page(db, user.id, limit=2)
+    assert [n.message for n in page] == ["message 4", "message 3"]
+    page, cursor = notifications.get_notifications_page(db, user.id, before_id=cursor, limit=2)
+    assert [n.message for n in page] == ["message 2", "message 1"]
+    page, cursor = notifications.get_notifications_page(db, user.id, before_id=cursor, limit=2)
+    assert [n.message for n in page] == ["message 0"]
+    assert cursor is None
+
+def test_mark_all_notifications_read(db, user):
+    """Test bulk mark-all-read updates rows and resets the counter"""
+    for i in range(4):
+        notifications.create_notification(db, user.id, f"message {i}")
+    assert notifications.mark_all_notifications_read(db, user.id) == 4
+    assert notifications.get_unread_count(db, user.id) == 0
+    assert not notifications.get_unread_notifications(db, user.id)
+
+def test_compaction_keeps_unread_and_newest_read(db, user):
+    """Test retention deletes only old or excess read notifications"""
+    import maintenance
+    from datetime import datetime, timedelta
+
+    old = datetime.now() - timedelta(days=200)
+    db.add_all([models.Notification(user_id=user.id, message="old", read=True, created_at=old) for _ in range(3)])
+    db.add(models.Notification(user_id=user.id, message="old unread", read=False, created_at=old))
+    db.add_all([models.Notification(user_id=user.id, message=f"read {i}", read=True) for i in range(5)])
+    db.commit()
+
+    report = maintenance.compact_notifications(db, max_age_days=90, max_read_per_user=2, batch_size=2)
+    assert report["expired_deleted"] == 3
+    assert report["excess_deleted"] == 3
+    assert report["rows_reclaimed"] == 6
+
+    remaining = db.query(models.Notification).order_by(models.Notification.id).all()
+    assert [n.message for n in remaining] == ["old unread", "read 3", "read 4"]
+
+def test_retention_cutoff_is_utc(db, user, monkeypatch):
+    """Test the retention window is measured in UTC, like created_at"""
+    import maintenance
+    import time
+    from datetime import datetime, timedelta
+
+    # A host far ahead of UTC must not expire a day-old notification early
+    monkeypatch.setenv("TZ", "Etc/GMT-14")
+    time.tzset()
+    try:
+        recent = datetime.utcnow() - timedelta(hours=23)
+        db.add(models.Notification(user_id=user.id, message="recent", read=True, created_at=recent))
+        db.commit()
+        assert maintenance.delete_expired_notifications(db, max_age_days=1) == 0
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert db.query(models.Notification).count() == 1
+
+def test_notifications_since_returns_missed_in_order(db, user):
+    """Test the reconnect replay query returns only newer notifications"""
+    created = [notifications.create_notification(db, user.id, f"message {i}") for i in range(4)]
+    missed = notifications.get_notifications_since(db, user.id, created[1].id)
+    assert [n.message for n in missed] == ["message 2", "message 3"]
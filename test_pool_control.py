@@ -0,0 +1,101 @@
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from pool_control import PoolExhausted, PoolGate, route_priority
+import threading
+import time
+import pytest
+
+def test_route_priority():
+    """Test auth and writes outrank reads, and analytics ranks lowest"""
+    assert route_priority("POST", "/login") == "high"
+    assert route_priority("GET", "/login") == "high"
+    assert route_priority("PUT", "/api/tasks/1") == "high"
+    assert route_priority("GET", "/api/tasks") == "normal"
+    assert route_priority("GET", "/analytics/dashboard") == "low"
+
+def test_low_priority_shed_before_high():
+    """Test a nearly full pool rejects analytics but still admits logins"""
+    gate = PoolGate(4, reserved=1, budgets={"high": 0.05, "normal": 0.05, "low": 0.05})
+    gate.acquire("normal")
+    gate.acquire("normal")
+    with pytest.raises(PoolExhausted):
+        gate.acquire("low")
+    gate.acquire("normal")
+    with pytest.raises(PoolExhausted):
+        gate.acquire("normal")
+    gate.acquire("high")
+    assert gate.stats() == {"capacity": 4, "in_use": 4, "rejections": {"high": 0, "normal": 1, "low": 1}}
+
+def test_waiter_admitted_when_slot_frees():
+    """Test a request waits within its budget and records the wait"""
+    gate = PoolGate(1, reserved=0, budgets={"normal": 2})
+    gate.acquire("normal")
+    threading.Timer(0.05, gate.release).start()
+    started = time.monotonic()
+    with gate.slot("normal"):
+        assert time.monotonic() - started >= 0.04
+    assert gate.in_use == 0
+    assert gate.wait_seconds["normal"].count == 2
+
+def test_adaptive_gate_grows_under_waits():
+    """Test the adaptive gate raises its limit while requests keep waiting"""
+    gate = PoolGate(16, reserved=0, budgets={"high": 0.01}, adaptive=True, min_capacity=4, adapt_interval=0)
+    assert gate.capacity == 4
+    for _ in range(4):
+        gate.acquire("high")
+    with pytest.raises(PoolExhausted):
+        gate.acquire("high")
+    assert gate.capacity == 5
+    gate.acquire("high")
+
+def test_exhausted_pool_returns_503():
+    """Test requests over budget get 503 with Retry-After instead of hanging"""
+    import main
+
+    gate = PoolGate(1, reserved=0, budgets={"normal": 0.01})
+    app = FastAPI()
+    app.add_exception_handler(PoolExhausted, main.database_busy)
+
+    def slot():
+        with gate.slot("normal"):
+            yield
+
+    @app.get("/", dependencies=[Depends(slot)])
+    def index():
+        return {}
+
+    client = TestClient(app)
+    assert client.get("/").status_code == 200
+    gate.acquire("normal")
+    response = client.get("/")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_sessions_outside_requests_take_a_slot(monkeypatch):
+    """Test WebSocket, notification and replica sessions wait for the gate too"""
+    from starlette.requests import Request
+    import database
+    import dependencies
+    import notifications
+    import pool_control
+
+    full = PoolGate(1, reserved=0, budgets={"high": 0.01, "normal": 0.01})
+    full.acquire("high")
+    monkeypatch.setattr(pool_control, "gate", full)
+    with pytest.raises(PoolExhausted):
+        notifications._create_notifications_in_own_session([])
+
+    free = PoolGate(2, reserved=0)
+    monkeypatch.setattr(pool_control, "gate", free)
+    with pool_control.session() as db:
+        assert free.in_use == 1
+        assert db.bind is database.engine
+    assert free.in_use == 0
+
+    # Reads on a healthy replica go through the replica gate
+    monkeypatch.setattr(database, "replica_router", database.ReplicaRouter(database.engine, [database.engine]))
+    monkeypatch.setattr(pool_control, "replica_gate", full)
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    with pytest.raises(PoolExhausted):
+        next(dependencies.get_read_db(request))
+    assert free.in_use == 0
@@ -0,0 +1,129 @@
+"""
+Query-plan regression tests for the hot queries.
+
+Every statement a hot function issues is captured and explained (EXPLAIN
+QUERY PLAN on SQLite, EXPLAIN on PostgreSQL) against a generated dataset with
+planner statistics, and the plan must use the expected index instead of a
+full scan or an extra sort. Set TEST_DATABASE_URL to an empty PostgreSQL
+database to check PostgreSQL plans as well.
+"""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from benchmarks import datagen
+from benchmarks.micro import capture_statements
+import os
+import re
+import crud
+import models
+import notifications
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    """Generated dataset shared by all plan tests"""
+    url = TEST_DATABASE_URL or f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}"
+    engine = create_engine(url)
+    engine.seeded = datagen.generate(engine, users=200, tasks=5000, notifications=5000, share_rate=0.2)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user_id(engine):
+    return engine.seeded["first_user_id"]
+
+def explain(engine, statement: str, parameters) -> str:
+    """Query plan of one statement"""
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            # Tiny test tables make sequential scans cheapest; we only want to
+            # know that an index path exists
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            return "\n".join(row[0] for row in conn.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+        return "\n".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+
+def plans_of(engine, func) -> list:
+    """Plans of all statements func issues"""
+    statements = capture_statements(engine, func)
+    assert statements, "function issued no SQL"
+    return [(" ".join(sql.split()), explain(engine, sql, parameters)) for sql, parameters in statements]
+
+def assert_plan(plan: str, sql: str, uses=(), no_scan=(), no_sort=False):
+    context = f"\nSQL: {sql}\nPlan:\n{plan}"
+    for index in uses:
+        assert index in plan, f"expected index {index} to be used{context}"
+    for table in no_scan:
+        full_scan = rf"Seq Scan on {table}\b" if "Scan" in plan else rf"^SCAN {table}\b"
+        assert not re.search(full_scan, plan, re.MULTILINE), f"full scan of {table}{context}"
+    if no_sort:
+        assert "TEMP B-TREE" not in plan and not re.search(r"\bSort\b", plan), f"extra sort step{context}"
+
+def test_user_task_list_uses_owner_index(engine, db, user_id):
+    """Test the task list (read_root) looks tasks up by owner"""
+    for q, status in ((None, None), ("report", None), (None, "Pending")):
+        for sql, plan in plans_of(engine, lambda: crud.get_user_tasks(db, user_id, q, status)):
+            assert_plan(plan, sql, uses=["ix_tasks_owner_id"], no_scan=["tasks"])
+
+def test_recent_tasks_use_owner_index_without_sort(engine, db, user_id):
+    """Test the analytics page's recent tasks come in index order"""
+    for sql, plan in plans_of(engine, lambda: crud.get_recent_tasks(db, user_id)):
+        assert_plan(plan, sql, uses=["ix_tasks_owner_id"], no_scan=["tasks"], no_sort=True)
+
+def test_tasks_shared_by_user_avoid_full_scans(engine, db, user_id):
+    """Test the shared_with.any() subquery probes task_shares by key"""
+    for sql, plan in plans_of(engine, lambda: crud.get_tasks_shared_by(db, user_id)):
+        assert_plan(plan, sql, uses=["ix_tasks_owner_id"], no_scan=["tasks", "task_shares", "users"])
+
+def test_tasks_shared_with_user_use_share_index(engine, db, user_id):
+    """Test "shared with me" looks shares up by user"""
+    user = db.get(models.User, user_id)
+
+    def load_shared_tasks():
+        db.expire(user, ["shared_tasks"])
+        return list(user.shared_tasks)
+
+    for func in (load_shared_tasks, lambda: crud.get_tasks_shared_with(db, user_id)):
+        for sql, plan in plans_of(engine, func):
+            assert_plan(plan, sql, uses=["ix_task_shares_user_id"], no_scan=["tasks", "task_shares"])
+
+def test_share_check_uses_primary_key(engine, db, user_id):
+    """Test the attachment download access check is a key lookup"""
+    for sql, plan in plans_of(engine, lambda: crud.is_task_shared_with(db, 1, user_id)):
+        assert_plan(plan, sql, no_scan=["task_shares"])
+
+def test_analytics_queries_use_owner_index(engine, db, user_id):
+    """Test per-user analytics never scan the whole tasks table"""
+    for func in (crud.get_analytics_overview, crud.get_weekly_trends,
+                 crud.get_monthly_stats, crud.get_user_productivity):
+        for sql, plan in plans_of(engine, lambda: func(db, user_id)):
+            assert_plan(plan, sql, no_scan=["tasks", "users"])
+
+def test_notification_queries_use_user_index_without_sort(engine, db, user_id):
+    """Test notification pages and replays walk (user_id, id) in order"""
+    page, next_before = notifications.get_notifications_page(db, user_id, limit=5)
+    assert next_before is not None
+    for func in (
+        lambda: notifications.get_notifications_page(db, user_id),
+        lambda: notifications.get_notifications_page(db, user_id, before_id=next_before),
+        lambda: notifications.get_notifications_since(db, user_id, page[-1].id),
+        lambda: notifications.get_unread_notifications(db, user_id),
+    ):
+        for sql, plan in plans_of(engine, func):
+            assert_plan(plan, sql, uses=["ix_notifications_user_id_id"], no_scan=["notifications"], no_sort=True)
+
+def test_unread_count_queries_use_user_index(engine, db, user_id):
+    """Test counting and bulk-marking unread notifications stay on the user's rows"""
+    for sql, plan in plans_of(engine, lambda: notifications._count_unread(db, user_id)):
+        assert_plan(plan, sql, uses=["ix_notifications_user_id_id"], no_scan=["notifications"])
+    for sql, plan in plans_of(engine, lambda: notifications.mark_all_notifications_read(db, user_id + 1)):
+        if sql.startswith("UPDATE notifications"):
+            assert_plan(plan, sql, uses=["ix_notifications_user_id_id"], no_scan=["notifications"])
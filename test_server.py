@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+import logging
+import maintenance
+import server
+
+def fake_master():
+    return SimpleNamespace(WORKERS={}, log=logging.getLogger("test"), timeout=30)
+
+def fork(master, pid):
+    worker = SimpleNamespace(pid=pid)
+    server.pre_fork(master, worker)
+    master.WORKERS[pid] = worker
+    return worker
+
+def test_one_worker_runs_background_jobs():
+    """Test exactly one worker is picked for background jobs, across deaths and reloads"""
+    master = fake_master()
+    workers = [fork(master, pid) for pid in (1, 2, 3)]
+    assert [worker.runs_background_jobs for worker in workers] == [True, False, False]
+
+    # The designated worker dies: its replacement takes over
+    del master.WORKERS[1]
+    assert fork(master, 4).runs_background_jobs
+
+    # SIGHUP forks the new workers before the old ones exit
+    server.on_reload(master)
+    replacements = [fork(master, pid) for pid in (5, 6, 7)]
+    assert [worker.runs_background_jobs for worker in replacements] == [True, False, False]
+
+def test_post_fork_resets_inherited_state(monkeypatch):
+    """Test forked workers drop the master's connections and only one keeps the maintenance job"""
+    import database
+
+    disposed = []
+    monkeypatch.setattr(database, "dispose_engines", lambda close=True: disposed.append(close))
+    monkeypatch.setattr(maintenance, "NOTIFICATION_COMPACTION_INTERVAL", 3600)
+    master = fake_master()
+    server.post_fork(master, SimpleNamespace(pid=1, runs_background_jobs=True))
+    assert disposed == [False]
+    assert maintenance.NOTIFICATION_COMPACTION_INTERVAL == 3600
+    server.post_fork(master, SimpleNamespace(pid=2, runs_background_jobs=False))
+    assert maintenance.NOTIFICATION_COMPACTION_INTERVAL == 0
+
+def test_defaults():
+    """Test one worker per core and the uvicorn fallback"""
+    assert server.default_workers() >= 1
+    assert server.choose_backend("uvicorn") == "uvicorn"
+    assert server.event_loop() in ("uvloop", "asyncio")
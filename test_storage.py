@@ -0,0 +1,248 @@
+from fastapi import UploadFile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import Base
+import asyncio
+import io
+import os
+import pytest
+import uuid
+import crud
+import models
+import schemas
+import storage
+
+def make_upload(data: bytes, filename: str = "spec.pdf") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename)
+
+class FakeS3Body:
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    def iter_chunks(self, chunk_size):
+        while chunk := self.stream.read(chunk_size):
+            yield chunk
+
+    def close(self):
+        pass
+
+class FakeS3Error(Exception):
+    def __init__(self, status):
+        self.response = {"ResponseMetadata": {"HTTPStatusCode": status}}
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the S3 API the driver uses"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append("put_object")
+        self.objects[(Bucket, Key)] = Body.read()
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append("upload_part")
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error(404)
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1 if end else None]
+        return {"Body": FakeS3Body(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_backend", storage.LocalStorage(tmp_path))
+    return tmp_path
+
+def blob_file(digest):
+    return storage.get_backend().local_path(storage.blob_key(digest))
+
+@pytest.fixture
+def db():
+    """Fresh in-memory database for each test"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+def test_store_upload_is_content_addressed(db, upload_dir):
+    """Test an upload is streamed to a file named by its digest and reused once referenced"""
+    data = os.urandom(storage.UPLOAD_CHUNK_SIZE * 2 + 10)
+    claim = lambda digest: crud.claim_blob(db, digest)
+    blob = asyncio.run(storage.store_upload(make_upload(data), claim=claim))
+    assert blob.size == len(data)
+    assert not blob.deduplicated
+    with open(blob_file(blob.digest), "rb") as f:
+        assert f.read() == data
+    crud.attach_blob(db, crud.create_task(db, schemas.TaskCreate(title="First")), blob, "spec.pdf")
+    db.commit()
+
+    again = asyncio.run(storage.store_upload(make_upload(data, "copy.pdf"), claim=claim))
+    assert again.digest == blob.digest
+    assert again.deduplicated
+    assert db.get(models.AttachmentBlob, blob.digest).ref_count == 2
+    assert os.listdir(upload_dir) == [blob.digest[:2]]
+
+def test_upload_racing_the_last_delete_stores_the_file_again(db, upload_dir):
+    """Test a blob collected between hashing and claiming is put again, not assumed present"""
+    claim = lambda digest: crud.claim_blob(db, digest)
+    blob = asyncio.run(storage.store_upload(make_upload(b"raced spec"), claim=claim))
+    task = crud.create_task(db, schemas.TaskCreate(title="Doomed"))
+    crud.attach_blob(db, task, blob, "spec.pdf")
+    db.commit()
+
+    def delete_then_claim(digest):
+        # The file still exists when hashing ends; the last task goes before the claim
+        crud.delete_task(db, task.id)
+        return claim(digest)
+
+    again = asyncio.run(storage.store_upload(make_upload(b"raced spec"), claim=delete_then_claim))
+    assert not again.deduplicated
+    crud.attach_blob(db, crud.create_task(db, schemas.TaskCreate(title="Survivor")), again, "spec.pdf")
+    db.commit()
+    assert db.get(models.AttachmentBlob, blob.digest).ref_count == 1
+    assert os.path.exists(blob_file(blob.digest))
+
+def blob_lifecycle_without_returning(db):
+    """Upload the same file for two tasks, then delete both"""
+    claim = lambda digest: crud.claim_blob(db, digest)
+    blob = asyncio.run(storage.store_upload(make_upload(b"old sqlite spec"), claim=claim))
+    first = crud.create_task(db, schemas.TaskCreate(title="First"))
+    crud.attach_blob(db, first, blob, "spec.pdf")
+    db.commit()
+    again = asyncio.run(storage.store_upload(make_upload(b"old sqlite spec"), claim=claim))
+    assert again.deduplicated
+    second = crud.create_task(db, schemas.TaskCreate(title="Second"))
+    crud.attach_blob(db, second, again, "spec.pdf")
+    db.commit()
+    assert db.get(models.AttachmentBlob, blob.digest).ref_count == 2
+
+    crud.delete_task(db, first.id)
+    assert os.path.exists(blob_file(blob.digest))
+    crud.delete_task(db, second.id)
+    assert db.get(models.AttachmentBlob, blob.digest) is None
+    assert not os.path.exists(blob_file(blob.digest))
+    assert not crud.claim_blob(db, blob.digest)
+
+def test_blob_references_without_returning(db, upload_dir, monkeypatch):
+    """Test claiming, releasing and collecting blobs where the database has no RETURNING"""
+    from benchmarks.micro import capture_statements
+
+    engine = db.get_bind()
+    monkeypatch.setattr(engine.dialect, "update_returning", False)
+    monkeypatch.setattr(engine.dialect, "delete_returning", False)
+    statements = capture_statements(engine, lambda: blob_lifecycle_without_returning(db))
+    assert not [statement for statement, _ in statements if "RETURNING" in statement]
+
+def test_store_upload_rejects_oversized_file(upload_dir):
+    """Test an oversized upload aborts and leaves no partial file behind"""
+    with pytest.raises(storage.UploadTooLarge):
+        asyncio.run(storage.store_upload(make_upload(b"x" * 2048), max_size=1024))
+    assert os.listdir(upload_dir) == []
+
+def test_upload_limit_stops_reading_chunked_body():
+    """Test a body without Content-Length is cut off with 413 once it passes the limit"""
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    limited = storage.UploadSizeLimitMiddleware(app, max_upload_size=1024, form_overhead=0)
+    chunks_read = 0
+
+    async def receive():
+        nonlocal chunks_read
+        chunks_read += 1
+        return {"type": "http.request", "body": b"x" * 256, "more_body": True}  # never ends
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload", "query_string": b"",
+             "headers": [(b"transfer-encoding", b"chunked")], "root_path": "", "scheme": "http",
+             "server": ("test", 80), "client": ("test", 1), "http_version": "1.1", "app": app}
+    asyncio.run(limited(scope, receive, send))
+    assert sent[0]["status"] == 413
+    assert chunks_read == 5
+
+def test_delete_task_garbage_collects_unreferenced_blob(db, upload_dir):
+    """Test blobs are shared between tasks and removed with the last reference"""
+    blob = asyncio.run(storage.store_upload(make_upload(b"same spec")))
+    first = crud.create_task(db, schemas.TaskCreate(title="First"))
+    second = crud.create_task(db, schemas.TaskCreate(title="Second"))
+    crud.attach_blob(db, first, blob, "spec.pdf")
+    crud.attach_blob(db, second, blob, "spec-copy.pdf")
+    db.commit()
+    assert db.get(models.AttachmentBlob, blob.digest).ref_count == 2
+
+    crud.delete_task(db, first.id)
+    assert db.get(models.AttachmentBlob, blob.digest).ref_count == 1
+    assert os.path.exists(blob_file(blob.digest))
+
+    crud.delete_task(db, second.id)
+    assert db.get(models.AttachmentBlob, blob.digest) is None
+    assert not os.path.exists(blob_file(blob.digest))
+
+
+def test_s3_backend_multipart_upload_and_ranged_reads():
+    """Test the S3 driver against an in-memory S3 stand-in"""
+    client = FakeS3Client()
+    backend = storage.S3Storage(bucket="tasks", prefix="att/", multipart_threshold=1024, part_size=512, client=client)
+    small = asyncio.run(storage.store_upload(make_upload(b"tiny"), backend))
+    data = os.urandom(1500)
+    large = asyncio.run(storage.store_upload(make_upload(data), backend))
+
+    assert client.calls.count("put_object") == 1
+    assert client.calls.count("upload_part") == 3
+    assert client.objects[("tasks", f"att/{storage.blob_key(large.digest)}")] == data
+    assert b"".join(backend.open_stream(storage.blob_key(large.digest), 100, 199)) == data[100:200]
+    # A claimed blob is not uploaded again
+    assert asyncio.run(storage.store_upload(make_upload(data), backend, claim=lambda digest: True)).deduplicated
+    assert client.calls.count("upload_part") == 3
+    assert "att/" in backend.presigned_url(storage.blob_key(small.digest), filename="spec.pdf")
+
+    storage.delete_blob(small.digest, backend)
+    assert not backend.exists(storage.blob_key(small.digest))